@@ -0,0 +1,72 @@
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+BATCH_FORMATS = ("dict", "arrow")
+
+
+def check_batch_format(batch_format):
+    """Validate a `BATCH_FORMAT` consumer option.
+
+    Parameters
+    ----------
+    batch_format: str
+        Either ``dict`` or ``arrow``. The ``arrow`` format requires pyarrow.
+    """
+    if batch_format not in BATCH_FORMATS:
+        raise ValueError(
+            f"Batch format must be one of {BATCH_FORMATS}, got {batch_format}"
+        )
+    if batch_format == "arrow" and pyarrow is None:
+        raise ImportError("BATCH_FORMAT arrow requires pyarrow to be installed")
+
+
+def is_record_batch(batch):
+    """Check if a consumed batch is a :class:`pyarrow.RecordBatch`."""
+    return pyarrow is not None and isinstance(batch, pyarrow.RecordBatch)
+
+
+def to_record_batch(records):
+    """Build a :class:`pyarrow.RecordBatch` from a list of decoded records.
+
+    Column types are inferred from the values, nested records become struct columns and
+    arrays become list columns.
+
+    Parameters
+    ----------
+    records: list
+        Decoded records with the same fields.
+
+    Returns
+    -------
+    :class:`pyarrow.RecordBatch`
+        Batch with a column for each field.
+    """
+    return pyarrow.RecordBatch.from_pylist(records)
+
+
+def numeric_columns(batch):
+    """Get the numeric columns of a batch as NumPy arrays sharing the Arrow buffers.
+
+    Only integer and floating point columns without nulls can be viewed without copying,
+    the rest of the columns are left out.
+
+    Parameters
+    ----------
+    batch: :class:`pyarrow.RecordBatch`
+        Consumed batch.
+
+    Returns
+    -------
+    dict
+        Read-only :class:`numpy.ndarray` views by column name.
+    """
+    columns = {}
+    for field, column in zip(batch.schema, batch.columns):
+        numeric = pyarrow.types.is_integer(field.type) or pyarrow.types.is_floating(
+            field.type
+        )
+        if numeric and column.null_count == 0:
+            columns[field.name] = column.to_numpy(zero_copy_only=True)
+    return columns
@@ -0,0 +1,422 @@
+from collections import OrderedDict
+from apf.core.schema_cache import parse_schema
+from apf.core.schema_registry import WIRE_HEADER, unpack_header
+from fastavro.read import HEADER_SCHEMA
+
+import fastavro
+import io
+import json
+import threading
+import time
+import zlib
+
+MAGIC = b"Obj\x01"
+SYNC_SIZE = 16
+SUPPORTED_CODECS = ("null", "deflate")
+
+_PARSED_HEADER_SCHEMA = fastavro.parse_schema(HEADER_SCHEMA)
+
+
+def read_long(buffer, position):
+    """Read a zig-zag encoded Avro long from a bytes-like buffer.
+
+    Parameters
+    ----------
+    buffer: bytes
+        Buffer containing the encoded value.
+    position: int
+        Offset of the first byte of the value.
+
+    Returns
+    -------
+    value, position
+        Decoded value and offset of the first byte after it.
+    """
+    shift = 0
+    accum = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        accum |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (accum >> 1) ^ -(accum & 1), position
+
+
+def _project(schema, tree, path):
+    if not tree:
+        return schema
+    if isinstance(schema, list):
+        nested = [
+            isinstance(branch, dict) and branch.get("type") in ("record", "array")
+            for branch in schema
+        ]
+        if not any(nested):
+            raise ValueError(f"Field {path} has no nested fields to select")
+        return [
+            _project(branch, tree, path) if is_nested else branch
+            for branch, is_nested in zip(schema, nested)
+        ]
+    if isinstance(schema, dict) and schema.get("type") == "array":
+        return dict(schema, items=_project(schema["items"], tree, path))
+    if isinstance(schema, dict) and schema.get("type") == "record":
+        names = [field["name"] for field in schema["fields"]]
+        missing = [name for name in tree if name not in names]
+        if missing:
+            raise ValueError(f"Fields {missing} not found in {path or 'the schema'}")
+        fields = [
+            dict(
+                field,
+                type=_project(
+                    field["type"], tree[field["name"]], f"{path}{field['name']}."
+                ),
+            )
+            for field in schema["fields"]
+            if field["name"] in tree
+        ]
+        return dict(schema, fields=fields)
+    raise ValueError(f"Field {path} has no nested fields to select")
+
+
+def project_schema(schema, fields):
+    """Build a reader schema that keeps only some fields of a record writer schema.
+
+    Parameters
+    ----------
+    schema: dict
+        Writer schema, not parsed.
+    fields: list
+        Names of the fields to keep. Fields of nested records (or arrays of records) are
+        selected with dots, i.e. ``candidate.ra``.
+
+    Returns
+    -------
+    dict
+        Reader schema with the same names as the writer schema.
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            node = node.setdefault(part, {})
+    return _project(schema, tree, "")
+
+
+class ContainerHeader:
+    """Parsed Avro object container header shared by every payload written with it.
+
+    Parameters
+    ----------
+    prefix: bytes
+        Header bytes without the sync marker, which is random for each container.
+    schema: dict
+        Parsed writer schema.
+    codec: str
+        Block compression codec.
+    reader_schema: dict | None
+        Parsed reader schema used to project the records.
+    """
+
+    def __init__(self, prefix, schema, codec, reader_schema=None):
+        self.prefix = prefix
+        self.schema = schema
+        self.codec = codec
+        self.reader_schema = reader_schema
+        self.size = len(prefix) + SYNC_SIZE
+        self.decoded = 0
+        self.skipped_ratio = 0.0
+        self.time_saved = 0.0
+
+
+class AvroContainerDecoder:
+    """Decode Avro object container payloads reusing the parsed writer schema.
+
+    A Kafka alert stream repeats the same container header (magic, codec and writer schema)
+    in every message, only the sync marker changes. The decoder fingerprints each payload by
+    comparing it against the header prefixes already seen, so the writer schema is parsed once
+    and records are read straight from the payload buffer.
+
+    Payloads with a codec other than ``null`` or ``deflate`` are read with :func:`fastavro.reader`.
+
+    Records can be projected with a reader schema, fields missing from it are skipped by the
+    Avro decoder without building Python objects. The bytes skipped and the decode time saved
+    are estimated by decoding a sample of the records with and without the projection.
+
+    The header cache and the stats are guarded by a lock, so a decoder can be shared by
+    threads. Pickled copies, sent to worker processes, get their own lock and counters.
+
+    Parameters
+    ----------
+    cache_size: int
+        Maximum number of different container headers kept in memory.
+    reader_schema: dict | None
+        Reader schema applied to every writer schema.
+    fields: list | None
+        Fields kept from each writer schema, see :func:`project_schema`. Ignored if
+        `reader_schema` is set.
+    sample_every: int
+        Records decoded between two estimations of the projection savings.
+    """
+
+    def __init__(
+        self, cache_size=8, reader_schema=None, fields=None, sample_every=1000
+    ):
+        self.cache_size = cache_size
+        self.headers = OrderedDict()
+        self.reader_schema = reader_schema
+        self.fields = fields
+        self.sample_every = sample_every
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @property
+    def projected(self):
+        return bool(self.reader_schema or self.fields)
+
+    def reset_stats(self):
+        """Reset the schema cache and projection counters."""
+        stats = {"schema_cache_hits": 0, "schema_cache_misses": 0}
+        if self.projected:
+            stats["projection_bytes_skipped"] = 0
+            stats["projection_time_saved"] = 0.0
+        with self.lock:
+            self.stats = stats
+
+    def _parse_header(self, payload):
+        bytes_io = io.BytesIO(payload)
+        header = fastavro.schemaless_reader(bytes_io, _PARSED_HEADER_SCHEMA)
+        end = bytes_io.tell()
+        codec = header["meta"].get("avro.codec", b"null").decode()
+        writer_schema = json.loads(header["meta"]["avro.schema"])
+        return ContainerHeader(
+            payload[: end - SYNC_SIZE],
+            parse_schema(writer_schema),
+            codec,
+            self._reader_schema(writer_schema),
+        )
+
+    def _reader_schema(self, writer_schema):
+        reader_schema = self.reader_schema
+        if reader_schema is None and self.fields:
+            reader_schema = project_schema(writer_schema, self.fields)
+        if reader_schema is not None:
+            reader_schema = parse_schema(reader_schema)
+        return reader_schema
+
+    def get_header(self, payload):
+        """Get the parsed header of a container payload, parsing it only if it wasn't seen before.
+
+        Parameters
+        ----------
+        payload: bytes
+            Avro object container.
+
+        Returns
+        -------
+        :class:`ContainerHeader`
+            Parsed container header.
+        """
+        with self.lock:
+            for prefix, header in self.headers.items():
+                if payload.startswith(prefix):
+                    self.stats["schema_cache_hits"] += 1
+                    self.headers.move_to_end(prefix, last=False)
+                    return header
+            if not payload.startswith(MAGIC):
+                raise ValueError("Payload is not an Avro object container")
+            self.stats["schema_cache_misses"] += 1
+            return self._cache_header(self._parse_header(payload))
+
+    def _cache_header(self, header):
+        self.headers[header.prefix] = header
+        self.headers.move_to_end(header.prefix, last=False)
+        if len(self.headers) > self.cache_size:
+            self.headers.popitem(last=True)
+        return header
+
+    def _iter_blocks(self, payload, header):
+        position = header.size
+        while position < len(payload):
+            count, position = read_long(payload, position)
+            size, position = read_long(payload, position)
+            yield count, position, size
+            position += size + SYNC_SIZE
+
+    def _calibrate(self, block, header):
+        position = block.tell()
+        start = time.perf_counter()
+        fastavro.schemaless_reader(block, header.schema)
+        full_time = time.perf_counter() - start
+        size = block.tell() - position
+        block.seek(position)
+        start = time.perf_counter()
+        record = fastavro.schemaless_reader(block, header.schema, header.reader_schema)
+        projected_time = time.perf_counter() - start
+        kept = io.BytesIO()
+        fastavro.schemaless_writer(kept, header.reader_schema, record)
+        header.skipped_ratio = max(0.0, 1 - kept.tell() / size) if size else 0.0
+        header.time_saved = max(0.0, full_time - projected_time)
+        return record
+
+    def _read_projected(self, block, header):
+        position = block.tell()
+        if header.decoded % self.sample_every == 0:
+            record = self._calibrate(block, header)
+        else:
+            record = fastavro.schemaless_reader(
+                block, header.schema, header.reader_schema
+            )
+        size = block.tell() - position
+        with self.lock:
+            header.decoded += 1
+            self.stats["projection_bytes_skipped"] += int(size * header.skipped_ratio)
+            self.stats["projection_time_saved"] += header.time_saved
+        return record
+
+    def _read_records(self, payload, header):
+        if header.codec not in SUPPORTED_CODECS:
+            yield from fastavro.reader(
+                io.BytesIO(payload), reader_schema=header.reader_schema
+            )
+            return
+        bytes_io = io.BytesIO(payload)
+        for count, position, size in self._iter_blocks(payload, header):
+            if header.codec == "deflate":
+                block = io.BytesIO(
+                    zlib.decompress(payload[position : position + size], -15)
+                )
+            else:
+                block = bytes_io
+                block.seek(position)
+            for _ in range(count):
+                yield self._read_record(block, header)
+
+    def _read_record(self, block, header):
+        if header.reader_schema is None:
+            return fastavro.schemaless_reader(block, header.schema)
+        return self._read_projected(block, header)
+
+    def iter_records(self, payload):
+        """Iterate over every record of a container payload.
+
+        Parameters
+        ----------
+        payload: bytes
+            Avro object container.
+
+        Yields
+        ------
+        dict
+            Decoded record.
+        """
+        yield from self._read_records(payload, self.get_header(payload))
+
+    def decode(self, payload):
+        """Decode the first record of a container payload.
+
+        Parameters
+        ----------
+        payload: bytes
+            Avro object container.
+
+        Returns
+        -------
+        dict | None
+            First record or None if the container is empty.
+        """
+        for record in self.iter_records(payload):
+            return record
+
+
+class WireFormatDecoder(AvroContainerDecoder):
+    """Decode schema registry wire format payloads keeping an LRU of parsed schemas.
+
+    Each payload is a magic byte and a schema id followed by a schemaless Avro record. The
+    writer schema of each id is fetched from the registry once and kept while it is among the
+    `cache_size` most recently used ones.
+
+    Parameters
+    ----------
+    registry: :class:`apf.core.schema_registry.GenericSchemaRegistry`
+        Registry client used to fetch the writer schemas.
+    cache_size: int
+        Maximum number of parsed schemas kept in memory.
+    reader_schema: dict | None
+        Reader schema applied to every writer schema.
+    fields: list | None
+        Fields kept from each writer schema, see :func:`project_schema`. Ignored if
+        `reader_schema` is set.
+    sample_every: int
+        Records decoded between two estimations of the projection savings.
+    """
+
+    def __init__(
+        self,
+        registry,
+        cache_size=8,
+        reader_schema=None,
+        fields=None,
+        sample_every=1000,
+    ):
+        super().__init__(cache_size, reader_schema, fields, sample_every)
+        self.registry = registry
+
+    def _parse_header(self, payload):
+        schema_id = unpack_header(payload)
+        writer_schema = self.registry.get_schema(schema_id)
+        return ContainerHeader(
+            bytes(payload[: WIRE_HEADER.size]),
+            parse_schema(writer_schema),
+            "null",
+            self._reader_schema(writer_schema),
+        )
+
+    def get_header(self, payload):
+        """Get the parsed schemas of a wire format payload, fetching them only on a cache miss.
+
+        Parameters
+        ----------
+        payload: bytes
+            Wire format payload.
+
+        Returns
+        -------
+        :class:`ContainerHeader`
+            Parsed schemas of the payload.
+        """
+        with self.lock:
+            header = self.headers.get(bytes(payload[: WIRE_HEADER.size]))
+            if header is not None:
+                self.stats["schema_cache_hits"] += 1
+                self.headers.move_to_end(header.prefix, last=False)
+                return header
+            self.stats["schema_cache_misses"] += 1
+            return self._cache_header(self._parse_header(payload))
+
+    def iter_records(self, payload):
+        """Iterate over the record of a wire format payload.
+
+        Parameters
+        ----------
+        payload: bytes
+            Wire format payload.
+
+        Yields
+        ------
+        dict
+            Decoded record.
+        """
+        header = self.get_header(payload)
+        block = io.BytesIO(payload)
+        block.seek(WIRE_HEADER.size)
+        yield self._read_record(block, header)
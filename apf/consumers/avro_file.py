@@ -1,8 +1,38 @@
+from apf.consumers.arrow import check_batch_format, to_record_batch
+from apf.consumers.file_discovery import (
+    discover_files,
+    file_shard,
+    in_shard,
+    scan_files,
+)
+from apf.consumers.file_watch import FileCheckpoint, InotifyWatcher, PollingWatcher
 from apf.consumers.generic import GenericConsumer
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import fastavro
+import fnmatch
+import mmap
 import os
-import glob
+
+RECENT_FILES = 100_000
+
+
+def map_file(path):
+    """Memory map a file for reading, asking the kernel to read it ahead.
+
+    Returns
+    -------
+    :class:`mmap.mmap` | None
+        Read-only map of the file, None if the file is empty.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+        mapped.madvise(mmap.MADV_WILLNEED)
+    return mapped
 
 
 class AVROFileConsumer(GenericConsumer):
@@ -21,15 +51,100 @@ class AVROFileConsumer(GenericConsumer):
     ----------
     DIRECTORY_PATH: path
         AVRO files Directory path location
+    BATCH_FORMAT: str
+        Either `"dict"` (default) or `"arrow"` to consume :class:`pyarrow.RecordBatch`
+        batches, see :class:`apf.consumers.KafkaConsumer`.
+    STREAMING: bool
+        Read every record of each file instead of only the first one (disabled by default).
+        Files are memory mapped and decoded as a stream, and batches of `NUM_MESSAGES`
+        records span file boundaries, only the last batch may be smaller.
+    READ_AHEAD: int
+        With `STREAMING`, map the next files on a background thread and ask the kernel to
+        read them ahead while the current one is decoded (default 0, disabled).
+    RECURSIVE: bool
+        Read the files of nested directories too, like ``YYYY/MM/DD`` archives (disabled
+        by default).
+    ORDERED: bool
+        Read the files sorted by name (enabled by default), which reads each whole
+        directory listing first. Disable it for huge flat directories to read the files in
+        the order the file system lists them, starting as soon as the first ones are found.
+    SHARD_INDEX: int
+        Shard of the files read by this consumer. Files are split by a hash of their path,
+        so replicas reading the same directory get disjoint shares without coordinating.
+        Defaults to the worker index of a :class:`apf.core.supervisor.StepSupervisor`.
+    SHARD_COUNT: int
+        Number of shards the directory is split in, the number of supervisor workers by
+        default.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "DIRECTORY_PATH": "path/to/night/archive",
+                "NUM_MESSAGES": 1000,
+                "STREAMING": True,
+                "READ_AHEAD": 4,
+                "RECURSIVE": True,
+                "SHARD_INDEX": 0,
+                "SHARD_COUNT": 4,
+            }
 
     """
 
     def __init__(self, config):
         super().__init__(config)
+        self.batch_format = self.config.get("BATCH_FORMAT", "dict")
+        check_batch_format(self.batch_format)
+        self.streaming = bool(self.config.get("STREAMING", False))
+        self.read_ahead = int(self.config.get("READ_AHEAD", 0))
+
+    def _iter_mapped(self, files):
+        if self.read_ahead <= 0:
+            for file in files:
+                yield file, map_file(file)
+            return
+        files = iter(files)
+        with ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="apf-read-ahead"
+        ) as executor:
+            pending = deque()
+            try:
+                for file in files:
+                    pending.append((file, executor.submit(map_file, file)))
+                    if len(pending) > self.read_ahead:
+                        file, mapped = pending.popleft()
+                        yield file, mapped.result()
+                while pending:
+                    file, mapped = pending.popleft()
+                    yield file, mapped.result()
+            finally:
+                for _, mapped in pending:
+                    mapped.cancel()
+
+    def _iter_records(self, files):
+        for file, mapped in self._iter_mapped(files):
+            self.logger.debug(f"Reading File: {file}")
+            if mapped is None:
+                continue
+            try:
+                yield from fastavro.reader(mapped)
+            finally:
+                mapped.close()
+
+    def _stream(self, files, num_messages):
+        msgs = []
+        for data in self._iter_records(files):
+            msgs.append(data)
+            if len(msgs) == num_messages:
+                yield msgs
+                msgs = []
+        if msgs:
+            yield msgs
 
     def consume(self):
-        files = glob.glob(os.path.join(self.config["DIRECTORY_PATH"], "*.avro"))
-        files.sort()
+        files = discover_files(self.config)
 
         if "consume.messages" in self.config:
             num_messages = self.config["consume.messages"]
@@ -38,25 +153,41 @@ class AVROFileConsumer(GenericConsumer):
         else:
             num_messages = 1
 
+        if self.streaming:
+            for msgs in self._stream(files, num_messages):
+                if self.batch_format == "arrow":
+                    yield to_record_batch(msgs)
+                elif num_messages == 1:
+                    yield msgs[0]
+                else:
+                    yield msgs
+            return
+
         msgs = []
-        left = len(files)
         for file in files:
             self.logger.debug(f"Reading File: {file}")
-            left -= 1
             with open(file, "rb") as f:
                 avro_reader = fastavro.reader(f)
                 data = None
                 for read in avro_reader:
                     data = read
                     break
-            if num_messages == 1:
+            if self.batch_format == "arrow" and num_messages == 1:
+                yield to_record_batch([data])
+            elif num_messages == 1:
                 yield data
             else:
                 msgs.append(data)
-                if len(msgs) == num_messages or left + len(msgs) < num_messages:
-                    return_msgs = msgs.copy()
+                if len(msgs) == num_messages:
+                    yield self._batch(msgs)
                     msgs = []
-                    yield return_msgs
+        if msgs:
+            yield self._batch(msgs)
+
+    def _batch(self, msgs):
+        if self.batch_format == "arrow":
+            return to_record_batch(msgs)
+        return msgs
 
 
 class AVROInfiniteConsumer(GenericConsumer):
@@ -75,15 +206,20 @@ class AVROInfiniteConsumer(GenericConsumer):
     ----------
     DIRECTORY_PATH: path
         AVRO files Directory path location
+    RECURSIVE: bool
+        Read the files of nested directories too, as :class:`AVROFileConsumer`.
+    ORDERED: bool
+        Read the files sorted by name, see :class:`AVROFileConsumer`.
+    SHARD_INDEX: int
+        Shard of the files read by this consumer, see :class:`AVROFileConsumer`.
+    SHARD_COUNT: int
+        Number of shards the directory is split in.
     """
 
     def __init__(self, config):
         super().__init__(config)
 
     def consume(self):
-        files = glob.glob(os.path.join(self.config["DIRECTORY_PATH"], "*.avro"))
-        files.sort()
-
         if "consume.messages" in self.config:
             num_messages = self.config["consume.messages"]
         elif "NUM_MESSAGES" in self.config:
@@ -92,19 +228,220 @@ class AVROInfiniteConsumer(GenericConsumer):
             num_messages = 1
 
         msgs = []
-        index = 0
 
         while True:
-            file = files[index % len(files)]
-            self.logger.debug(f"Reading File: {file}")
-            with open(file, "rb") as f:
-                avro_reader = fastavro.reader(f)
-                for data in avro_reader:
-                    if num_messages == 1:
-                        yield data
-                    else:
+            # scan again on every pass instead of keeping the whole file list
+            found = False
+            for file in discover_files(self.config):
+                found = True
+                self.logger.debug(f"Reading File: {file}")
+                with open(file, "rb") as f:
+                    avro_reader = fastavro.reader(f)
+                    for data in avro_reader:
+                        if num_messages == 1:
+                            yield data
+                        else:
+                            msgs.append(data)
+                            if len(msgs) == num_messages:
+                                return_msgs = msgs.copy()
+                                msgs = []
+                                yield return_msgs
+            if not found:
+                self.logger.warning(
+                    f"No files to consume in {self.config['DIRECTORY_PATH']}"
+                )
+                return
+
+
+class AVROWatchConsumer(GenericConsumer):
+    """Consume AVRO files as they arrive to a directory.
+
+    New files are found with inotify on Linux, falling back to scanning the directory every
+    `POLL_INTERVAL` seconds, and every record of each file is read. Batches are yielded when
+    they reach `NUM_MESSAGES` or when no more files are ready.
+
+    The files completed are kept in a :class:`apf.consumers.file_watch.FileCheckpoint`,
+    advanced only by :py:meth:`commit` once every record of a file was yielded. After a
+    restart the directories and files before the checkpoint watermark are skipped without
+    being listed or read, so only new files are processed. Files are expected to arrive
+    in name order, like the timestamped files of an archive. A file arriving before the
+    watermark while the consumer runs is still read and logged with a warning, but it is
+    skipped if the consumer restarts before committing it.
+
+    **Example:**
+
+    .. code-block:: python
+
+        #settings.py
+        CONSUMER_CONFIG = { ...
+            "DIRECTORY_PATH": "path/to/incoming",
+            "CHECKPOINT_PATH": "path/to/checkpoint.json",
+            "NUM_MESSAGES": 100,
+            "RECURSIVE": True,
+        }
+
+    Parameters
+    ----------
+    DIRECTORY_PATH: path
+        AVRO files Directory path location
+    CHECKPOINT_PATH: path
+        JSON file with the completed files, by default a hidden file of the directory named
+        after the shard.
+    WATCHER: str
+        Either `"auto"` (default), `"inotify"` or `"polling"`.
+    POLL_INTERVAL: float
+        Seconds between scans when polling and the longest wait for inotify events
+        (default 1).
+    RECURSIVE: bool
+        Watch nested directories too, see :class:`AVROFileConsumer`.
+    SHARD_INDEX: int
+        Shard of the files read by this consumer, see :class:`AVROFileConsumer`.
+    SHARD_COUNT: int
+        Number of shards the directory is split in.
+    BATCH_FORMAT: str
+        Either `"dict"` (default) or `"arrow"`, see :class:`apf.consumers.KafkaConsumer`.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.batch_format = self.config.get("BATCH_FORMAT", "dict")
+        check_batch_format(self.batch_format)
+        self.directory = self.config["DIRECTORY_PATH"]
+        self.recursive = self.config.get("RECURSIVE", False)
+        self.shard_index, self.shard_count = file_shard(self.config)
+        self.poll_interval = float(self.config.get("POLL_INTERVAL", 1.0))
+        self.watcher_type = self.config.get("WATCHER", "auto")
+        if self.watcher_type not in ("auto", "inotify", "polling"):
+            raise ValueError(
+                f"WATCHER must be auto, inotify or polling, got {self.watcher_type}"
+            )
+        checkpoint_path = self.config.get(
+            "CHECKPOINT_PATH",
+            os.path.join(
+                self.directory,
+                f".apf-checkpoint-{self.shard_index}-of-{self.shard_count}.json",
+            ),
+        )
+        self.checkpoint = FileCheckpoint(checkpoint_path)
+        self.finished = []
+        # files completed recently, to tell repeated events from files arriving late
+        self.recent = OrderedDict()
+        self.watcher = None
+
+    def _key(self, path):
+        return tuple(os.path.relpath(path, self.directory).split(os.sep))
+
+    def _is_new(self, path):
+        if not fnmatch.fnmatch(os.path.basename(path), "*.avro"):
+            return False
+        if self.shard_count > 1 and not in_shard(
+            os.path.relpath(path, self.directory), self.shard_index, self.shard_count
+        ):
+            return False
+        key = self._key(path)
+        if (
+            key in self.checkpoint.pending
+            or key in self.checkpoint.completed
+            or key in self.recent
+        ):
+            return False
+        if self.checkpoint.covers(key):
+            # scans skip these files, so it arrived after later files were checkpointed
+            self.logger.warning(
+                f"Reading {path}, it arrived after the checkpoint moved past it"
+            )
+        return True
+
+    def _scan(self):
+        files = scan_files(
+            self.directory, recursive=self.recursive, after=self.checkpoint.watermark
+        )
+        return (path for path in files if self._is_new(path))
+
+    def _create_watcher(self):
+        if self.watcher_type != "polling":
+            try:
+                return InotifyWatcher(
+                    self.directory, self._scan, self.recursive, self.poll_interval
+                )
+            except OSError as e:
+                if self.watcher_type == "inotify":
+                    raise
+                self.logger.warning(f"Inotify not available, polling instead: {e}")
+        return PollingWatcher(self._scan, self.poll_interval)
+
+    def _batch(self, msgs, num_messages):
+        if self.batch_format == "arrow":
+            return to_record_batch(msgs)
+        if num_messages == 1:
+            return msgs[0]
+        return msgs
+
+    def _read_file(self, path):
+        mapped = map_file(path)
+        if mapped is None:
+            self.finished.append(self._key(path))
+            return
+        try:
+            records = fastavro.reader(mapped)
+            data = next(records, None)
+            if data is None:
+                self.finished.append(self._key(path))
+            while data is not None:
+                following = next(records, None)
+                if following is None:
+                    # finished before its last record is yielded, so the commit of that
+                    # batch completes the file
+                    self.finished.append(self._key(path))
+                yield data
+                data = following
+        finally:
+            mapped.close()
+
+    def consume(self):
+        if "consume.messages" in self.config:
+            num_messages = self.config["consume.messages"]
+        elif "NUM_MESSAGES" in self.config:
+            num_messages = self.config["NUM_MESSAGES"]
+        else:
+            num_messages = 1
+
+        self.watcher = self._create_watcher()
+        msgs = []
+        try:
+            while True:
+                # a file can be both scanned and reported by an event
+                files = sorted(
+                    {
+                        path
+                        for path in self.watcher.wait(self.poll_interval)
+                        if self._is_new(path)
+                    },
+                    key=self._key,
+                )
+                for path in files:
+                    self.checkpoint.add(self._key(path))
+                for path in files:
+                    self.logger.debug(f"Reading File: {path}")
+                    for data in self._read_file(path):
                         msgs.append(data)
                         if len(msgs) == num_messages:
-                            return_msgs = msgs.copy()
+                            yield self._batch(msgs, num_messages)
                             msgs = []
-                            yield return_msgs
+                if msgs:
+                    yield self._batch(msgs, num_messages)
+                    msgs = []
+        finally:
+            self.watcher.close()
+
+    def commit(self):
+        """Mark the files whose records were all consumed as completed and save them."""
+        if not self.finished:
+            return
+        self.checkpoint.complete(self.finished)
+        for key in self.finished:
+            self.recent[key] = None
+        while len(self.recent) > RECENT_FILES:
+            self.recent.popitem(last=False)
+        self.finished = []
+        self.checkpoint.save()
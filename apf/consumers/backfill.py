@@ -0,0 +1,225 @@
+from confluent_kafka import TopicPartition
+
+import datetime
+import os
+import time
+
+WORKER_INDEX_ENV = "APF_WORKER_INDEX"
+WORKER_COUNT_ENV = "APF_WORKER_COUNT"
+
+
+def to_millis(value):
+    """Convert a backfill limit to a Kafka timestamp in milliseconds.
+
+    Parameters
+    ----------
+    value: int | float | str | :class:`datetime.datetime`
+        Milliseconds since the epoch, an ISO 8601 string or a datetime. Naive datetimes
+        are taken as UTC.
+    """
+    if isinstance(value, str):
+        # fromisoformat only accepts a "Z" suffix since Python 3.11
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        value = datetime.datetime.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+def worker_shard():
+    """Index and count of the worker set by :class:`apf.core.supervisor.StepSupervisor`.
+
+    Returns ``(0, 1)`` outside a supervised worker.
+    """
+    return (
+        int(os.environ.get(WORKER_INDEX_ENV, 0)),
+        int(os.environ.get(WORKER_COUNT_ENV, 1)),
+    )
+
+
+class BackfillRange:
+    """Offsets of each partition to reprocess and the progress through them.
+
+    Parameters
+    ----------
+    start: dict
+        First offset to consume by ``(topic, partition)``.
+    end: dict
+        Offset where each ``(topic, partition)`` stops, not consumed.
+    position: dict | None
+        Next offset to consume by ``(topic, partition)`` when resuming a backfill, `start`
+        if None.
+    """
+
+    def __init__(self, start, end, position=None):
+        self.start = dict(start)
+        self.end = dict(end)
+        self.position = dict(start)
+        self.position.update(position or {})
+        self.total = sum(max(0, self.end[key] - self.start[key]) for key in self.end)
+        self.finished = {key for key in self.end if self.position[key] >= self.end[key]}
+        self.started = time.monotonic()
+        self.initial_remaining = self._remaining()
+
+    @classmethod
+    def resolve(
+        cls,
+        consumer,
+        topics,
+        start=None,
+        end=None,
+        worker_index=0,
+        worker_count=1,
+        timeout=10.0,
+    ):
+        """Find the offsets of a time range in the partitions of a worker.
+
+        The partitions of every topic are sorted and dealt to the workers in turns, so each
+        worker of a supervisor gets a disjoint share without a consumer group rebalance.
+        Partitions with a committed offset inside the range resume from it, so a restarted
+        worker does not consume the range again.
+
+        Parameters
+        ----------
+        consumer: :class:`confluent_kafka.Consumer`
+            Consumer used to query the brokers.
+        topics: list
+            Topics to reprocess.
+        start: int | str | :class:`datetime.datetime` | None
+            Timestamp of the first message, the earliest available if None.
+        end: int | str | :class:`datetime.datetime` | None
+            Timestamp where the range stops, the current high watermark if None.
+        worker_index: int
+            Index of this worker.
+        worker_count: int
+            Number of workers sharing the topics.
+        timeout: float
+            Seconds to wait for each broker request.
+        """
+        if not 0 <= worker_index < worker_count:
+            raise ValueError("Backfill worker index must be between 0 and worker count")
+        partitions = sorted(
+            (topic, partition)
+            for topic in topics
+            for partition in consumer.list_topics(topic, timeout=timeout)
+            .topics[topic]
+            .partitions
+        )
+        partitions = partitions[worker_index::worker_count]
+        watermarks = {
+            key: consumer.get_watermark_offsets(TopicPartition(*key), timeout=timeout)
+            for key in partitions
+        }
+        start_offsets = cls._offsets_for_time(
+            consumer, partitions, start, watermarks, 0, timeout
+        )
+        end_offsets = cls._offsets_for_time(
+            consumer, partitions, end, watermarks, 1, timeout
+        )
+        committed = consumer.committed(
+            [TopicPartition(*key) for key in partitions], timeout=timeout
+        )
+        position = {}
+        for tp in committed:
+            key = (tp.topic, tp.partition)
+            # an offset equal to the end was committed by a finished partition
+            if start_offsets[key] <= tp.offset <= end_offsets[key]:
+                position[key] = tp.offset
+        return cls(start_offsets, end_offsets, position)
+
+    @staticmethod
+    def _offsets_for_time(
+        consumer, partitions, timestamp, watermarks, default, timeout
+    ):
+        if timestamp is None:
+            return {key: watermarks[key][default] for key in partitions}
+        millis = to_millis(timestamp)
+        found = consumer.offsets_for_times(
+            [
+                TopicPartition(topic, partition, millis)
+                for topic, partition in partitions
+            ],
+            timeout=timeout,
+        )
+        offsets = {}
+        for tp in found:
+            key = (tp.topic, tp.partition)
+            # no message at or after the timestamp, use the high watermark
+            offsets[key] = tp.offset if tp.offset >= 0 else watermarks[key][1]
+        return offsets
+
+    @property
+    def done(self):
+        return len(self.finished) == len(self.end)
+
+    def pending_partitions(self):
+        """Partitions that did not reach their end offset."""
+        return [
+            TopicPartition(topic, partition, self.position[(topic, partition)])
+            for topic, partition in self.end
+            if (topic, partition) not in self.finished
+        ]
+
+    def accept(self, message):
+        """Check if a consumed message is inside the range and advance the progress.
+
+        Returns
+        -------
+        bool
+            False for messages at or after the end offset of their partition.
+        """
+        key = (message.topic(), message.partition())
+        offset = message.offset()
+        if key not in self.end or offset >= self.end[key]:
+            return False
+        self.position[key] = offset + 1
+        if self.position[key] >= self.end[key]:
+            self.finished.add(key)
+        return True
+
+    def advance(self, positions):
+        """Update the progress with the consumer positions.
+
+        Transaction markers and compacted messages take offsets that are never consumed,
+        the position of the consumer still moves past them.
+
+        Parameters
+        ----------
+        positions: list
+            :class:`confluent_kafka.TopicPartition` with the next offset to consume.
+        """
+        for tp in positions:
+            key = (tp.topic, tp.partition)
+            if key not in self.end or tp.offset < 0:
+                continue
+            self.position[key] = max(self.position[key], min(tp.offset, self.end[key]))
+            if self.position[key] >= self.end[key]:
+                self.finished.add(key)
+
+    def _remaining(self):
+        return sum(max(0, self.end[key] - self.position[key]) for key in self.end)
+
+    def metrics(self):
+        """Progress of the backfill.
+
+        Returns
+        -------
+        dict
+            Messages left to consume, the consumed fraction of the range and the estimated
+            seconds to finish at the current rate, None until a message is consumed.
+        """
+        remaining = self._remaining()
+        consumed = self.total - remaining
+        # the rate only counts the messages consumed since this range was created
+        consumed_now = self.initial_remaining - remaining
+        eta = None
+        if consumed_now > 0:
+            eta = remaining * (time.monotonic() - self.started) / consumed_now
+        return {
+            "backfill_remaining": remaining,
+            "backfill_progress": consumed / self.total if self.total else 1.0,
+            "backfill_eta": eta,
+        }
@@ -0,0 +1,89 @@
+import math
+
+
+class AdaptiveBatchSize:
+    """Resize the number of messages requested on each poll toward a target batch latency.
+
+    After each batch the step reports how long it took to execute. The controller keeps an
+    exponentially weighted estimate of the seconds spent per message and requests as many
+    messages as fit in `target_latency`, growing at most `max_growth` times per batch so a
+    burst is followed gradually. Batches that come back with fewer messages than requested
+    mean the poll waited for the timeout, so the size shrinks to the number of messages
+    that were available and a quiet stream is consumed in small, low latency batches.
+
+    Parameters
+    ----------
+    min_messages: int
+        Smallest number of messages requested.
+    max_messages: int
+        Largest number of messages requested.
+    target_latency: float
+        Seconds each batch should take to execute.
+    initial: int | None
+        First number of messages requested, `min_messages` by default.
+    smoothing: float
+        Weight of the last batch in the seconds per message estimate, between 0 and 1.
+    max_growth: float
+        Maximum factor the size grows between two polls.
+    """
+
+    def __init__(
+        self,
+        min_messages,
+        max_messages,
+        target_latency,
+        initial=None,
+        smoothing=0.5,
+        max_growth=2.0,
+    ):
+        if not 0 < min_messages <= max_messages:
+            raise ValueError(
+                "Batch size bounds must satisfy 0 < min_messages <= max_messages"
+            )
+        if target_latency <= 0:
+            raise ValueError("Target batch latency must be positive")
+        self.min_messages = min_messages
+        self.max_messages = max_messages
+        self.target_latency = target_latency
+        self.smoothing = smoothing
+        self.max_growth = max_growth
+        self.seconds_per_message = None
+        self.size = self._clamp(initial or min_messages)
+
+    def _clamp(self, size):
+        return int(min(self.max_messages, max(self.min_messages, size)))
+
+    def update(self, n_messages, execution_time):
+        """Update the size with the execution time of the last batch.
+
+        Parameters
+        ----------
+        n_messages: int
+            Number of messages of the batch.
+        execution_time: float
+            Seconds spent executing the batch.
+
+        Returns
+        -------
+        int
+            Number of messages to request on the next poll.
+        """
+        if n_messages <= 0:
+            return self.size
+        if n_messages < self.size:
+            self.size = self._clamp(n_messages)
+            return self.size
+        sample = execution_time / n_messages
+        if self.seconds_per_message is None:
+            self.seconds_per_message = sample
+        else:
+            self.seconds_per_message = (
+                self.smoothing * sample
+                + (1 - self.smoothing) * self.seconds_per_message
+            )
+        if self.seconds_per_message > 0:
+            size = math.floor(self.target_latency / self.seconds_per_message)
+        else:
+            size = self.max_messages
+        self.size = self._clamp(min(size, math.ceil(self.size * self.max_growth)))
+        return self.size
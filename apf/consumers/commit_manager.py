@@ -0,0 +1,134 @@
+from collections import deque
+from confluent_kafka import KafkaException, TopicPartition
+
+import logging
+import threading
+import time
+
+
+class CommitManager:
+    """Commit consumed offsets once the step outputs of each batch are delivered.
+
+    Each consumed batch is registered with the producer batch that holds its outputs. Batches
+    are released in consumption order when the producer confirms their delivery, and the
+    released offsets of every partition are committed asynchronously every `interval` seconds
+    or every `max_batches` released batches, whichever comes first. The consumer also checks
+    the interval on empty polls, so delivered offsets are committed while consumption is
+    idle. Every method is safe to call from the prefetch thread.
+
+    Parameters
+    ----------
+    consumer: :class:`confluent_kafka.Consumer`
+        Consumer used to commit the offsets.
+    interval: float
+        Maximum seconds between asynchronous commits.
+    max_batches: int
+        Maximum number of released batches waiting to be committed.
+    """
+
+    def __init__(self, consumer, interval=5.0, max_batches=10):
+        self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
+        self.consumer = consumer
+        self.interval = interval
+        self.max_batches = max_batches
+        self.pending = deque()
+        self.ready = {}
+        self.ready_batches = 0
+        self.last_commit = time.monotonic()
+        self.lock = threading.RLock()
+
+    def add(self, offsets, producer, batch):
+        """Register the offsets of a consumed batch.
+
+        Parameters
+        ----------
+        offsets: dict
+            Next offset to consume for each ``(topic, partition)`` of the batch.
+        producer: :class:`apf.producers.GenericProducer`
+            Producer of the batch outputs.
+        batch: int | None
+            Producer batch returned by :py:meth:`apf.producers.GenericProducer.end_batch`.
+        """
+        with self.lock:
+            self.pending.append((offsets, producer, batch))
+            self.maybe_commit()
+
+    def _release(self):
+        while self.pending:
+            offsets, producer, batch = self.pending[0]
+            if not producer.is_delivered(batch):
+                return
+            self.pending.popleft()
+            for key, offset in offsets.items():
+                self.ready[key] = max(self.ready.get(key, 0), offset)
+            self.ready_batches += 1
+
+    def _commit(self, asynchronous):
+        assigned = {(tp.topic, tp.partition) for tp in self.consumer.assignment()}
+        offsets = [
+            TopicPartition(topic, partition, offset)
+            for (topic, partition), offset in self.ready.items()
+            if (topic, partition) in assigned
+        ]
+        self.ready = {}
+        self.ready_batches = 0
+        self.last_commit = time.monotonic()
+        if offsets:
+            self.consumer.commit(offsets=offsets, asynchronous=asynchronous)
+
+    def maybe_commit(self):
+        """Commit asynchronously the delivered batches if the interval or count was reached."""
+        with self.lock:
+            self._release()
+            if not self.ready:
+                return
+            elapsed = time.monotonic() - self.last_commit
+            if self.ready_batches >= self.max_batches or elapsed >= self.interval:
+                self._commit(asynchronous=True)
+
+    def flush(self, timeout=10.0, partitions=None):
+        """Wait for pending deliveries and commit every delivered batch synchronously.
+
+        Parameters
+        ----------
+        timeout: float
+            Maximum seconds waiting for deliveries.
+        partitions: set | None
+            ``(topic, partition)`` tuples being revoked. Offsets of these partitions whose
+            outputs were not delivered in time are dropped, they will be consumed again by the
+            partition's new owner.
+        """
+        with self.lock:
+            deadline = time.monotonic() + timeout
+            if self.pending:
+                _, producer, batch = self.pending[-1]
+                producer.wait_delivered(batch, timeout)
+            self._release()
+            while self.pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+                self._release()
+            try:
+                self._commit(asynchronous=False)
+            except KafkaException as e:
+                self.logger.error(f"Error committing offsets: {e}")
+            if partitions:
+                self.discard(partitions)
+
+    def discard(self, partitions):
+        """Drop the offsets of partitions that are no longer assigned without committing them.
+
+        Parameters
+        ----------
+        partitions: set
+            ``(topic, partition)`` tuples to drop.
+        """
+        with self.lock:
+            self.ready = {k: v for k, v in self.ready.items() if k not in partitions}
+            self.pending = deque(
+                (
+                    {k: v for k, v in offsets.items() if k not in partitions},
+                    producer,
+                    batch,
+                )
+                for offsets, producer, batch in self.pending
+            )
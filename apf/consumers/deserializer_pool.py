@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import multiprocessing
+
+POOL_TYPES = ("process", "thread")
+
+_worker_deserializer = None
+
+
+def _init_worker(deserializer):
+    global _worker_deserializer
+    _worker_deserializer = deserializer
+
+
+def _deserialize_value(value):
+    return _worker_deserializer(value)
+
+
+class DeserializerPool:
+    """Deserialize a batch of Kafka messages in parallel keeping the batch order.
+
+    A ``thread`` pool calls the consumer's ``_deserialize_message`` for each message. A ``process``
+    pool sends only the raw message values to the workers, where they are decoded with the
+    consumer's picklable ``deserializer``, which is sent once when each worker starts.
+
+    Worker processes are spawned instead of forked, since forking a process running the
+    librdkafka threads can leave their locks held in the child. The workers decode with
+    their own copy of the deserializer, so the consumer's decoder stats, like the schema
+    cache hits and misses, stay at zero with a ``process`` pool.
+
+    Parameters
+    ----------
+    consumer: :class:`apf.consumers.KafkaConsumer`
+        Consumer whose messages are deserialized.
+    workers: int
+        Number of workers in the pool.
+    pool_type: str
+        Either ``process`` or ``thread``.
+    """
+
+    def __init__(self, consumer, workers, pool_type="process"):
+        if pool_type not in POOL_TYPES:
+            raise ValueError(
+                f"Deserialize pool type must be one of {POOL_TYPES}, got {pool_type}"
+            )
+        self.consumer = consumer
+        self.workers = workers
+        self.pool_type = pool_type
+        if pool_type == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(consumer.deserializer,),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def map(self, messages):
+        """Deserialize messages in parallel.
+
+        Parameters
+        ----------
+        messages: list
+            Kafka messages without errors.
+
+        Returns
+        -------
+        list
+            Deserialized messages in the same order as the input.
+        """
+        if self.pool_type == "thread":
+            return list(self.executor.map(self.consumer._deserialize_message, messages))
+        chunksize = max(1, len(messages) // (self.workers * 4))
+        values = [message.value() for message in messages]
+        return list(self.executor.map(_deserialize_value, values, chunksize=chunksize))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
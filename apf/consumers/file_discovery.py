@@ -0,0 +1,103 @@
+from apf.consumers.backfill import worker_shard
+
+import fnmatch
+import os
+import zlib
+
+
+def scan_files(directory, pattern="*.avro", recursive=False, after=None, ordered=True):
+    """Find the files of a directory with :func:`os.scandir`.
+
+    By default each directory listing is read completely and its entry names sorted before
+    anything is yielded from it, keeping only the names and not :class:`os.DirEntry`
+    objects. Without `ordered` entries are yielded in the order the file system lists
+    them, as soon as they are read, so the first files of a flat directory with millions
+    of them are found right away and the listing is never held in memory. Nested
+    directories, like ``YYYY/MM/DD`` archives, are walked when `recursive` is set.
+
+    Parameters
+    ----------
+    directory: path
+        Directory to scan.
+    pattern: str
+        Shell pattern matched against the file names.
+    recursive: bool
+        Descend into subdirectories.
+    after: tuple | None
+        Path parts, relative to `directory`, of the last file already read. Files sorting
+        at or before it, comparing their path parts, and the directories holding only such
+        files are skipped without being listed.
+    ordered: bool
+        Yield the files sorted by their path parts (default True).
+    """
+    yield from _scan(directory, pattern, recursive, after, ordered, ())
+
+
+def _scan(directory, pattern, recursive, after, ordered, parts):
+    with os.scandir(directory) as listing:
+        entries = ((entry.name, entry.is_dir()) for entry in listing)
+        if ordered:
+            entries = sorted(entries)
+        for name, is_dir in entries:
+            key = parts + (name,)
+            if is_dir:
+                if recursive and (after is None or key >= after[: len(key)]):
+                    yield from _scan(
+                        os.path.join(directory, name),
+                        pattern,
+                        recursive,
+                        after,
+                        ordered,
+                        key,
+                    )
+            elif fnmatch.fnmatch(name, pattern) and (after is None or key > after):
+                yield os.path.join(directory, name)
+
+
+def in_shard(path, shard_index, shard_count):
+    """Check if a file belongs to a shard.
+
+    The shard is chosen by a CRC32 of the path, so every replica assigns a file to the
+    same shard without coordinating, whatever files it listed before.
+    """
+    return zlib.crc32(os.fsencode(path)) % shard_count == shard_index
+
+
+def file_shard(config):
+    """Shard index and count of a directory consumer.
+
+    Read from the `SHARD_INDEX` and `SHARD_COUNT` of the config, defaulting to the worker of
+    a :class:`apf.core.supervisor.StepSupervisor` and to the whole directory otherwise.
+    """
+    default_index, default_count = worker_shard()
+    shard_index = int(config.get("SHARD_INDEX", default_index))
+    shard_count = int(config.get("SHARD_COUNT", default_count))
+    if not 0 <= shard_index < shard_count:
+        raise ValueError("Shard index must be between 0 and shard count")
+    return shard_index, shard_count
+
+
+def discover_files(config):
+    """Find the files of a directory consumer, filtered by its shard.
+
+    Parameters
+    ----------
+    config: dict
+        Consumer config with the `DIRECTORY_PATH` and the optional `RECURSIVE`, `ORDERED`
+        (see :func:`scan_files`), `SHARD_INDEX` and `SHARD_COUNT` (see :func:`file_shard`).
+    """
+    directory = config["DIRECTORY_PATH"]
+    shard_index, shard_count = file_shard(config)
+    files = scan_files(
+        directory,
+        recursive=config.get("RECURSIVE", False),
+        ordered=config.get("ORDERED", True),
+    )
+    if shard_count == 1:
+        return files
+    # shard on the path inside the directory, the same on every replica
+    return (
+        path
+        for path in files
+        if in_shard(os.path.relpath(path, directory), shard_index, shard_count)
+    )
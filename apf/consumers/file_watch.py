@@ -0,0 +1,272 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+
+
+class FileCheckpoint:
+    """Files of a directory already processed, kept as a watermark and the files after it.
+
+    Files are identified by their path parts relative to the directory and ordered by them.
+    The watermark is the last file such that every file known up to it is completed, and
+    only the completed files after it are kept, so the checkpoint stays small while files
+    complete in order. Scans after a restart skip the files before the watermark, so a file
+    arriving with an earlier name is only read if it is noticed while running.
+
+    Parameters
+    ----------
+    path: str | None
+        JSON file where the checkpoint is persisted.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.watermark = None
+        self.completed = set()
+        self.pending = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state["watermark"] is not None:
+                self.watermark = tuple(state["watermark"].split("/"))
+            self.completed = {tuple(key.split("/")) for key in state["completed"]}
+
+    def covers(self, key):
+        """Check if a file was completed."""
+        return (
+            self.watermark is not None and key <= self.watermark
+        ) or key in self.completed
+
+    def add(self, key):
+        """Track a file being processed, holding the watermark until it completes."""
+        self.pending.add(key)
+
+    def complete(self, keys):
+        """Mark files as completed and move the watermark past them when possible."""
+        for key in keys:
+            self.pending.discard(key)
+            self.completed.add(key)
+        first_pending = min(self.pending, default=None)
+        done = [
+            key
+            for key in self.completed
+            if first_pending is None or key < first_pending
+        ]
+        if done:
+            # a late file completed before the watermark must not move it back
+            self.watermark = max(done + [self.watermark] if self.watermark else done)
+            self.completed.difference_update(done)
+
+    def save(self):
+        """Write the checkpoint to `path` atomically."""
+        if not self.path:
+            return
+        state = {
+            "watermark": "/".join(self.watermark) if self.watermark else None,
+            "completed": sorted("/".join(key) for key in self.completed),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+class PollingWatcher:
+    """Find new files by scanning a directory periodically.
+
+    A file is ready once two scans in a row find it with the same size, so files still being
+    written are not read.
+
+    Parameters
+    ----------
+    scan: callable
+        Called with no arguments to list the candidate files.
+    interval: float
+        Seconds between scans.
+    """
+
+    def __init__(self, scan, interval=1.0):
+        self.scan = scan
+        self.interval = interval
+        self.sizes = {}
+
+    def wait(self, timeout=None):
+        """Scan for files after `timeout` seconds, the interval by default.
+
+        Returns
+        -------
+        list
+            Paths of the files ready to be read.
+        """
+        time.sleep(self.interval if timeout is None else timeout)
+        sizes = {}
+        for path in self.scan():
+            try:
+                sizes[path] = os.stat(path).st_size
+            except FileNotFoundError:
+                continue
+        ready = [path for path, size in sizes.items() if self.sizes.get(path) == size]
+        self.sizes = {path: size for path, size in sizes.items() if path not in ready}
+        return ready
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Find new files with Linux inotify events.
+
+    Files are ready when they are closed after being written or moved into a watched
+    directory. Files found by scanning, the ones already there on the first call to
+    :py:meth:`wait`, in new subdirectories or after the event queue overflows, may still be
+    open for writing. They are ready when their close event arrives or once their size and
+    modification time stay the same for `settle` seconds.
+
+    Parameters
+    ----------
+    directory: path
+        Directory to watch.
+    scan: callable
+        Called with no arguments to list the candidate files.
+    recursive: bool
+        Watch the subdirectories too, including the ones created later.
+    settle: float
+        Seconds a scanned file must stay unchanged to be ready.
+    """
+
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, directory, scan, recursive=False, settle=1.0):
+        self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
+        self.scan = scan
+        self.recursive = recursive
+        self.settle = settle
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        self.scanned = {}
+        self._watch_tree(directory)
+        self.rescan = True
+
+    def _watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Could not watch {directory}")
+        self.directories[wd] = directory
+
+    def _watch_tree(self, directory):
+        self._watch(directory)
+        if not self.recursive:
+            return
+        for root, subdirectories, _ in os.walk(directory):
+            for subdirectory in subdirectories:
+                self._watch(os.path.join(root, subdirectory))
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _add_scanned(self):
+        now = time.monotonic()
+        for path in self.scan():
+            if path in self.scanned:
+                continue
+            try:
+                self.scanned[path] = (self._signature(path), now)
+            except FileNotFoundError:
+                continue
+
+    def _settled(self):
+        now = time.monotonic()
+        ready = []
+        for path, (signature, checked) in list(self.scanned.items()):
+            if now - checked < self.settle:
+                continue
+            try:
+                current = self._signature(path)
+            except FileNotFoundError:
+                del self.scanned[path]
+                continue
+            if current == signature:
+                ready.append(path)
+                del self.scanned[path]
+            else:
+                self.scanned[path] = (current, now)
+        return ready
+
+    def wait(self, timeout=1.0):
+        """Wait up to `timeout` seconds for new files.
+
+        Returns
+        -------
+        list
+            Paths of the files ready to be read.
+        """
+        if self.rescan:
+            self.rescan = False
+            self._add_scanned()
+        if self.scanned:
+            timeout = min(timeout, self.settle)
+        ready = self._read_events(timeout)
+        return ready + self._settled()
+
+    def _read_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        ready = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.logger.warning("Inotify queue overflowed, scanning again")
+                self._add_scanned()
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # files may be written before the watch exists
+                    self._watch_tree(path)
+                    self._add_scanned()
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.scanned.pop(path, None)
+                ready.append(path)
+        return ready
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -41,3 +41,91 @@ class GenericConsumer(ABC):
 
         """
         pass
+
+    @property
+    def delivery_aware_commit(self) -> bool:
+        """Whether the consumer commits with :py:meth:`commit_delivered` after producing."""
+        return False
+
+    def commit_delivered(self, producer):
+        """Commit the last consumed batch after the producer delivered its outputs.
+
+        By default it commits right away.
+
+        Parameters
+        ----------
+        producer: :class:`apf.producers.GenericProducer`
+            Producer of the batch outputs.
+        """
+        self.commit()
+
+    def get_metrics(self) -> dict:
+        """Metrics collected by the consumer for the last consumed batch.
+
+        The returned values are added to the step metrics sent by the metrics producer.
+
+        Returns
+        -------
+        dict
+            Metric name and value pairs.
+        """
+        return {}
+
+    def consumed_offsets(self):
+        """Partition and offset of each message of the last consumed batch.
+
+        Returns
+        -------
+        list | None
+            ``((topic, partition), offset)`` tuples in the order of the batch messages, or
+            None if the data source has no offsets.
+        """
+        return None
+
+    def commit_offsets(self, offsets: dict):
+        """Commit explicit offsets instead of the last consumed batch.
+
+        Consumers returning offsets from :py:meth:`consumed_offsets` must implement it.
+
+        Parameters
+        ----------
+        offsets: dict
+            Next offset to consume by ``(topic, partition)``.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} can't commit explicit offsets"
+        )
+
+    def pause(self):
+        """Stop fetching messages from the data source until :py:meth:`resume` is called.
+
+        Used by the step to apply backpressure when the producer falls behind.
+        """
+        pass
+
+    def resume(self):
+        """Resume fetching messages after :py:meth:`pause`."""
+        pass
+
+    def keep_alive(self):
+        """Serve the data source while paused, without returning messages.
+
+        Called by the step while it waits for the producer during backpressure, consumers
+        that must poll to keep their session, like Kafka group members, should override it.
+        """
+        pass
+
+    def report_execution_time(self, n_messages: int, execution_time: float):
+        """Receive the execution time of the last consumed batch.
+
+        Called by the step after each batch is executed, consumers that adapt their batches
+        to the step latency should override this method.
+
+        Parameters
+        ----------
+        n_messages: int
+            Number of messages of the batch.
+        execution_time: float
+            Seconds between receiving the batch and finishing its post processing.
+        """
+        pass
@@ -1,10 +1,23 @@
+from apf.consumers.arrow import check_batch_format, to_record_batch
+from apf.consumers.backfill import BackfillRange, worker_shard
+from apf.consumers.batch_size import AdaptiveBatchSize
+from apf.consumers.avro_decoder import AvroContainerDecoder, WireFormatDecoder
+from apf.consumers.commit_manager import CommitManager
+from apf.consumers.deserializer_pool import DeserializerPool
 from apf.consumers.generic import GenericConsumer
-from confluent_kafka import Consumer, KafkaException
+from apf.consumers.partition_metrics import PartitionMetrics
+from apf.consumers.prefetch import BatchPrefetcher
+from apf.core.schema_cache import load_schema
+from apf.core.schema_registry import load_registry
+from apf.metrics.prometheus.kafka_stats import enable_statistics
+from confluent_kafka import Consumer, KafkaException, TopicPartition
 
 import fastavro
+import functools
 import io
 import importlib
 import json
+import time
 
 
 class KafkaConsumer(GenericConsumer):
@@ -117,6 +130,202 @@ class KafkaConsumer(GenericConsumer):
 
         all supported `confluent_kafka` parameters can be found
         `on the official library documentation <https://github.com/edenhill/librdkafka/blob/master/CONFIGURATION.md>`_
+
+    SCHEMA_CACHE_SIZE: int
+        Number of different Avro container headers whose parsed writer schema is kept
+        in memory (default 8). Messages sharing a header are decoded without parsing the
+        schema again.
+
+    READER_SCHEMA: dict
+        Avro reader schema used to decode the messages instead of the writer schema. Fields of
+        the writer schema missing in the reader schema are skipped without building Python
+        objects for them.
+
+    FIELDS: list
+        Names of the fields to decode, ignored if `READER_SCHEMA` is given. The reader schema
+        is projected from the writer schema of each message, nested fields are selected with
+        dots. The bytes skipped and the estimated decoding time saved by the projection are
+        reported in the step metrics as *projection_bytes_skipped* and
+        *projection_time_saved*.
+
+        **Example:**
+
+        Skip the cutout stamps and the previous candidates of ZTF alerts.
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "FIELDS": ["objectId", "candid", "candidate"],
+            }
+
+    ADAPTIVE_BATCH: dict
+        Resize the number of messages requested on each poll between *MIN_MESSAGES*
+        (default 1) and *MAX_MESSAGES*, steering toward a *TARGET_LATENCY* in seconds for the
+        execution of each batch, using an :class:`apf.consumers.batch_size.AdaptiveBatchSize`.
+        Full batches grow the size up to what fits in the target latency, batches that come
+        back with fewer messages after the timeout shrink it, so bursts are consumed in large
+        batches and quiet streams in small ones. *INITIAL_MESSAGES* sets the first size.
+        `NUM_MESSAGES` is ignored and lists are always consumed. The size requested next is
+        reported in the step metrics as *batch_size* and exported as a Prometheus gauge.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "TIMEOUT": 1,
+                "ADAPTIVE_BATCH": {
+                    "MIN_MESSAGES": 10,
+                    "MAX_MESSAGES": 5000,
+                    "TARGET_LATENCY": 2.0,
+                },
+            }
+
+    BATCH_FORMAT: str
+        Either `"dict"` (default) to consume dicts or lists of dicts, or `"arrow"` to consume
+        each batch as a :class:`pyarrow.RecordBatch` with a column for each field, even if a
+        single message is consumed. The arrow format requires pyarrow to be installed, use
+        :func:`apf.consumers.arrow.numeric_columns` to read the numeric columns as NumPy
+        arrays without copying them.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "NUM_MESSAGES": 1000,
+                "BATCH_FORMAT": "arrow",
+            }
+
+    DESERIALIZE_WORKERS: int
+        Deserialize each consumed batch with a pool of this many workers (disabled by default).
+        The batch order, the `timestamp` field and the `_PARTITION_EOF` handling are the same as
+        with serial deserialization.
+
+    DESERIALIZE_POOL: str
+        Type of pool used with `DESERIALIZE_WORKERS`, either `"process"` (default) or `"thread"`.
+        Process workers decode raw message values with the consumer's
+        :py:attr:`deserializer`, so subclasses that override `_deserialize_message` should
+        also override `deserializer` or use a thread pool. The workers are spawned and decode
+        with their own copy of the deserializer, so the `schema_cache_hits`,
+        `schema_cache_misses` and projection metrics are not collected with process workers.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "NUM_MESSAGES": 5000,
+                "DESERIALIZE_WORKERS": 4,
+                "DESERIALIZE_POOL": "process",
+            }
+
+    PREFETCH_BATCHES: int
+        Poll and deserialize batches on a background thread while the step executes, keeping
+        up to this many decoded batches ready (disabled by default). :py:meth:`commit` then
+        commits the offsets of the last batch handed to the step instead of the consumer
+        position, so prefetched batches are only committed after the step finished them.
+
+    COMMIT_MANAGER: dict
+        Commit each batch only after the producer confirmed the delivery of the step outputs,
+        using a :class:`apf.consumers.commit_manager.CommitManager`. Delivered offsets are
+        committed asynchronously every *INTERVAL* seconds (default 5) or every *MAX_BATCHES*
+        batches (default 10), and synchronously when partitions are revoked or the consumer
+        shuts down. Set *FLUSH_TIMEOUT* to bound the wait for pending deliveries in the
+        synchronous commits (default 10 seconds).
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "COMMIT_MANAGER": {
+                    "INTERVAL": 5,
+                    "MAX_BATCHES": 10,
+                }
+            }
+
+    PARTITION_METRICS: dict
+        Report the lag, the messages and bytes consumed per second and the message sizes of
+        each assigned topic partition, using a
+        :class:`apf.consumers.partition_metrics.PartitionMetrics`. The metrics are refreshed
+        at most every *INTERVAL* seconds (default 10) from counters kept in memory and the
+        high watermarks cached by the consumer, so they add no broker requests. Each refresh
+        is reported in the step metrics as *partitions* and exported as Prometheus metrics
+        labelled by topic and partition.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "PARTITION_METRICS": {"INTERVAL": 30},
+            }
+
+    BACKFILL: dict
+        Reprocess the messages of `TOPICS` between two timestamps and stop. Partitions are
+        assigned directly instead of subscribing, so no consumer group rebalance happens,
+        and the range of each partition is resolved with `offsets_for_times` from *START*
+        (default the earliest offset) to *END* (default the current high watermark), both as
+        milliseconds since the epoch, ISO 8601 strings or datetimes. Consumption ends when
+        every partition reaches its end offset, messages after it are dropped and
+        `_PARTITION_EOF` events are ignored. Committed offsets never go past the range, and
+        partitions with a committed offset inside it resume from that offset on restart.
+
+        Partitions are dealt in turns to *WORKER_COUNT* workers, this consumer taking the
+        share of *WORKER_INDEX*. Both default to the worker of
+        :class:`apf.core.supervisor.StepSupervisor` running the step, so ``apf run`` with
+        several workers splits the backfill between them. Use a dedicated *group.id* so the
+        commits do not move the offsets of the live step. The messages left, the consumed
+        fraction and the estimated seconds to finish are reported in the step metrics as
+        *backfill_remaining*, *backfill_progress* and *backfill_eta*.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "TOPICS": ["ztf_20230101_programid1"],
+                "PARAMS": {
+                    "bootstrap.servers": "kafka1:9092",
+                    "group.id": "my_step_backfill",
+                },
+                "BACKFILL": {
+                    "START": "2023-01-01T00:00:00",
+                    "END": "2023-01-02T00:00:00",
+                },
+            }
+
+    STATISTICS: dict
+        Export the librdkafka statistics of the consumer as Prometheus metrics every
+        *INTERVAL* seconds (default 15), see
+        :class:`apf.metrics.prometheus.kafka_stats.KafkaStatsBridge`.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "STATISTICS": {"INTERVAL": 10},
+            }
+
+    **Cooperative rebalancing**
+
+    Setting *partition.assignment.strategy* to *cooperative-sticky* in *PARAMS* enables
+    incremental rebalancing. When a topic strategy adds a new topic the consumer subscribes to
+    the new topic list without unsubscribing first, so only the partitions of the new topics
+    are assigned and the partitions already being consumed keep their assignment.
+
+    The duration of the last rebalance and the number of rebalances are reported in the step
+    metrics as *rebalance_time* and *rebalances*.
     """
 
     consumer: Consumer
@@ -125,18 +334,65 @@ class KafkaConsumer(GenericConsumer):
         super().__init__(config)
         # Disable auto commit
         self.config["PARAMS"]["enable.auto.commit"] = False
+        if "COMMIT_MANAGER" in self.config:
+            self.config["PARAMS"].setdefault("on_commit", self._on_commit)
+        enable_statistics(self.config, "consumer")
         # Creating consumer
         self.consumer = Consumer(self.config["PARAMS"])
 
         self.max_retries = int(self.config.get("COMMIT_RETRY", 5))
+        self.decoder = AvroContainerDecoder(
+            cache_size=int(self.config.get("SCHEMA_CACHE_SIZE", 8)),
+            reader_schema=self.config.get("READER_SCHEMA"),
+            fields=self.config.get("FIELDS"),
+        )
+        self.adaptive_batch = None
+        if "ADAPTIVE_BATCH" in self.config:
+            adaptive_config = self.config["ADAPTIVE_BATCH"]
+            self.adaptive_batch = AdaptiveBatchSize(
+                min_messages=int(adaptive_config.get("MIN_MESSAGES", 1)),
+                max_messages=int(adaptive_config["MAX_MESSAGES"]),
+                target_latency=float(adaptive_config["TARGET_LATENCY"]),
+                initial=adaptive_config.get("INITIAL_MESSAGES"),
+            )
+        self.batch_format = self.config.get("BATCH_FORMAT", "dict")
+        check_batch_format(self.batch_format)
+        self.batch_metrics = {}
+        self.messages = []
+        self.partition_metrics = None
+        if "PARTITION_METRICS" in self.config:
+            self.partition_metrics = PartitionMetrics(
+                interval=float(self.config["PARTITION_METRICS"].get("INTERVAL", 10))
+            )
+        self.prefetch_batches = int(self.config.get("PREFETCH_BATCHES", 0))
+        self.prefetcher = None
+        self.deserialize_workers = int(self.config.get("DESERIALIZE_WORKERS", 0))
+        self.deserialize_pool = None
+        self.rebalance_start = None
+        self.rebalance_metrics = {"rebalance_time": 0.0, "rebalances": 0}
+        self.commit_manager = None
+        if "COMMIT_MANAGER" in self.config:
+            self.flush_timeout = float(
+                self.config["COMMIT_MANAGER"].get("FLUSH_TIMEOUT", 10)
+            )
+            self.commit_manager = CommitManager(
+                self.consumer,
+                interval=float(self.config["COMMIT_MANAGER"].get("INTERVAL", 5)),
+                max_batches=int(self.config["COMMIT_MANAGER"].get("MAX_BATCHES", 10)),
+            )
 
         self.logger.info(
             f"Creating consumer for {self.config['PARAMS'].get('bootstrap.servers')}"
         )
         self.dynamic_topic = False
-        if self.config.get("TOPICS"):
+        self.backfill = None
+        if "BACKFILL" in self.config:
+            if not self.config.get("TOPICS"):
+                raise Exception("BACKFILL requires a list of TOPICS")
+            self._assign_backfill(self.config["TOPICS"], self.config["BACKFILL"])
+        elif self.config.get("TOPICS"):
             self.logger.info(f'Subscribing to {self.config["TOPICS"]}')
-            self.consumer.subscribe(self.config["TOPICS"])
+            self._subscribe(self.config["TOPICS"])
         elif self.config.get("TOPIC_STRATEGY"):
             self.dynamic_topic = True
             module_name, class_name = self.config["TOPIC_STRATEGY"]["CLASS"].rsplit(
@@ -146,41 +402,174 @@ class KafkaConsumer(GenericConsumer):
             self.topic_strategy = TopicStrategy(
                 **self.config["TOPIC_STRATEGY"]["PARAMS"]
             )
-            self.topics = self.topic_strategy.get_topics()
+            self.topics = list(self.topic_strategy.get_topics())
+            self.topics_version = self.topic_strategy.version
             self.logger.info(f'Using {self.config["TOPIC_STRATEGY"]}')
             self.logger.info(f"Subscribing to {self.topics}")
-            self.consumer.subscribe(self.topics)
+            self._subscribe(self.topics)
         else:
             raise Exception("No topics o topic strategy set. ")
 
     def __del__(self):
+        if not hasattr(self, "logger"):
+            # the config was rejected before anything was created
+            return
         self.logger.info("Shutting down Consumer")
+        if getattr(self, "prefetcher", None):
+            self.prefetcher.stop()
+        if getattr(self, "commit_manager", None):
+            self.commit_manager.flush(self.flush_timeout)
+        if getattr(self, "deserialize_pool", None):
+            self.deserialize_pool.shutdown()
         if hasattr(self, "consumer"):
             self.consumer.close()
 
+    @property
+    def deserializer(self):
+        """Picklable callable that deserializes a raw message value."""
+        return self.decoder.decode
+
     def _deserialize_message(self, message):
-        bytes_io = io.BytesIO(message.value())
-        reader = fastavro.reader(bytes_io)
-        for data in reader:
-            return data
+        return self.decoder.decode(message.value())
+
+    @property
+    def cooperative(self):
+        strategy = self.config["PARAMS"].get("partition.assignment.strategy", "")
+        return strategy == "cooperative-sticky"
+
+    def _subscribe(self, topics):
+        self.rebalance_start = time.monotonic()
+        self.consumer.subscribe(
+            topics,
+            on_assign=self._on_assign,
+            on_revoke=self._on_revoke,
+            on_lost=self._on_lost,
+        )
+
+    def _assign_backfill(self, topics, config):
+        index, count = worker_shard()
+        self.backfill = BackfillRange.resolve(
+            self.consumer,
+            topics,
+            start=config.get("START"),
+            end=config.get("END"),
+            worker_index=int(config.get("WORKER_INDEX", index)),
+            worker_count=int(config.get("WORKER_COUNT", count)),
+            timeout=float(config.get("TIMEOUT", 10)),
+        )
+        partitions = self.backfill.pending_partitions()
+        self.logger.info(
+            f"Backfilling {self.backfill.total} messages from {len(partitions)} partitions"
+        )
+        self.consumer.assign(partitions)
+
+    def _backfill_messages(self, messages):
+        """Drop the messages outside the backfill range and pause finished partitions."""
+        finished = set(self.backfill.finished)
+        kept = []
+        for message in messages:
+            if message.error():
+                if message.error().name() != "_PARTITION_EOF":
+                    kept.append(message)
+            elif self.backfill.accept(message):
+                kept.append(message)
+        pending = self.backfill.pending_partitions()
+        if pending:
+            self.backfill.advance(self.consumer.position(pending))
+        finished = self.backfill.finished - finished
+        if finished:
+            self.logger.info(f"Backfill finished partitions {sorted(finished)}")
+            self.consumer.pause([TopicPartition(*key) for key in finished])
+        return kept
+
+    def _on_assign(self, consumer, partitions):
+        if self.rebalance_start is not None:
+            self.rebalance_metrics["rebalance_time"] = (
+                time.monotonic() - self.rebalance_start
+            )
+            self.rebalance_metrics["rebalances"] += 1
+            self.rebalance_start = None
+        self.logger.info(f"Assigned partitions {partitions}")
+
+    def _on_revoke(self, consumer, partitions):
+        if self.rebalance_start is None:
+            self.rebalance_start = time.monotonic()
+        revoked = {(tp.topic, tp.partition) for tp in partitions}
+        if self.prefetcher:
+            self.logger.info(f"Discarding prefetched messages from {revoked}")
+            self.prefetcher.discard(revoked)
+        if self.commit_manager:
+            self.commit_manager.flush(self.flush_timeout, partitions=revoked)
+
+    def _on_lost(self, consumer, partitions):
+        if self.rebalance_start is None:
+            self.rebalance_start = time.monotonic()
+        lost = {(tp.topic, tp.partition) for tp in partitions}
+        self.logger.warning(f"Lost partitions {lost}")
+        if self.prefetcher:
+            self.prefetcher.discard(lost)
+        if self.commit_manager:
+            self.commit_manager.discard(lost)
+
+    def _on_commit(self, error, partitions):
+        if error:
+            self.logger.error(f"Error committing offsets: {error}")
+
+    def _deserialize_batch(self, messages):
+        """Deserialize the messages of a batch keeping their order.
+
+        Messages with errors are skipped.
+
+        Returns
+        -------
+        tuple | None
+            Messages without errors, their deserialized values and the decoding metrics,
+            or None if the batch reached a partition EOF.
+        """
+        valid = []
+        for message in messages:
+            if message.error():
+                if message.error().name() == "_PARTITION_EOF":
+                    self.logger.info("PARTITION_EOF: No more messages")
+                    return None
+                self.logger.exception(f"Error in kafka stream: {message.error()}")
+                continue
+            valid.append(message)
+
+        self.decoder.reset_stats()
+        start = time.perf_counter()
+        if self.deserialize_workers > 1 and len(valid) > 1:
+            if self.deserialize_pool is None:
+                self.deserialize_pool = DeserializerPool(
+                    self,
+                    self.deserialize_workers,
+                    self.config.get("DESERIALIZE_POOL", "process"),
+                )
+            deserialized = self.deserialize_pool.map(valid)
+        else:
+            deserialized = [self._deserialize_message(message) for message in valid]
+        metrics = {"decode_time": time.perf_counter() - start, **self.decoder.stats}
+
+        for ds_message, message in zip(deserialized, valid):
+            ds_message["timestamp"] = message.timestamp()[1]
+        return valid, deserialized, metrics
 
     def _check_topics(self):
         """
         Returns true if new topic
         """
-        topics = self.topic_strategy.get_topics()
-        if topics != self.topics:
-            return True
-        return False
+        return self.topic_strategy.has_changed(self.topics_version)
 
     def _subscribe_to_new_topics(self):
         """
         Sets current topic to new topic
         """
-        self.topics = self.topic_strategy.get_topics()
-        self.consumer.unsubscribe()
+        self.topics = list(self.topic_strategy.get_topics())
+        self.topics_version = self.topic_strategy.version
+        if not self.cooperative:
+            self.consumer.unsubscribe()
         self.logger.info(f"Suscribing to {self.topics}")
-        self.consumer.subscribe(self.topics)
+        self._subscribe(self.topics)
 
     def set_basic_config(self, num_messages, timeout):
         if "consume.messages" in self.config:
@@ -204,6 +593,8 @@ class KafkaConsumer(GenericConsumer):
 
         If num_messages = 1 then it returns dict.
 
+        If `BATCH_FORMAT` is `"arrow"` it returns a :class:`pyarrow.RecordBatch`.
+
         Parameters
         ----------
         num_messages: int
@@ -214,44 +605,188 @@ class KafkaConsumer(GenericConsumer):
         """
         num_messages, timeout = self.set_basic_config(num_messages, timeout)
 
-        messages = []
+        batches = self._iter_batches(num_messages, timeout)
+        if self.prefetch_batches > 0:
+            self.prefetcher = BatchPrefetcher(batches, self.prefetch_batches)
+            self.prefetcher.start()
+            batches = self.prefetcher
+        try:
+            for messages, deserialized, metrics in batches:
+                self.messages = messages
+                self.batch_metrics = metrics
+                if self.partition_metrics:
+                    self.partition_metrics.observe(messages)
+                if self.batch_format == "arrow":
+                    yield to_record_batch(deserialized)
+                elif num_messages == 1 and self.adaptive_batch is None:
+                    yield deserialized[0]
+                else:
+                    yield deserialized
+        finally:
+            if self.prefetcher:
+                self.prefetcher.stop()
+                self.prefetcher = None
+
+    def _iter_batches(self, num_messages, timeout):
         while True:
+            if self.backfill and self.backfill.done:
+                self.logger.info("Backfill finished")
+                return
             if self.dynamic_topic:
                 if self._check_topics():
                     self._subscribe_to_new_topics()
 
+            if self.adaptive_batch:
+                num_messages = self.adaptive_batch.size
             messages = self.consumer.consume(num_messages=num_messages, timeout=timeout)
+            if self.backfill:
+                messages = self._backfill_messages(messages)
             if len(messages) == 0:
+                if self.commit_manager:
+                    # commit delivered offsets while no messages arrive
+                    self.commit_manager.maybe_commit()
                 continue
 
-            deserialized = []
-            for message in messages:
-                if message.error():
-                    if message.error().name() == "_PARTITION_EOF":
-                        self.logger.info("PARTITION_EOF: No more messages")
-                        return
-                    self.logger.exception(f"Error in kafka stream: {message.error()}")
-                    continue
-                else:
-                    ds_message = self._deserialize_message(message)
-                    ds_message["timestamp"] = message.timestamp()[1]
-                    deserialized.append(ds_message)
-
-            self.messages = messages
-            messages = []
-            if len(deserialized) > 0:
-                if num_messages == 1:
-                    yield deserialized[0]
-                else:
-                    yield deserialized
+            batch = self._deserialize_batch(messages)
+            if batch is None:
+                return
+            if len(batch[0]) > 0:
+                yield batch
+
+    def get_metrics(self):
+        """Decoding metrics of the last consumed batch and rebalance metrics.
+
+        Returns
+        -------
+        dict
+            Total seconds spent deserializing messages, schema cache hits and misses, duration
+            of the last rebalance, number of rebalances, with `ADAPTIVE_BATCH` the number
+            of messages requested on the next poll, with `PARTITION_METRICS` the metrics
+            of each partition when they are refreshed and, with `BACKFILL`, its progress.
+        """
+        metrics = {**self.batch_metrics, **self.rebalance_metrics}
+        if self.adaptive_batch:
+            metrics["batch_size"] = self.adaptive_batch.size
+        if self.backfill:
+            metrics.update(self.backfill.metrics())
+        if self.partition_metrics and self.partition_metrics.due:
+            metrics["partitions"] = self.partition_metrics.refresh(self.consumer)
+        return metrics
+
+    def pause(self):
+        """Pause fetching from every assigned partition.
+
+        The consumer keeps its group membership as long as it is polled before
+        *max.poll.interval.ms* expires, by :py:meth:`keep_alive` or a prefetch thread.
+        """
+        self.consumer.pause(self.consumer.assignment())
+
+    def keep_alive(self):
+        """Poll the paused consumer so it stays in its group and commit delivered offsets.
+
+        Paused partitions return no messages. A message of a partition assigned while
+        paused is rewound and its partition paused, so it is consumed again after
+        :py:meth:`resume`. Nothing is polled while a prefetch thread polls the consumer.
+        """
+        if self.prefetcher is None:
+            message = self.consumer.poll(0)
+            if message is not None and not message.error():
+                self.consumer.seek(
+                    TopicPartition(
+                        message.topic(), message.partition(), message.offset()
+                    )
+                )
+                self.pause()
+        if self.commit_manager:
+            self.commit_manager.maybe_commit()
+
+    def resume(self):
+        if self.backfill:
+            self.consumer.resume(self.backfill.pending_partitions())
+            return
+        self.consumer.resume(self.consumer.assignment())
+
+    def report_execution_time(self, n_messages, execution_time):
+        if self.adaptive_batch:
+            self.adaptive_batch.update(n_messages, execution_time)
+
+    def _message_offsets(self):
+        """Next offset to consume for each partition of the last batch handed to the step."""
+        offsets = {}
+        for message in self.messages:
+            key = (message.topic(), message.partition())
+            offsets[key] = max(offsets.get(key, 0), message.offset() + 1)
+        return offsets
+
+    def _batch_offsets(self):
+        """Offsets to commit for the last batch handed to the step.
+
+        Only partitions still assigned to the consumer are included.
+        """
+        return self._assigned_offsets(self._message_offsets())
+
+    def _assigned_offsets(self, offsets):
+        assigned = {(tp.topic, tp.partition) for tp in self.consumer.assignment()}
+        return [
+            TopicPartition(topic, partition, offset)
+            for (topic, partition), offset in offsets.items()
+            if (topic, partition) in assigned
+        ]
+
+    @property
+    def delivery_aware_commit(self):
+        return self.commit_manager is not None
+
+    def commit_delivered(self, producer):
+        """Commit the last batch once the producer delivers its outputs.
+
+        With a transactional producer the batch offsets are committed in the producer
+        transaction. Otherwise they are registered in the commit manager.
+
+        Parameters
+        ----------
+        producer: :class:`apf.producers.GenericProducer`
+            Producer of the batch outputs.
+        """
+        if producer.transactional:
+            producer.commit_transaction(
+                self._batch_offsets(), self.consumer.consumer_group_metadata()
+            )
+        elif self.commit_manager:
+            self.commit_manager.add(
+                self._message_offsets(), producer, producer.end_batch()
+            )
+        else:
+            self.commit()
+
+    def consumed_offsets(self):
+        return [
+            ((message.topic(), message.partition()), message.offset())
+            for message in self.messages
+        ]
+
+    def commit_offsets(self, offsets):
+        offsets = self._assigned_offsets(offsets)
+        if offsets:
+            self._commit(offsets)
 
     def commit(self):
+        offsets = None
+        if self.prefetch_batches > 0 or self.backfill:
+            offsets = self._batch_offsets()
+            if not offsets:
+                return
+        self._commit(offsets)
+
+    def _commit(self, offsets):
         retries = 0
         commited = False
-
         while not commited:
             try:
-                self.consumer.commit(asynchronous=False)
+                if offsets is None:
+                    self.consumer.commit(asynchronous=False)
+                else:
+                    self.consumer.commit(offsets=offsets, asynchronous=False)
                 commited = True
             except KafkaException as e:
                 retries += 1
@@ -265,6 +800,10 @@ class KafkaJsonConsumer(KafkaConsumer):
     def __init__(self, config):
         super().__init__(config)
 
+    @property
+    def deserializer(self):
+        return json.loads
+
     def _deserialize_message(self, message):
         msg_value = message.value()
         data = json.loads(msg_value)
@@ -275,14 +814,61 @@ class KafkaSchemalessConsumer(KafkaConsumer):
     def __init__(self, config: dict):
         schema_path = config.get("SCHEMA_PATH")
         if schema_path:
-            self.schema = fastavro.schema.load_schema(schema_path)
+            self.schema = load_schema(schema_path)
         else:
             raise Exception("No Schema path provided")
 
         super().__init__(config)
 
+    @property
+    def deserializer(self):
+        return functools.partial(_schemaless_deserialize, schema=self.schema)
+
     def _deserialize_message(self, message):
-        bytes_io = io.BytesIO(message.value())
-        data = fastavro.schemaless_reader(bytes_io, self.schema)
+        return _schemaless_deserialize(message.value(), self.schema)
 
-        return data
+
+class KafkaRegistryConsumer(KafkaConsumer):
+    """Kafka consumer of messages in the schema registry wire format.
+
+    Each message value is a zero magic byte and a 4 bytes big-endian schema id followed by a
+    schemaless Avro record, as written by :class:`apf.producers.KafkaRegistryProducer`. Writer
+    schemas are fetched from the registry once and the `SCHEMA_CACHE_SIZE` most recently used
+    ones are kept parsed in memory. `READER_SCHEMA` and `FIELDS` are supported as in
+    :class:`KafkaConsumer`.
+
+    Parameters
+    ----------
+    SCHEMA_REGISTRY: dict
+        Registry client, with the *CLASS* path of a
+        :class:`apf.core.schema_registry.GenericSchemaRegistry` and its *PARAMS*.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            CONSUMER_CONFIG = { ...
+                "CLASS": "apf.consumers.KafkaRegistryConsumer",
+                "SCHEMA_REGISTRY": {
+                    "CLASS": "apf.core.schema_registry.ConfluentSchemaRegistry",
+                    "PARAMS": {"url": "http://schema-registry:8081"},
+                },
+            }
+    """
+
+    def __init__(self, config):
+        if not config.get("SCHEMA_REGISTRY"):
+            raise Exception("No SCHEMA_REGISTRY provided")
+        super().__init__(config)
+        self.decoder = WireFormatDecoder(
+            load_registry(self.config["SCHEMA_REGISTRY"]),
+            cache_size=int(self.config.get("SCHEMA_CACHE_SIZE", 8)),
+            reader_schema=self.config.get("READER_SCHEMA"),
+            fields=self.config.get("FIELDS"),
+        )
+
+
+def _schemaless_deserialize(value, schema):
+    bytes_io = io.BytesIO(value)
+    return fastavro.schemaless_reader(bytes_io, schema)
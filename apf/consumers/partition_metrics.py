@@ -0,0 +1,96 @@
+from confluent_kafka import KafkaException, TopicPartition
+
+import time
+
+
+class PartitionMetrics:
+    """Accumulate consumption metrics of each topic partition between refreshes.
+
+    Consumed batches are counted in memory with :py:meth:`observe`. Every `interval` seconds
+    :py:meth:`refresh` turns the counters into rates and computes the lag of each partition
+    from its last consumed offset and the high watermark cached by the consumer on its last
+    fetch, so no request is sent to the brokers. Partitions no longer assigned are dropped.
+
+    Parameters
+    ----------
+    interval: float
+        Minimum seconds between refreshes.
+    """
+
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self.last_refresh = time.monotonic()
+        self.offsets = {}
+        self._reset()
+
+    def _reset(self):
+        self.messages = {}
+        self.bytes = {}
+        self.sizes = {}
+
+    def observe(self, messages):
+        """Count a batch of consumed messages.
+
+        Parameters
+        ----------
+        messages: list
+            :class:`confluent_kafka.Message` objects without errors.
+        """
+        for message in messages:
+            key = (message.topic(), message.partition())
+            value = message.value()
+            size = len(value) if value is not None else 0
+            self.messages[key] = self.messages.get(key, 0) + 1
+            self.bytes[key] = self.bytes.get(key, 0) + size
+            self.sizes.setdefault(key, []).append(size)
+            self.offsets[key] = max(self.offsets.get(key, -1), message.offset())
+
+    @property
+    def due(self):
+        return time.monotonic() - self.last_refresh >= self.interval
+
+    def _lag(self, consumer, key, offset):
+        try:
+            _, high = consumer.get_watermark_offsets(TopicPartition(*key), cached=True)
+        except KafkaException:
+            return None
+        if high is None or high < 0:
+            return None
+        return max(0, high - offset - 1)
+
+    def refresh(self, consumer):
+        """Compute the metrics of each assigned partition consumed at least once.
+
+        Parameters
+        ----------
+        consumer: :class:`confluent_kafka.Consumer`
+            Consumer whose cached high watermarks are used for the lag.
+
+        Returns
+        -------
+        list
+            A dict for each partition with its *topic*, *partition*, *lag* (None if the
+            high watermark is unknown), *messages_per_second*, *bytes_per_second* and the
+            *message_sizes* in bytes of the messages consumed.
+        """
+        now = time.monotonic()
+        elapsed = max(now - self.last_refresh, 1e-9)
+        assigned = {(tp.topic, tp.partition) for tp in consumer.assignment()}
+        self.offsets = {
+            key: offset for key, offset in self.offsets.items() if key in assigned
+        }
+        partitions = []
+        for key, offset in self.offsets.items():
+            partitions.append(
+                {
+                    "topic": key[0],
+                    "partition": key[1],
+                    "lag": self._lag(consumer, key, offset),
+                    "messages_per_second": self.messages.get(key, 0) / elapsed,
+                    "bytes_per_second": self.bytes.get(key, 0) / elapsed,
+                    "message_sizes": self.sizes.get(key, []),
+                }
+            )
+        self._reset()
+        self.last_refresh = now
+        return partitions
@@ -0,0 +1,108 @@
+import logging
+import queue
+import threading
+
+_END = object()
+
+
+class BatchPrefetcher:
+    """Poll and deserialize Kafka batches on a background thread.
+
+    The thread iterates the consumer's batch generator and keeps up to `max_batches` decoded
+    batches in a bounded queue, so polling and deserialization overlap the step execution.
+    Batches are handed to the step in the order they were polled.
+
+    Parameters
+    ----------
+    batches: Iterator
+        Iterator of ``(messages, deserialized, metrics)`` batches run on the background thread.
+    max_batches: int
+        Maximum number of decoded batches waiting in the queue.
+    """
+
+    def __init__(self, batches, max_batches):
+        self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
+        self.batches = batches
+        self.queue = queue.Queue(maxsize=max_batches)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name="apf-prefetch", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for batch in self.batches:
+                if not self._put(batch):
+                    return
+        except Exception as error:
+            self.logger.debug("Error while prefetching batches")
+            self._put(error)
+            return
+        self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def discard(self, partitions):
+        """Drop queued messages from partitions that are no longer assigned.
+
+        They were not committed, so they will be consumed again by the partition's new owner.
+
+        Parameters
+        ----------
+        partitions: set
+            ``(topic, partition)`` tuples to discard.
+        """
+        pending = []
+        while True:
+            try:
+                pending.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in pending:
+            if isinstance(item, tuple):
+                item = self._filter_batch(item, partitions)
+                if item is None:
+                    continue
+            self._put(item)
+
+    def _filter_batch(self, batch, partitions):
+        messages, deserialized, metrics = batch
+        kept = [
+            (message, ds_message)
+            for message, ds_message in zip(messages, deserialized)
+            if (message.topic(), message.partition()) not in partitions
+        ]
+        if not kept:
+            return None
+        messages, deserialized = map(list, zip(*kept))
+        return messages, deserialized, metrics
+
+    def stop(self):
+        """Stop the background thread, dropping every queued batch."""
+        self.stop_event.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
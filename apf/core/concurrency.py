@@ -0,0 +1,125 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import zlib
+
+
+class OffsetTracker:
+    """Track offsets completed out of order and tell which ones can be committed.
+
+    Offsets are registered in consumption order when they are dispatched and marked as
+    completed in any order. Only the contiguous prefix of completed offsets of each
+    partition is committable, so an offset is never committed while an earlier one of the
+    same partition is still being processed.
+    """
+
+    def __init__(self):
+        self.dispatched = {}
+        self.completed = {}
+
+    def add(self, offsets):
+        """Register dispatched offsets.
+
+        Parameters
+        ----------
+        offsets: list
+            ``((topic, partition), offset)`` tuples in consumption order.
+        """
+        for key, offset in offsets:
+            self.dispatched.setdefault(key, deque()).append(offset)
+            self.completed.setdefault(key, set())
+
+    def complete(self, offsets):
+        """Mark dispatched offsets as completed.
+
+        Parameters
+        ----------
+        offsets: list
+            ``((topic, partition), offset)`` tuples.
+        """
+        for key, offset in offsets:
+            self.completed[key].add(offset)
+
+    def committable(self):
+        """Pop the contiguous completed offsets of each partition.
+
+        Returns
+        -------
+        dict
+            Next offset to consume by ``(topic, partition)``, only for partitions that
+            advanced since the last call.
+        """
+        offsets = {}
+        for key, dispatched in self.dispatched.items():
+            completed = self.completed[key]
+            while dispatched and dispatched[0] in completed:
+                offset = dispatched.popleft()
+                completed.remove(offset)
+                offsets[key] = offset + 1
+        return offsets
+
+    def __len__(self):
+        return sum(len(dispatched) for dispatched in self.dispatched.values())
+
+
+class KeyAffineExecutor:
+    """Run tasks on single threaded workers chosen by a message key.
+
+    Messages with the same key are always sent to the same worker, which runs its tasks in
+    submission order, so the order of each key is kept while different keys run in
+    parallel.
+
+    Parameters
+    ----------
+    workers: int
+        Number of worker threads.
+    key_field: str
+        Message field used to choose the worker.
+    """
+
+    def __init__(self, workers, key_field):
+        if workers < 1:
+            raise ValueError("Concurrent execution needs at least one worker")
+        self.key_field = key_field
+        self.executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"apf-worker-{i}")
+            for i in range(workers)
+        ]
+        self.futures = set()
+
+    def worker_for(self, message):
+        """Index of the worker of a message, stable across processes."""
+        key = str(message.get(self.key_field)).encode()
+        return zlib.crc32(key) % len(self.executors)
+
+    def split(self, messages):
+        """Group the positions of a batch of messages by worker keeping their order.
+
+        Parameters
+        ----------
+        messages: list
+            Dict-like messages.
+
+        Returns
+        -------
+        dict
+            Positions of the messages of each worker index.
+        """
+        groups = {}
+        for position, message in enumerate(messages):
+            groups.setdefault(self.worker_for(message), []).append(position)
+        return groups
+
+    def submit(self, worker, fn, *args):
+        future = self.executors[worker].submit(fn, *args)
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    def shutdown(self, wait=True):
+        """Stop the workers, cancelling the tasks not started yet unless `wait` is set."""
+        if not wait:
+            for future in list(self.futures):
+                future.cancel()
+        for executor in self.executors:
+            executor.shutdown(wait=wait)
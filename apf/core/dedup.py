@@ -0,0 +1,186 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+
+
+class GenericDeduplicator(ABC):
+    """Remember the keys of processed messages to suppress duplicates.
+
+    Keys are checked with :py:meth:`contains` when a batch is consumed and only added with
+    :py:meth:`add` once the batch outputs are produced, so a batch that fails is processed
+    again when it is replayed.
+
+    Parameters
+    ----------
+    path: str | None
+        File where the state is saved with :py:meth:`save` and loaded when created. The
+        state is stored as plain data, never as pickled objects, and a file that can't be
+        read is ignored.
+    """
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
+        self.path = path
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            try:
+                self._set_state(data)
+            except (ValueError, KeyError) as e:
+                self.logger.warning(f"Ignoring invalid deduplication state {path}: {e}")
+
+    @abstractmethod
+    def contains(self, key) -> bool:
+        pass
+
+    @abstractmethod
+    def add(self, keys):
+        pass
+
+    @abstractmethod
+    def _get_state(self) -> bytes:
+        pass
+
+    @abstractmethod
+    def _set_state(self, data: bytes):
+        pass
+
+    def save(self):
+        """Write the state to `path` atomically."""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._get_state())
+        os.replace(tmp_path, self.path)
+
+
+class LRUDeduplicator(GenericDeduplicator):
+    """Exact deduplication of the `capacity` most recently processed keys.
+
+    Parameters
+    ----------
+    capacity: int
+        Maximum number of keys remembered.
+    path: str | None
+        JSON file where the keys are persisted, only string and number keys are saved.
+    """
+
+    def __init__(self, capacity=1_000_000, path=None):
+        self.capacity = capacity
+        self.keys = OrderedDict()
+        super().__init__(path)
+
+    def contains(self, key):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        return False
+
+    def add(self, keys):
+        for key in keys:
+            self.keys[key] = None
+            self.keys.move_to_end(key)
+        while len(self.keys) > self.capacity:
+            self.keys.popitem(last=False)
+
+    def _get_state(self):
+        keys = [key for key in self.keys if isinstance(key, (str, int, float))]
+        return json.dumps(keys).encode()
+
+    def _set_state(self, data):
+        keys = json.loads(data)
+        if not isinstance(keys, list):
+            raise ValueError("LRU state must be a list of keys")
+        self.keys = OrderedDict.fromkeys(keys[-self.capacity :])
+
+
+class BloomDeduplicator(GenericDeduplicator):
+    """Approximate deduplication of the keys processed in a time window.
+
+    Two Bloom filters sized for `capacity` keys and `error_rate` false positives are used,
+    keys are added to the current one and looked up in both. Every `window` seconds the
+    older filter is dropped, so keys are remembered between one and two windows. Memory is
+    fixed to about ``2 * -capacity * ln(error_rate) / ln(2) ** 2`` bits.
+
+    Parameters
+    ----------
+    capacity: int
+        Expected number of keys in a window.
+    error_rate: float
+        False positive rate, the fraction of new messages wrongly suppressed.
+    window: float
+        Seconds each filter is used before being rotated.
+    path: str | None
+        File where the filters are persisted, a JSON header line followed by the raw bits
+        of both filters.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, window=86400, path=None):
+        if not 0 < error_rate < 1:
+            raise ValueError("Bloom filter error rate must be between 0 and 1")
+        self.bits = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.window = window
+        self.current = bytearray(math.ceil(self.bits / 8))
+        self.previous = bytearray(len(self.current))
+        self.rotated = time.time()
+        super().__init__(path)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    @staticmethod
+    def _has(bits, positions):
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _rotate(self):
+        now = time.time()
+        if now - self.rotated < self.window:
+            return
+        if now - self.rotated >= 2 * self.window:
+            self.previous = bytearray(len(self.current))
+        else:
+            self.previous = self.current
+        self.current = bytearray(len(self.previous))
+        self.rotated = now
+
+    def contains(self, key):
+        self._rotate()
+        positions = self._positions(key)
+        return self._has(self.current, positions) or self._has(self.previous, positions)
+
+    def add(self, keys):
+        self._rotate()
+        for key in keys:
+            for p in self._positions(key):
+                self.current[p >> 3] |= 1 << (p & 7)
+
+    def _get_state(self):
+        header = {"bits": self.bits, "hashes": self.hashes, "rotated": self.rotated}
+        return b"".join(
+            (json.dumps(header).encode(), b"\n", self.current, self.previous)
+        )
+
+    def _set_state(self, data):
+        header, _, filters = data.partition(b"\n")
+        header = json.loads(header)
+        if (header["bits"], header["hashes"]) != (self.bits, self.hashes):
+            return
+        size = len(self.current)
+        if len(filters) != 2 * size:
+            raise ValueError("Bloom filters don't match their size")
+        self.current = bytearray(filters[:size])
+        self.previous = bytearray(filters[size:])
+        self.rotated = float(header["rotated"])
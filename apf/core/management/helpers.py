@@ -73,6 +73,91 @@ def new_step(name):
         f.write(settings_template.render(step_name=name))
 
 
+def _load_settings(settings_path):
+    import importlib.util
+    import sys
+
+    settings_path = os.path.abspath(settings_path)
+    sys.path.insert(0, os.path.dirname(settings_path))
+    spec = importlib.util.spec_from_file_location("settings", settings_path)
+    settings = importlib.util.module_from_spec(spec)
+    sys.modules["settings"] = settings
+    spec.loader.exec_module(settings)
+    return settings
+
+
+def _set_logger():
+    import logging
+
+    level = logging.DEBUG if os.getenv("LOGGING_DEBUG") else logging.INFO
+    logger = logging.getLogger("alerce")
+    logger.setLevel(level)
+    fmt = logging.Formatter(
+        "%(asctime)s %(levelname)7s %(name)36s: %(message)s", "%Y-%m-%d %H:%M:%S"
+    )
+    handler = logging.StreamHandler()
+    handler.setFormatter(fmt)
+    handler.setLevel(level)
+    logger.addHandler(handler)
+
+
+@cli.command()
+@click.argument("step_class")
+@click.option(
+    "--settings",
+    "settings_path",
+    default="settings.py",
+    show_default=True,
+    help="Settings file with the STEP_CONFIG.",
+)
+@click.option(
+    "--workers", default=1, show_default=True, help="Number of worker processes."
+)
+@click.option(
+    "--restart-delay",
+    default=1.0,
+    show_default=True,
+    help="Seconds before restarting a crashed worker.",
+)
+@click.option(
+    "--prometheus-port",
+    default=8000,
+    show_default=True,
+    help="Port serving the aggregated metrics if PROMETHEUS is set in the settings.",
+)
+def run(step_class, settings_path, workers, restart_delay, prometheus_port):
+    """Run STEP_CLASS (i.e. my_step.MyStep) in several worker processes.
+
+    Settings and the step are imported once and then each worker is forked with its own
+    consumer, crashed workers are restarted.
+    """
+    import sys
+    import tempfile
+
+    _set_logger()
+    settings = _load_settings(settings_path)
+    prometheus = bool(getattr(settings, "PROMETHEUS", False))
+    if prometheus and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        if "prometheus_client" in sys.modules:
+            raise click.ClickException(
+                "Set PROMETHEUS_MULTIPROC_DIR to aggregate the metrics of the workers"
+            )
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="apf_")
+
+    from apf.core import get_class
+    from apf.core.supervisor import StepSupervisor
+
+    supervisor = StepSupervisor(
+        get_class(step_class),
+        settings.STEP_CONFIG,
+        workers,
+        restart_delay=restart_delay,
+        prometheus=prometheus,
+        prometheus_port=prometheus_port if prometheus else None,
+    )
+    supervisor.run()
+
+
 @cli.command()
 @click.argument("input")
 @click.argument("output")
@@ -0,0 +1,179 @@
+from collections import OrderedDict
+
+import fastavro
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+def fingerprint(schema):
+    """SHA-256 fingerprint of a schema's canonical JSON.
+
+    The canonical JSON sorts the keys and drops whitespace, so equal schemas written with a
+    different key order or formatting share a fingerprint. Unlike the Avro parsing canonical
+    form, defaults and docs are kept, since defaults change how records are decoded.
+
+    Parameters
+    ----------
+    schema: dict | list | str
+        Avro schema.
+    """
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class SchemaCache:
+    """Parsed Avro schemas shared by every APF component of the process.
+
+    Schemas are parsed once and looked up by :func:`fingerprint`, schema files by their
+    absolute path and modification time. Lookups are thread safe and counted in
+    :py:attr:`stats`.
+
+    Writer schemas fetched from a registry and their projections go through the cache too,
+    so at most `max_size` schemas and `max_size` schema files are kept, dropping the least
+    recently used ones.
+
+    Parameters
+    ----------
+    max_size: int
+        Maximum number of schemas, and of schema files, kept in memory.
+    """
+
+    def __init__(self, max_size=256):
+        self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.schemas = OrderedDict()
+        self.files = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, cache, key):
+        with self.lock:
+            parsed = cache.get(key)
+            if parsed is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            cache.move_to_end(key)
+            return parsed
+
+    def _put(self, cache, key, parsed):
+        with self.lock:
+            parsed = cache.setdefault(key, parsed)
+            cache.move_to_end(key)
+            if len(cache) > self.max_size:
+                cache.popitem(last=False)
+            return parsed
+
+    def parse_schema(self, schema):
+        """Get a parsed schema, parsing it only the first time it is seen.
+
+        Parameters
+        ----------
+        schema: dict | list | str
+            Avro schema. Schemas already parsed by fastavro are returned as they are.
+        """
+        if isinstance(schema, dict) and "__fastavro_parsed" in schema:
+            return schema
+        key = fingerprint(schema)
+        parsed = self._get(self.schemas, key)
+        if parsed is None:
+            parsed = self._put(self.schemas, key, fastavro.parse_schema(schema))
+        return parsed
+
+    def load_schema(self, path):
+        """Get the parsed schema of an `.avsc` file, loading it again only if it changed.
+
+        Named types referenced from other files in the same directory are resolved as
+        with :func:`fastavro.schema.load_schema`.
+        """
+        path = os.path.abspath(path)
+        key = (path, os.stat(path).st_mtime_ns)
+        parsed = self._get(self.files, key)
+        if parsed is None:
+            parsed = self._put(self.files, key, fastavro.schema.load_schema(path))
+        return parsed
+
+    def warm_up(self, schemas):
+        """Parse schemas ahead of their first use.
+
+        Parameters
+        ----------
+        schemas: list
+            Avro schemas or paths to `.avsc` files.
+
+        Returns
+        -------
+        int
+            Number of schemas loaded.
+        """
+        for schema in schemas:
+            if isinstance(schema, str) and os.path.isfile(schema):
+                self.load_schema(schema)
+            else:
+                self.parse_schema(schema)
+        self.logger.info(f"Schema cache warmed up with {len(schemas)} schemas")
+        return len(schemas)
+
+    @property
+    def stats(self):
+        """Cache hits, misses and number of parsed schemas."""
+        with self.lock:
+            return {
+                "schema_lookups_hits": self.hits,
+                "schema_lookups_misses": self.misses,
+                "schemas_cached": len(self.schemas) + len(self.files),
+            }
+
+    def clear(self):
+        with self.lock:
+            self.schemas = OrderedDict()
+            self.files = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+
+
+schema_cache = SchemaCache()
+
+
+def parse_schema(schema):
+    """Parse a schema through the process :class:`SchemaCache`."""
+    return schema_cache.parse_schema(schema)
+
+
+def load_schema(path):
+    """Load a schema file through the process :class:`SchemaCache`."""
+    return schema_cache.load_schema(path)
+
+
+def step_schemas(config):
+    """Avro schemas and schema files referenced by a step config.
+
+    Parameters
+    ----------
+    config: dict
+        `STEP_CONFIG` of a step.
+
+    Returns
+    -------
+    list
+        Producer `SCHEMA`, consumer `SCHEMA_PATH` and `READER_SCHEMA` values found.
+    """
+    schemas = []
+    for section, keys in (
+        ("PRODUCER_CONFIG", ("SCHEMA",)),
+        ("CONSUMER_CONFIG", ("SCHEMA_PATH", "READER_SCHEMA")),
+    ):
+        for key in keys:
+            value = config.get(section, {}).get(key)
+            if value is not None:
+                schemas.append(value)
+    return schemas
+
+
+def warm_up(schemas):
+    """Load schemas in the process :class:`SchemaCache` ahead of their first use."""
+    return schema_cache.warm_up(schemas)
@@ -0,0 +1,226 @@
+from abc import ABC, abstractmethod
+from apf.core import get_class
+
+import base64
+import json
+import os
+import struct
+import urllib.parse
+import urllib.request
+
+MAGIC_BYTE = 0
+WIRE_HEADER = struct.Struct(">bI")
+
+
+def pack_header(schema_id):
+    """Build the Confluent wire format header: a zero magic byte and a big-endian schema id.
+
+    Parameters
+    ----------
+    schema_id: int
+        Id of the writer schema in the registry.
+
+    Returns
+    -------
+    bytes
+        Header to be prepended to the schemaless Avro payload.
+    """
+    return WIRE_HEADER.pack(MAGIC_BYTE, schema_id)
+
+
+def unpack_header(payload):
+    """Read the schema id of a Confluent wire format payload.
+
+    Parameters
+    ----------
+    payload: bytes
+        Message value in the wire format.
+
+    Returns
+    -------
+    int
+        Id of the writer schema. The schemaless payload starts at ``WIRE_HEADER.size``.
+    """
+    if len(payload) < WIRE_HEADER.size or payload[0] != MAGIC_BYTE:
+        raise ValueError("Payload is not in the schema registry wire format")
+    return WIRE_HEADER.unpack_from(payload)[1]
+
+
+def _canonical(schema):
+    return json.dumps(schema, sort_keys=True, separators=(",", ":"))
+
+
+class GenericSchemaRegistry(ABC):
+    """Registry client mapping schema ids to Avro schemas.
+
+    Registries are configured with a `SCHEMA_REGISTRY` dict in the consumer or producer
+    config, where *CLASS* is the registry class and *PARAMS* are passed to its constructor.
+    They must be picklable to be used with process deserialization pools.
+    """
+
+    @abstractmethod
+    def get_schema(self, schema_id):
+        """Get the schema registered with an id.
+
+        Parameters
+        ----------
+        schema_id: int
+            Id of the schema.
+
+        Returns
+        -------
+        dict
+            Schema definition, not parsed.
+        """
+        pass
+
+    @abstractmethod
+    def register(self, subject, schema):
+        """Register a schema under a subject, returning the id of an identical schema if any.
+
+        Parameters
+        ----------
+        subject: str
+            Subject of the schema.
+        schema: dict
+            Schema definition, not parsed.
+
+        Returns
+        -------
+        int
+            Id of the schema.
+        """
+        pass
+
+
+class MemorySchemaRegistry(GenericSchemaRegistry):
+    """Registry kept in memory, useful for tests.
+
+    Parameters
+    ----------
+    schemas: dict | None
+        Initial schemas by id.
+    """
+
+    def __init__(self, schemas=None):
+        self.schemas = {int(k): v for k, v in (schemas or {}).items()}
+        self.subjects = {}
+
+    def get_schema(self, schema_id):
+        try:
+            return self.schemas[schema_id]
+        except KeyError:
+            raise KeyError(f"Schema {schema_id} not found")
+
+    def register(self, subject, schema):
+        canonical = _canonical(schema)
+        for schema_id, registered in self.schemas.items():
+            if _canonical(registered) == canonical:
+                break
+        else:
+            schema_id = max(self.schemas, default=0) + 1
+            self.schemas[schema_id] = schema
+        self.subjects.setdefault(subject, [])
+        if schema_id not in self.subjects[subject]:
+            self.subjects[subject].append(schema_id)
+        return schema_id
+
+
+class FileSchemaRegistry(GenericSchemaRegistry):
+    """Registry stored in a directory with one ``<id>.avsc`` file for each schema.
+
+    Parameters
+    ----------
+    path: str
+        Directory with the schema files. It is created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _schema_path(self, schema_id):
+        return os.path.join(self.path, f"{schema_id}.avsc")
+
+    def _ids(self):
+        return sorted(
+            int(name[: -len(".avsc")])
+            for name in os.listdir(self.path)
+            if name.endswith(".avsc") and name[: -len(".avsc")].isdigit()
+        )
+
+    def get_schema(self, schema_id):
+        try:
+            with open(self._schema_path(schema_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"Schema {schema_id} not found in {self.path}")
+
+    def register(self, subject, schema):
+        canonical = _canonical(schema)
+        ids = self._ids()
+        for schema_id in ids:
+            if _canonical(self.get_schema(schema_id)) == canonical:
+                return schema_id
+        schema_id = (ids[-1] if ids else 0) + 1
+        with open(self._schema_path(schema_id), "w") as f:
+            json.dump(schema, f)
+        return schema_id
+
+
+class ConfluentSchemaRegistry(GenericSchemaRegistry):
+    """Client of a Confluent Schema Registry REST API.
+
+    Parameters
+    ----------
+    url: str
+        Base url of the registry, i.e. ``http://schema-registry:8081``.
+    basic_auth: str | None
+        ``<user>:<password>`` credentials.
+    timeout: float
+        Seconds to wait for each request.
+    """
+
+    def __init__(self, url, basic_auth=None, timeout=10.0):
+        self.url = url.rstrip("/")
+        self.basic_auth = basic_auth
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        headers = {"Accept": "application/vnd.schemaregistry.v1+json"}
+        data = None
+        if body is not None:
+            headers["Content-Type"] = "application/vnd.schemaregistry.v1+json"
+            data = json.dumps(body).encode()
+        if self.basic_auth:
+            token = base64.b64encode(self.basic_auth.encode()).decode()
+            headers["Authorization"] = f"Basic {token}"
+        request = urllib.request.Request(self.url + path, data=data, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def get_schema(self, schema_id):
+        return json.loads(self._request(f"/schemas/ids/{schema_id}")["schema"])
+
+    def register(self, subject, schema):
+        response = self._request(
+            f"/subjects/{urllib.parse.quote(subject, safe='')}/versions",
+            {"schema": json.dumps(schema)},
+        )
+        return response["id"]
+
+
+def load_registry(config):
+    """Create the registry client described by a `SCHEMA_REGISTRY` config.
+
+    Parameters
+    ----------
+    config: dict
+        Dict with the registry *CLASS* path and its *PARAMS*.
+
+    Returns
+    -------
+    :class:`GenericSchemaRegistry`
+        Registry client.
+    """
+    return get_class(config["CLASS"])(**config.get("PARAMS", {}))
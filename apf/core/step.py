@@ -2,13 +2,19 @@ from abc import abstractmethod
 import abc
 from typing import Any, Dict, Iterable, List, Type, Union
 from apf.consumers import GenericConsumer
+from apf.consumers.arrow import is_record_batch, pyarrow
 from apf.metrics.generic import GenericMetricsProducer
 from apf.metrics.prometheus import DefaultPrometheusMetrics, PrometheusMetrics
 from apf.metrics.pyroscope import profile
 from apf.producers import GenericProducer
 from apf.core import get_class
+from apf.core.concurrency import KeyAffineExecutor, OffsetTracker
+from apf.core.dedup import BloomDeduplicator, LRUDeduplicator
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
 import logging
 import datetime
+import time
 
 
 class DefaultConsumer(GenericConsumer):
@@ -45,6 +51,70 @@ class GenericStep(abc.ABC):
 
     **step_args : dict
         Additional parameters for the step.
+
+        Adding `CONCURRENCY` to `STEP_CONFIG` runs :py:meth:`pre_execute` and
+        :py:meth:`execute` on *WORKERS* threads (default 4). Each message is sent to a
+        worker chosen by its *KEY_FIELD* (by default the field set with
+        :py:meth:`set_producer_key_field`), so messages with the same key are processed in
+        order while different keys run in parallel. Up to *MAX_PENDING* groups of messages
+        (default twice the workers) are executed at the same time, and their outputs are
+        post processed and produced as they finish. Only contiguous offsets of finished
+        messages are committed for each partition. Consumers without offsets, like file
+        consumers, commit only when every consumed message is finished. It can't be combined
+        with delivery aware or transactional commits nor with Arrow batches.
+
+        .. code-block:: python
+
+            #settings.py
+            STEP_CONFIG = { ...
+                "CONCURRENCY": {
+                    "WORKERS": 8,
+                    "KEY_FIELD": "oid",
+                },
+            }
+
+        Adding `DEDUPLICATION` to `STEP_CONFIG` drops consumed messages whose *KEY_FIELD*
+        (default `candid`) was already processed, before :py:meth:`pre_execute`. Keys are
+        remembered once the batch outputs are produced, so replayed batches after a
+        rebalance or a restart skip the alerts already processed. *BACKEND* is either
+        `"lru"` (default), an exact LRU of the last *CAPACITY* keys, or `"bloom"`, two
+        rotating Bloom filters remembering about *CAPACITY* keys for each *WINDOW* seconds
+        with an *ERROR_RATE* of messages wrongly suppressed. Setting *PATH* saves the keys
+        to that file every *PERSIST_INTERVAL* seconds (default 60) and on tear down, and
+        loads them when the step starts. Suppressed messages are reported in the step metrics
+        as *suppressed_messages* and in the Prometheus *suppressed_messages* counter.
+
+        .. code-block:: python
+
+            #settings.py
+            STEP_CONFIG = { ...
+                "DEDUPLICATION": {
+                    "KEY_FIELD": "candid",
+                    "BACKEND": "bloom",
+                    "CAPACITY": 2_000_000,
+                    "ERROR_RATE": 0.0001,
+                    "WINDOW": 86400,
+                    "PATH": "/data/dedup.state",
+                },
+            }
+
+        Adding `BACKPRESSURE` to `STEP_CONFIG` pauses the consumer after a batch is produced
+        if the producer has *HIGH_WATERMARK* or more messages waiting to be delivered. The
+        step serves delivery callbacks every *POLL_TIMEOUT* seconds (default 0.1) until the
+        queue drops to *LOW_WATERMARK* (default half the high-water mark) and then resumes
+        the consumer, so memory and latency stay bounded when the output cluster slows down.
+        The paused consumer is kept alive between polls so it stays in its group. After
+        *TIMEOUT* seconds (default 300) the step logs an error and resumes anyway.
+
+        .. code-block:: python
+
+            #settings.py
+            STEP_CONFIG = { ...
+                "BACKPRESSURE": {
+                    "HIGH_WATERMARK": 50000,
+                    "LOW_WATERMARK": 10000,
+                },
+            }
     """
 
     def __init__(
@@ -68,6 +138,34 @@ class GenericStep(abc.ABC):
             self.extra_metrics = self.metrics_config.get("EXTRA_METRICS", ["candid"])
         self.commit = self.config.get("COMMIT", True)
         self.prometheus_metrics = prometheus_metrics
+        self.high_watermark = None
+        if "BACKPRESSURE" in self.config:
+            self.high_watermark = int(self.config["BACKPRESSURE"]["HIGH_WATERMARK"])
+            self.low_watermark = int(
+                self.config["BACKPRESSURE"].get(
+                    "LOW_WATERMARK", self.high_watermark // 2
+                )
+            )
+            if self.low_watermark > self.high_watermark:
+                raise ValueError("LOW_WATERMARK must not exceed HIGH_WATERMARK")
+            self.backpressure_poll = float(
+                self.config["BACKPRESSURE"].get("POLL_TIMEOUT", 0.1)
+            )
+            self.backpressure_timeout = float(
+                self.config["BACKPRESSURE"].get("TIMEOUT", 300)
+            )
+        self.deduplicator = None
+        self.suppressed_messages = 0
+        if "DEDUPLICATION" in self.config:
+            self._set_deduplicator(self.config["DEDUPLICATION"])
+        self.concurrency = self.config.get("CONCURRENCY")
+        if self.concurrency:
+            if self._commit_after_produce:
+                raise ValueError(
+                    "CONCURRENCY can't be used with delivery aware commits"
+                )
+            if self.consumer_config.get("BATCH_FORMAT") == "arrow":
+                raise ValueError("CONCURRENCY can't be used with arrow batches")
 
     @property
     def consumer_config(self):
@@ -87,6 +185,28 @@ class GenericStep(abc.ABC):
             return self.metrics_config["PARAMS"]
         return {}
 
+    @property
+    def _commit_after_produce(self):
+        return self.consumer.delivery_aware_commit or self.producer.transactional
+
+    def _set_deduplicator(self, config: dict):
+        self.dedup_field = config.get("KEY_FIELD", "candid")
+        backend = config.get("BACKEND", "lru")
+        capacity = int(config.get("CAPACITY", 1_000_000))
+        if backend == "lru":
+            self.deduplicator = LRUDeduplicator(capacity, path=config.get("PATH"))
+        elif backend == "bloom":
+            self.deduplicator = BloomDeduplicator(
+                capacity,
+                error_rate=float(config.get("ERROR_RATE", 0.001)),
+                window=float(config.get("WINDOW", 86400)),
+                path=config.get("PATH"),
+            )
+        else:
+            raise ValueError(f"Unknown deduplication backend {backend}")
+        self.dedup_persist_interval = float(config.get("PERSIST_INTERVAL", 60))
+        self.dedup_saved = time.monotonic()
+
     def _set_logger(self):
         self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
         self.logger.info(f"Creating {self.__class__.__name__}")
@@ -168,6 +288,68 @@ class GenericStep(abc.ABC):
         """
         pass
 
+    def _dedup_keys(self, message) -> list:
+        if is_record_batch(message):
+            if self.dedup_field not in message.schema.names:
+                return [None] * len(message)
+            return message.column(self.dedup_field).to_pylist()
+        if isinstance(message, dict):
+            message = [message]
+        return [msg.get(self.dedup_field) for msg in message]
+
+    def _duplicates_mask(self, message) -> List[bool]:
+        """Flag the messages already processed or repeated earlier in the same batch."""
+        seen = set()
+        mask = []
+        for key in self._dedup_keys(message):
+            duplicate = key is not None and (
+                key in seen or self.deduplicator.contains(key)
+            )
+            if key is not None:
+                seen.add(key)
+            mask.append(duplicate)
+        return mask
+
+    def _count_suppressed(self, suppressed: int):
+        if suppressed:
+            self.logger.info(f"Suppressed {suppressed} duplicated messages")
+            self.prometheus_metrics.suppressed_messages.inc(suppressed)
+        self.suppressed_messages += suppressed
+
+    def _suppress_duplicates(self, message):
+        """Drop duplicated messages of a consumed batch.
+
+        Returns
+        -------
+        dict, list, :class:`pyarrow.RecordBatch` or None
+            New messages, or None if every message was a duplicate.
+        """
+        mask = self._duplicates_mask(message)
+        self._count_suppressed(sum(mask))
+        if not any(mask):
+            return message
+        if all(mask):
+            return None
+        if is_record_batch(message):
+            return message.filter(pyarrow.array([not m for m in mask]))
+        return [msg for msg, duplicate in zip(message, mask) if not duplicate]
+
+    def _skip_batch(self):
+        """Commit a consumed batch without processing it."""
+        if not self.commit:
+            return
+        if self._commit_after_produce:
+            self.consumer.commit_delivered(self.producer)
+        else:
+            self.consumer.commit()
+
+    def _remember_processed(self, message):
+        keys = [key for key in self._dedup_keys(message) if key is not None]
+        self.deduplicator.add(keys)
+        if time.monotonic() - self.dedup_saved >= self.dedup_persist_interval:
+            self.deduplicator.save()
+            self.dedup_saved = time.monotonic()
+
     def _pre_execute(self, message: Union[dict, List[dict]]):
         self.logger.info("Received message. Begin preprocessing")
         self.metrics["timestamp_received"] = datetime.datetime.now(
@@ -176,13 +358,16 @@ class GenericStep(abc.ABC):
         if isinstance(message, dict):
             message = [message]
         self.message = message
+        if self.deduplicator:
+            self.metrics["suppressed_messages"] = self.suppressed_messages
+            self.suppressed_messages = 0
         if isinstance(self.message, dict):
             self.prometheus_metrics.consumed_messages.observe(1)
             # tid = self.message.get("tid")
             # if tid:
             #     tid = str(tid).upper()
             #     self.prometheus_metrics.telescope_id.state(tid)
-        if isinstance(self.message, list):
+        if isinstance(self.message, list) or is_record_batch(self.message):
             self.prometheus_metrics.consumed_messages.observe(len(self.message))
             # tid = self.message[0].get("tid")
             # if tid:
@@ -215,8 +400,9 @@ class GenericStep(abc.ABC):
 
         Parameters
         ----------
-        message : dict, list
-            Dict-like message to be processed or list of dict-like messages
+        message : dict, list, :class:`pyarrow.RecordBatch`
+            Dict-like message to be processed, list of dict-like messages or batch
+            consumed with the arrow `BATCH_FORMAT`
         """
         pass
 
@@ -233,17 +419,56 @@ class GenericStep(abc.ABC):
             self.metrics["timestamp_sent"] - self.metrics["timestamp_received"]
         )
         self.metrics["execution_time"] = time_difference.total_seconds()
+        n_messages = 1 if isinstance(self.message, dict) else len(self.message)
+        self.consumer.report_execution_time(n_messages, self.metrics["execution_time"])
+        self.metrics.update(self.producer.get_metrics())
+        consumer_metrics = self.consumer.get_metrics()
+        if "batch_size" in consumer_metrics:
+            self.prometheus_metrics.batch_size.set(consumer_metrics["batch_size"])
+        self.metrics.pop("partitions", None)
+        if "partitions" in consumer_metrics:
+            consumer_metrics["partitions"] = self._report_partition_metrics(
+                consumer_metrics["partitions"]
+            )
+        self.metrics.update(consumer_metrics)
         if self.extra_metrics:
             extra_metrics = self.get_extra_metrics(self.message)
             self.metrics.update(extra_metrics)
         self.send_metrics(**self.metrics)
         if isinstance(self.message, dict):
             self.prometheus_metrics.processed_messages.observe(1)
-        if isinstance(self.message, list):
+        if isinstance(self.message, list) or is_record_batch(self.message):
             self.prometheus_metrics.processed_messages.observe(len(self.message))
         self.prometheus_metrics.execution_time.observe(time_difference.total_seconds())
         return final_result
 
+    def _report_partition_metrics(self, partitions: List[dict]) -> List[dict]:
+        """Export the consumer partition metrics to Prometheus.
+
+        Returns the partition metrics without the message sizes, which are only observed
+        in the Prometheus histogram.
+        """
+        reported = []
+        for metrics in partitions:
+            metrics = dict(metrics)
+            labels = (metrics["topic"], str(metrics["partition"]))
+            sizes = metrics.pop("message_sizes", [])
+            histogram = self.prometheus_metrics.message_size.labels(*labels)
+            for size in sizes:
+                histogram.observe(size)
+            if metrics["lag"] is not None:
+                self.prometheus_metrics.partition_lag.labels(*labels).set(
+                    metrics["lag"]
+                )
+            self.prometheus_metrics.partition_messages_per_second.labels(*labels).set(
+                metrics["messages_per_second"]
+            )
+            self.prometheus_metrics.partition_bytes_per_second.labels(*labels).set(
+                metrics["bytes_per_second"]
+            )
+            reported.append(metrics)
+        return reported
+
     def post_execute(self, result: Union[Iterable[Dict[str, Any]], Dict[str, Any]]):
         """
         Override this method to perform additional operations on
@@ -264,7 +489,7 @@ class GenericStep(abc.ABC):
             self.logger.debug("Error at pre_produce")
             self.logger.debug(f"The result that caused the error: {result}")
             raise error
-        if self.commit:
+        if self.commit and not self._commit_after_produce:
             self.consumer.commit()
         return message_to_produce
 
@@ -280,12 +505,47 @@ class GenericStep(abc.ABC):
 
     def _post_produce(self):
         self.logger.info("Messages produced. Begin post production")
+        if self.commit and self._commit_after_produce:
+            self.consumer.commit_delivered(self.producer)
+        elif self.producer.transactional:
+            self.producer.commit_transaction([], None)
         try:
             self.post_produce()
         except Exception as error:
             self.logger.debug("Error at post_produce")
             raise error
 
+    def _apply_backpressure(self):
+        """Pause the consumer while the producer queue is over the high-water mark.
+
+        Delivery callbacks are served and the consumer kept alive until the queue drains
+        below the low-water mark or the backpressure timeout expires, then the consumer
+        resumes.
+        """
+        if self.high_watermark is None:
+            return
+        if self.producer.queue_length < self.high_watermark:
+            return
+        self.logger.info(
+            f"Producer queue has {self.producer.queue_length} messages. Pausing consumer"
+        )
+        self.consumer.pause()
+        deadline = time.monotonic() + self.backpressure_timeout
+        try:
+            while self.producer.queue_length > self.low_watermark:
+                if time.monotonic() >= deadline:
+                    self.logger.error(
+                        f"Producer queue did not drain in {self.backpressure_timeout} "
+                        f"seconds. Resuming consumer with {self.producer.queue_length} "
+                        "messages waiting"
+                    )
+                    return
+                self.producer.poll(self.backpressure_poll)
+                self.consumer.keep_alive()
+        finally:
+            self.consumer.resume()
+        self.logger.info("Producer queue drained. Resuming consumer")
+
     def post_produce(self):
         """
         Override this method to perform operations after data has been
@@ -347,8 +607,9 @@ class GenericStep(abc.ABC):
 
         Parameters
         ----------
-        message : dict, list
-            Dict-like message to be processed or list of dict-like messages
+        message : dict, list, :class:`pyarrow.RecordBatch`
+            Dict-like message to be processed, list of dict-like messages or batch
+            consumed with the arrow `BATCH_FORMAT`
 
         Returns
         -------
@@ -356,6 +617,23 @@ class GenericStep(abc.ABC):
             Dictionary with extra metrics from the messages.
 
         """
+        # Record batches are read by column.
+        if is_record_batch(message):
+            extra_metrics = {}
+            for metric in self.extra_metrics:
+                key = metric.get("key") if isinstance(metric, dict) else metric
+                if key in message.schema.names:
+                    column = message.column(key).to_pylist()
+                else:
+                    column = [None] * len(message)
+                for value in column:
+                    aliased_metric, value = self.get_value({key: value}, metric)
+                    if aliased_metric not in extra_metrics:
+                        extra_metrics[aliased_metric] = []
+                    extra_metrics[aliased_metric].append(value)
+            extra_metrics["n_messages"] = len(message)
+            return extra_metrics
+
         # Is the message is a list then the metrics are
         # added to an array of values.
         if isinstance(message, list):
@@ -389,19 +667,27 @@ class GenericStep(abc.ABC):
             This parameter can be an iterable or a single message, where the message should be
             a dictionary that matches the output schema of the step.
 
+        Messages are sent with the producer `produce_batch` method when it has one, and
+        the seconds spent producing each batch are observed in the Prometheus
+        *produce_time* summary.
+
         NOTE: If you want to produce with a key, use the set_producer_key_field(key_field)
         method somewhere in the lifecycle of the step prior to the produce state.
         """
-        n_messages = 0
         if isinstance(result, dict):
             to_produce = [result]
         else:
-            to_produce = result
-        for prod_message in to_produce:
-            self.producer.produce(prod_message)
-            n_messages += 1
+            to_produce = list(result)
+        start = time.perf_counter()
+        produce_batch = getattr(self.producer, "produce_batch", None)
+        if produce_batch is not None:
+            produce_batch(to_produce)
+        else:
+            for prod_message in to_produce:
+                self.producer.produce(prod_message)
+        self.prometheus_metrics.produce_time.observe(time.perf_counter() - start)
         if not isinstance(self.producer, DefaultProducer):
-            self.logger.info(f"Produced {n_messages} messages")
+            self.logger.info(f"Produced {len(to_produce)} messages")
 
     def set_producer_key_field(self, key_field: str):
         """
@@ -419,7 +705,16 @@ class GenericStep(abc.ABC):
         logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
         """Start running the step."""
         self._pre_consume()
+        if self.concurrency:
+            self._start_concurrent()
+            self._tear_down()
+            return
         for message in self.consumer.consume():
+            if self.deduplicator:
+                message = self._suppress_duplicates(message)
+                if message is None:
+                    self._skip_batch()
+                    continue
             preprocessed_msg = self._pre_execute(message)
             try:
                 result = self.execute(preprocessed_msg)
@@ -431,8 +726,119 @@ class GenericStep(abc.ABC):
             result = self._pre_produce(result)
             self.produce(result)
             self._post_produce()
+            if self.deduplicator:
+                self._remember_processed(message)
+            self._apply_backpressure()
         self._tear_down()
 
+    def _execute_group(self, messages: List[dict]):
+        try:
+            preprocessed = self.pre_execute(messages)
+        except Exception as error:
+            self.logger.debug("Error at pre_execute")
+            self.logger.debug(f"The message(s) that caused the error: {messages}")
+            raise error
+        try:
+            return self.execute(preprocessed)
+        except Exception as error:
+            self.logger.debug("Error at execute")
+            self.logger.debug(f"The message(s) that caused the error: {messages}")
+            raise error
+
+    def _finish_group(self, group, tracker: OffsetTracker):
+        future, messages, offsets, received = group
+        result = future.result()
+        self.message = messages
+        self.metrics["timestamp_received"] = received
+        if self.deduplicator:
+            self.metrics["suppressed_messages"] = self.suppressed_messages
+            self.suppressed_messages = 0
+        result = self._post_execute(result)
+        self.logger.info("Finished all processing. Begin message production")
+        try:
+            result = self.pre_produce(result)
+        except Exception as error:
+            self.logger.debug("Error at pre_produce")
+            self.logger.debug(f"The result that caused the error: {result}")
+            raise error
+        self.produce(result)
+        tracker.complete(offsets)
+        self._commit_completed(tracker)
+        try:
+            self.post_produce()
+        except Exception as error:
+            self.logger.debug("Error at post_produce")
+            raise error
+        if self.deduplicator:
+            self._remember_processed(messages)
+        self._apply_backpressure()
+
+    def _commit_completed(self, tracker: OffsetTracker):
+        committable = tracker.committable()
+        if not self.commit or not committable:
+            return
+        if (None, None) not in committable:
+            self.consumer.commit_offsets(committable)
+        elif len(tracker) == 0:
+            # without offsets the consumer commits everything consumed so far, only
+            # correct once every consumed message is finished
+            self.consumer.commit()
+
+    def _finish_groups(self, pending: deque, tracker: OffsetTracker, block: bool):
+        if block:
+            wait([group[0] for group in pending], return_when=FIRST_COMPLETED)
+        for group in [group for group in pending if group[0].done()]:
+            pending.remove(group)
+            self._finish_group(group, tracker)
+
+    def _start_concurrent(self):
+        key_field = self.concurrency.get("KEY_FIELD", self.producer.key_field)
+        if key_field is None:
+            raise ValueError("CONCURRENCY requires a KEY_FIELD or a producer key field")
+        workers = int(self.concurrency.get("WORKERS", 4))
+        max_pending = int(self.concurrency.get("MAX_PENDING", 2 * workers))
+        executor = KeyAffineExecutor(workers, key_field)
+        tracker = OffsetTracker()
+        pending = deque()
+        sequence = 0
+        try:
+            for message in self.consumer.consume():
+                received = datetime.datetime.now(datetime.timezone.utc)
+                if is_record_batch(message):
+                    raise ValueError("CONCURRENCY can't be used with arrow batches")
+                messages = [message] if isinstance(message, dict) else message
+                self.logger.info("Received message. Begin preprocessing")
+                self.prometheus_metrics.consumed_messages.observe(len(messages))
+                offsets = self.consumer.consumed_offsets()
+                if offsets is None:
+                    # Without offsets each message is tracked by its consumption order
+                    offsets = [
+                        ((None, None), sequence + i) for i in range(len(messages))
+                    ]
+                    sequence += len(messages)
+                tracker.add(offsets)
+                if self.deduplicator:
+                    mask = self._duplicates_mask(messages)
+                    self._count_suppressed(sum(mask))
+                    tracker.complete(
+                        [offset for offset, dup in zip(offsets, mask) if dup]
+                    )
+                    messages = [m for m, dup in zip(messages, mask) if not dup]
+                    offsets = [o for o, dup in zip(offsets, mask) if not dup]
+                for worker, positions in executor.split(messages).items():
+                    group = [messages[i] for i in positions]
+                    group_offsets = [offsets[i] for i in positions]
+                    future = executor.submit(worker, self._execute_group, group)
+                    pending.append((future, group, group_offsets, received))
+                while len(pending) > max_pending:
+                    self._finish_groups(pending, tracker, block=True)
+                self._finish_groups(pending, tracker, block=False)
+            while pending:
+                self._finish_groups(pending, tracker, block=True)
+            self._commit_completed(tracker)
+        finally:
+            executor.shutdown(wait=not pending)
+
     def _tear_down(self):
         self.logger.info("Processing finished. No more messages. Begin tear down.")
         try:
@@ -440,6 +846,8 @@ class GenericStep(abc.ABC):
         except Exception as error:
             self.logger.debug("Error at tear_down")
             raise error
+        if self.deduplicator:
+            self.deduplicator.save()
         self._write_success()
 
     def _write_success(self):
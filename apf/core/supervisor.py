@@ -0,0 +1,166 @@
+from apf.consumers.backfill import WORKER_COUNT_ENV, WORKER_INDEX_ENV
+from apf.core.schema_cache import step_schemas, warm_up
+
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+
+def _run_worker(step_class, config, prometheus, slot, workers):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    os.environ[WORKER_INDEX_ENV] = str(slot)
+    os.environ[WORKER_COUNT_ENV] = str(workers)
+    kwargs = {}
+    if prometheus:
+        from apf.metrics.prometheus import PrometheusMetrics
+
+        kwargs["prometheus_metrics"] = PrometheusMetrics()
+    step = step_class(config=config, **kwargs)
+    step.start()
+
+
+class StepSupervisor:
+    """Run a step in several forked worker processes and restart the ones that crash.
+
+    The step class and its settings are imported once by the supervisor and the Avro schemas
+    of the settings are parsed in the process schema cache, then the garbage collector is
+    frozen so the imported objects and parsed schemas stay in copy-on-write pages shared by
+    every worker. Each worker creates its own step, so with a :class:`apf.consumers.KafkaConsumer`
+    every worker joins the consumer group of the settings and partitions are balanced
+    between them. Each worker gets its slot and the number of workers in the
+    *APF_WORKER_INDEX* and *APF_WORKER_COUNT* environment variables, used for example to
+    split a Kafka backfill without a consumer group.
+
+    Workers that exit with an error are started again after `restart_delay` seconds, workers
+    that finish consuming are not. With `prometheus` enabled the metrics of every worker are
+    aggregated with the `prometheus_client` multiprocess mode and served by the supervisor.
+
+    Parameters
+    ----------
+    step_class: type
+        :class:`apf.core.step.GenericStep` subclass to run.
+    config: dict
+        `STEP_CONFIG` passed to each step.
+    workers: int
+        Number of worker processes.
+    restart_delay: float
+        Seconds to wait before restarting a crashed worker.
+    prometheus: bool
+        Create a :class:`apf.metrics.prometheus.PrometheusMetrics` in each worker. Requires the
+        *PROMETHEUS_MULTIPROC_DIR* environment variable set before ``prometheus_client`` is
+        imported.
+    prometheus_port: int | None
+        Port where the aggregated metrics are served, disabled if None.
+    """
+
+    def __init__(
+        self,
+        step_class,
+        config,
+        workers,
+        restart_delay=1.0,
+        prometheus=False,
+        prometheus_port=None,
+    ):
+        self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
+        if workers < 1:
+            raise ValueError("A step supervisor needs at least one worker")
+        self.step_class = step_class
+        self.config = config
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.prometheus = prometheus
+        self.prometheus_port = prometheus_port
+        self.context = multiprocessing.get_context("fork")
+        self.processes = [None] * workers
+        self.restarts = 0
+        self.stopping = False
+
+    def _start_worker(self, slot):
+        process = self.context.Process(
+            target=_run_worker,
+            args=(self.step_class, self.config, self.prometheus, slot, self.workers),
+            name=f"{self.step_class.__name__}-{slot}",
+        )
+        process.start()
+        self.processes[slot] = process
+        self.logger.info(f"Started worker {process.name} with pid {process.pid}")
+
+    def _start_metrics_server(self):
+        from prometheus_client import CollectorRegistry, start_http_server
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(self.prometheus_port, registry=registry)
+
+    def _worker_exited(self, process):
+        if self.prometheus:
+            from prometheus_client import multiprocess
+
+            multiprocess.mark_process_dead(process.pid)
+        process.join()
+
+    def stop(self, *args):
+        """Terminate every worker and stop supervising."""
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+
+    def run(self, poll_interval=0.5):
+        """Start the workers and supervise them until all of them finish or :py:meth:`stop`.
+
+        Parameters
+        ----------
+        poll_interval: float
+            Seconds between checks of the workers state.
+
+        Returns
+        -------
+        int
+            Number of crashed workers that were restarted.
+        """
+        if self.prometheus and self.prometheus_port is not None:
+            self._start_metrics_server()
+        warm_up(step_schemas(self.config))
+        gc.collect()
+        gc.freeze()
+        for slot in range(self.workers):
+            self._start_worker(slot)
+        previous_handlers = {
+            signum: signal.signal(signum, self.stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            while any(process is not None for process in self.processes):
+                time.sleep(poll_interval)
+                for slot, process in enumerate(self.processes):
+                    if process is None or process.is_alive():
+                        continue
+                    self._worker_exited(process)
+                    self.processes[slot] = None
+                    if process.exitcode == 0 or self.stopping:
+                        self.logger.info(f"Worker {process.name} finished")
+                        continue
+                    self.logger.error(
+                        f"Worker {process.name} exited with code {process.exitcode}, "
+                        f"restarting in {self.restart_delay} seconds"
+                    )
+                    time.sleep(self.restart_delay)
+                    if not self.stopping:
+                        self.restarts += 1
+                        self._start_worker(slot)
+        finally:
+            self.stop()
+            for process in self.processes:
+                if process is not None:
+                    process.join()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            gc.unfreeze()
+        return self.restarts
@@ -1,10 +1,46 @@
 import datetime
+import time
 
 
 class GenericTopicStrategy:
+    @property
+    def version(self):
+        """Increased every time the topics change, starting at 0 with the first topics."""
+        if not hasattr(self, "_version"):
+            self._version = 0
+            self._last_topics = self.get_topics()
+        return self._version
+
+    @version.setter
+    def version(self, version):
+        self._version = version
+
     def get_topics(self):
         pass
 
+    def has_changed(self, version):
+        """Check if the topics changed since a given version.
+
+        Strategies that know when their topics change should override this method, by
+        default the current topics are compared with the last ones seen.
+
+        Parameters
+        ----------
+        version: int
+            Value of :py:attr:`version` when the topics were last read.
+
+        Returns
+        -------
+        bool
+            True if the topics changed.
+        """
+        last_version = self.version
+        topics = self.get_topics()
+        if topics != getattr(self, "_last_topics", None):
+            self._last_topics = topics
+            self.version = last_version + 1
+        return self.version != version
+
 
 class Topic:
     def __init__(self, name, date, name_format, date_format):
@@ -23,6 +59,10 @@ class Topic:
 class DailyTopicStrategy(GenericTopicStrategy):
     """Gives a KafkaConsumer a new topic every day. (For more information check the :class:`apf.consumers.KafkaConsumer`)
 
+    The topics only change at `change_hour`, so the strategy computes the next change instant
+    once and returns the same cached topic tuple until then. Consumers and producers check
+    :py:meth:`has_changed` with the :py:attr:`version` of the topics they are using.
+
     Parameters
     ----------
     topic_format : str/list
@@ -32,6 +72,8 @@ class DailyTopicStrategy(GenericTopicStrategy):
             i.e: %Y%m%d = YYYY-mm-dd
     change_hour: int
         UTC hour to change the topic.
+    retention_days: int
+        Maximum number of daily topics returned, the newest ones are kept.
 
     """
 
@@ -48,37 +90,83 @@ class DailyTopicStrategy(GenericTopicStrategy):
         )
         self.retention_days = retention_days
         self.date_format = date_format
+        self.start = datetime.datetime.utcnow()
+        self.version = 0
+        self._topic_names = ()
         self.change_hour = change_hour
-        now = datetime.datetime.utcnow()
-        date = now.strftime(self.date_format)
-        self.topics = [
-            Topic(topic % date, now, topic, self.date_format)
-            for topic in self.topic_formats
-        ]
-
-    def _remove_old_topics(self, now):
-        for topic in self.topics:
-            delta = now - topic.date
-            if abs(delta.days) >= self.retention_days:
-                self.topics = self.topics[-self.retention_days :]
+
+    @property
+    def change_hour(self):
+        return self._change_hour
+
+    @change_hour.setter
+    def change_hour(self, change_hour):
+        self._change_hour = change_hour
+        self._update(datetime.datetime.utcnow())
+
+    def _current_date(self, now):
+        if now.hour >= self.change_hour:
+            return now + datetime.timedelta(days=1)
+        return now
+
+    def _next_change(self, now):
+        midnight = datetime.datetime.combine(now.date(), datetime.time())
+        if 0 < self.change_hour < 24:
+            change = midnight + datetime.timedelta(hours=self.change_hour)
+            if change <= now:
+                change += datetime.timedelta(days=1)
+            return change
+        return midnight + datetime.timedelta(days=1)
+
+    def _update(self, now):
+        current = self._current_date(now)
+        days = (current.date() - self.start.date()).days
+        days = min(days, self.retention_days - 1)
+        self.topics = []
+        for delta in range(days, -1, -1):
+            date = current - datetime.timedelta(days=delta)
+            date_str = date.strftime(self.date_format)
+            self.topics.extend(
+                Topic(topic_format % date_str, date, topic_format, self.date_format)
+                for topic_format in self.topic_formats
+            )
+        topic_names = tuple(topic.name for topic in self.topics)
+        if topic_names != self._topic_names:
+            self._topic_names = topic_names
+            self.version += 1
+        next_change = self._next_change(now)
+        self._next_change_ts = next_change.replace(
+            tzinfo=datetime.timezone.utc
+        ).timestamp()
+
+    def _refresh(self):
+        if time.time() >= self._next_change_ts:
+            self._update(datetime.datetime.utcnow())
+
+    def has_changed(self, version):
+        """Check if the topics changed since a given version.
+
+        Parameters
+        ----------
+        version: int
+            Value of :py:attr:`version` when the topics were last read.
+
+        Returns
+        -------
+        bool
+            True if the topics changed.
+        """
+        self._refresh()
+        return self.version != version
 
     def get_topics(self):
         """Get list of topics updated to the current date.
 
         Returns
         -------
-        :class:`list`
-            List of updated topics.
+        :class:`tuple`
+            Immutable tuple of updated topics.
 
         """
-        now = datetime.datetime.utcnow()
-        self._remove_old_topics(now)
-        if now.hour >= self.change_hour:
-            now += datetime.timedelta(days=1)
-            date = now.strftime(self.date_format)
-            for topic_format in self.topic_formats:
-                topic = Topic(topic_format % date, now, topic_format, self.date_format)
-                if not [x for x in self.topics if x.name == topic.name]:
-                    self.topics.append(topic)
-
-        return [topic.name for topic in self.topics]
+        self._refresh()
+        return self._topic_names
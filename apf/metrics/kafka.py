@@ -2,6 +2,7 @@ from apf.metrics import GenericMetricsProducer
 from apf.metrics import DateTimeEncoder
 from confluent_kafka import Producer
 from apf.core import get_class
+from apf.metrics.prometheus.kafka_stats import enable_statistics
 
 import json
 
@@ -20,6 +21,8 @@ class KafkaMetricsProducer(GenericMetricsProducer):
 
         - PARAMS: Parameters passed to :class:`apf.producer.KafkaProducer`.
         - TOPIC: List of topics to produce, for example ['metrics'].
+        - STATISTICS: Export the librdkafka statistics of the producer as Prometheus
+          metrics, see :class:`apf.metrics.prometheus.kafka_stats.KafkaStatsBridge`.
 
     producer : apf.producers.GenericProducer
         An apf producer, by default is :class:`apf.producer.KafkaProducer`.
@@ -32,6 +35,7 @@ class KafkaMetricsProducer(GenericMetricsProducer):
         if producer is not None:
             self.producer = producer
         else:
+            enable_statistics(self.config, "metrics")
             self.producer = Producer(self.config["PARAMS"])
         self.time_encoder = self.config.get("TIME_ENCODER_CLASS", DateTimeEncoder)
         self.dynamic_topic = False
@@ -45,14 +49,16 @@ class KafkaMetricsProducer(GenericMetricsProducer):
                 **self.config["TOPIC_STRATEGY"]["PARAMS"]
             )
             self.topic = self.topic_strategy.get_topics()
+            self.topic_version = self.topic_strategy.version
             self.logger.info(f'Using {self.config["TOPIC_STRATEGY"]}')
             self.logger.info(f"Producing to {self.topic}")
 
     def send_metrics(self, metrics):
         metrics = json.dumps(metrics, cls=self.time_encoder).encode("utf-8")
 
-        if self.config.get("TOPIC_STRATEGY"):
+        if self.dynamic_topic and self.topic_strategy.has_changed(self.topic_version):
             self.topic = self.topic_strategy.get_topics()
+            self.topic_version = self.topic_strategy.version
         for topic in self.topic:
             try:
                 self.producer.produce(topic, metrics)
@@ -0,0 +1,199 @@
+from prometheus_client import REGISTRY, Gauge, Histogram
+
+import json
+import logging
+
+_bridge = None
+
+
+class KafkaStatsBridge:
+    """Export the statistics emitted by librdkafka clients as Prometheus metrics.
+
+    Kafka clients created with a *stats_cb* and a *statistics.interval.ms* call the callback
+    with a JSON document every interval. Only the fields used to tune the clients are read:
+    queue depths, broker round trip and throttle times, producer batch sizes and consumer
+    lag and fetch queues. Every metric is labelled with the librdkafka client name and the
+    APF role of the client. Window statistics are skipped when librdkafka measured nothing
+    in the interval.
+
+    Parameters
+    ----------
+    registry: :class:`prometheus_client.CollectorRegistry`
+        Registry where the metrics are created.
+    """
+
+    def __init__(self, registry=REGISTRY):
+        self.logger = logging.getLogger(f"alerce.{self.__class__.__name__}")
+        client = ["client", "role"]
+        broker = client + ["broker"]
+        partition = client + ["topic", "partition"]
+
+        def gauge(name, documentation, labels):
+            return Gauge(
+                name,
+                documentation,
+                labels,
+                registry=registry,
+                multiprocess_mode="liveall",
+            )
+
+        self.queue_messages = gauge(
+            "kafka_client_queue_messages",
+            "Messages waiting in the producer queues",
+            client,
+        )
+        self.queue_bytes = gauge(
+            "kafka_client_queue_bytes",
+            "Bytes of the messages waiting in the producer queues",
+            client,
+        )
+        self.reply_queue = gauge(
+            "kafka_client_reply_queue",
+            "Operations waiting to be served by poll",
+            client,
+        )
+        self.rebalances = gauge(
+            "kafka_consumer_rebalances",
+            "Consumer group rebalances of the client",
+            client,
+        )
+        self.broker_rtt = gauge(
+            "kafka_broker_rtt_seconds",
+            "Broker request round trip time",
+            broker + ["stat"],
+        )
+        self.broker_throttle = gauge(
+            "kafka_broker_throttle_seconds",
+            "Time requests were throttled by the broker",
+            broker + ["stat"],
+        )
+        self.broker_outbuf = gauge(
+            "kafka_broker_outbuf_requests",
+            "Requests waiting to be sent to the broker",
+            broker,
+        )
+        self.broker_waitresp = gauge(
+            "kafka_broker_waitresp_requests",
+            "Requests sent to the broker waiting for a response",
+            broker,
+        )
+        self.broker_rtt_histogram = Histogram(
+            "kafka_broker_rtt_avg_seconds",
+            "Average broker round trip time of each statistics interval",
+            broker,
+            registry=registry,
+            buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0],
+        )
+        self.batch_size = Histogram(
+            "kafka_topic_batch_size_bytes",
+            "Average size of the producer batches of each statistics interval",
+            client + ["topic"],
+            registry=registry,
+            buckets=[2**i for i in range(10, 24, 2)],
+        )
+        self.consumer_lag = gauge(
+            "kafka_partition_consumer_lag",
+            "Messages between the consumer position and the high watermark",
+            partition,
+        )
+        self.fetch_queue = gauge(
+            "kafka_partition_fetch_queue_messages",
+            "Fetched messages waiting to be consumed",
+            partition,
+        )
+        self.message_queue = gauge(
+            "kafka_partition_message_queue_messages",
+            "Produced messages waiting to be sent",
+            partition,
+        )
+
+    def callback(self, role):
+        """Build a *stats_cb* for a Kafka client.
+
+        Parameters
+        ----------
+        role: str
+            Label of the client, for example `consumer`, `producer` or `metrics`.
+        """
+
+        def stats_cb(stats):
+            self.update(role, stats)
+
+        return stats_cb
+
+    def update(self, role, stats):
+        """Update the metrics with a librdkafka statistics JSON document."""
+        try:
+            stats = json.loads(stats)
+        except ValueError as e:
+            self.logger.error(f"Invalid Kafka statistics: {e}")
+            return
+        client = (stats.get("name", ""), role)
+        if "msg_cnt" in stats:
+            self.queue_messages.labels(*client).set(stats["msg_cnt"])
+            self.queue_bytes.labels(*client).set(stats.get("msg_size", 0))
+        if "replyq" in stats:
+            self.reply_queue.labels(*client).set(stats["replyq"])
+        if "cgrp" in stats:
+            self.rebalances.labels(*client).set(stats["cgrp"].get("rebalance_cnt", 0))
+        for name, broker in stats.get("brokers", {}).items():
+            self._update_broker(client + (name,), broker)
+        for name, topic in stats.get("topics", {}).items():
+            self._update_topic(client, name, topic)
+
+    def _update_broker(self, labels, broker):
+        self.broker_outbuf.labels(*labels).set(broker.get("outbuf_cnt", 0))
+        self.broker_waitresp.labels(*labels).set(broker.get("waitresp_cnt", 0))
+        rtt = broker.get("rtt", {})
+        if rtt.get("cnt"):
+            # librdkafka reports round trip times in microseconds
+            self.broker_rtt.labels(*labels, "avg").set(rtt["avg"] / 1e6)
+            self.broker_rtt.labels(*labels, "p99").set(rtt["p99"] / 1e6)
+            self.broker_rtt_histogram.labels(*labels).observe(rtt["avg"] / 1e6)
+        throttle = broker.get("throttle", {})
+        if throttle.get("cnt"):
+            # throttle times are reported in milliseconds
+            self.broker_throttle.labels(*labels, "avg").set(throttle["avg"] / 1e3)
+            self.broker_throttle.labels(*labels, "max").set(throttle["max"] / 1e3)
+
+    def _update_topic(self, client, name, topic):
+        batch_size = topic.get("batchsize", {})
+        if batch_size.get("cnt"):
+            self.batch_size.labels(*client, name).observe(batch_size["avg"])
+        for partition_id, partition in topic.get("partitions", {}).items():
+            if int(partition_id) < 0:
+                # internal unassigned partition
+                continue
+            labels = client + (name, partition_id)
+            if partition.get("consumer_lag", -1) >= 0:
+                self.consumer_lag.labels(*labels).set(partition["consumer_lag"])
+            self.fetch_queue.labels(*labels).set(partition.get("fetchq_cnt", 0))
+            self.message_queue.labels(*labels).set(partition.get("msgq_cnt", 0))
+
+
+def get_stats_bridge():
+    """Get the process :class:`KafkaStatsBridge`, created on first use."""
+    global _bridge
+    if _bridge is None:
+        _bridge = KafkaStatsBridge()
+    return _bridge
+
+
+def enable_statistics(config, role):
+    """Register the statistics bridge in the Kafka client parameters of an APF component.
+
+    Does nothing unless the component config has a `STATISTICS` dict, whose *INTERVAL*
+    sets the seconds between statistics (default 15).
+
+    Parameters
+    ----------
+    config: dict
+        Component config with the client parameters in *PARAMS*.
+    role: str
+        Label of the client in the exported metrics.
+    """
+    if "STATISTICS" not in config:
+        return
+    interval = float(config["STATISTICS"].get("INTERVAL", 15))
+    config["PARAMS"]["statistics.interval.ms"] = int(interval * 1000)
+    config["PARAMS"]["stats_cb"] = get_stats_bridge().callback(role)
@@ -1,4 +1,4 @@
-from prometheus_client import Enum, Summary
+from prometheus_client import Counter, Enum, Gauge, Histogram, Summary
 from unittest.mock import MagicMock
 
 
@@ -16,6 +16,43 @@ class PrometheusMetrics:
             "execution_time",
             "Execution time of processed batch",
         )
+        self.produce_time = Summary(
+            "produce_time",
+            "Seconds spent producing the outputs of a batch",
+        )
+        self.batch_size = Gauge(
+            "batch_size",
+            "Number of messages requested on the next consumer poll",
+            multiprocess_mode="liveall",
+        )
+        self.suppressed_messages = Counter(
+            "suppressed_messages",
+            "Number of duplicated messages dropped before execution",
+        )
+        self.partition_lag = Gauge(
+            "partition_lag",
+            "Messages between the last consumed offset and the high watermark",
+            ["topic", "partition"],
+            multiprocess_mode="liveall",
+        )
+        self.partition_messages_per_second = Gauge(
+            "partition_messages_per_second",
+            "Messages consumed per second",
+            ["topic", "partition"],
+            multiprocess_mode="liveall",
+        )
+        self.partition_bytes_per_second = Gauge(
+            "partition_bytes_per_second",
+            "Bytes consumed per second",
+            ["topic", "partition"],
+            multiprocess_mode="liveall",
+        )
+        self.message_size = Histogram(
+            "message_size",
+            "Size in bytes of the consumed messages",
+            ["topic", "partition"],
+            buckets=[2**i for i in range(8, 24, 2)],
+        )
         # self.telescope_id = Enum(
         #     "telescope_id",
         #     "Id of the telescope",
@@ -28,4 +65,11 @@ class DefaultPrometheusMetrics(PrometheusMetrics):
         self.consumed_messages = MagicMock()
         self.processed_messages = MagicMock()
         self.execution_time = MagicMock()
+        self.produce_time = MagicMock()
+        self.batch_size = MagicMock()
+        self.suppressed_messages = MagicMock()
+        self.partition_lag = MagicMock()
+        self.partition_messages_per_second = MagicMock()
+        self.partition_bytes_per_second = MagicMock()
+        self.message_size = MagicMock()
         self.telescope_id = MagicMock()
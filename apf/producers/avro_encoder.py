@@ -0,0 +1,134 @@
+from apf.core.schema_cache import parse_schema
+from fastavro.read import HEADER_SCHEMA
+
+import fastavro
+import io
+import json
+import os
+
+MAGIC = b"Obj\x01"
+SYNC_SIZE = 16
+ENCODING_MODES = ("container", "compact")
+VALIDATION_MODES = ("always", "sampled", "off")
+
+_PARSED_HEADER_SCHEMA = fastavro.parse_schema(HEADER_SCHEMA)
+
+
+def encode_long(value):
+    """Encode an Avro long with zig-zag variable length encoding."""
+    value = (value << 1) ^ (value >> 63)
+    encoded = bytearray()
+    while value & ~0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+class AvroBatchEncoder:
+    """Encode messages with an Avro schema reusing the same buffer for every message.
+
+    In ``container`` mode each message is an Avro object container with a single record, as
+    written by :func:`fastavro.writer`, so existing consumers can read it. The container
+    header, with the schema JSON and the sync marker, is encoded once and copied in front of
+    every record instead of being written again for each message. In ``compact`` mode only
+    the schemaless record is written.
+
+    Records are checked against the schema, rejecting missing and extra fields, according to
+    `validation`: ``always`` checks every record, ``sampled`` one of every
+    ``1 / sample_rate`` records and ``off`` none, leaving only the checks fastavro needs to
+    encode.
+
+    Parameters
+    ----------
+    schema: dict
+        Avro schema of the messages.
+    mode: str
+        Either ``container`` or ``compact``.
+    validation: str
+        Either ``always``, ``sampled`` or ``off``.
+    sample_rate: float
+        Fraction of records checked with ``sampled`` validation.
+    """
+
+    def __init__(self, schema, mode="container", validation="always", sample_rate=0.01):
+        if mode not in ENCODING_MODES:
+            raise ValueError(
+                f"Encoding mode must be one of {ENCODING_MODES}, got {mode}"
+            )
+        if validation not in VALIDATION_MODES:
+            raise ValueError(
+                f"Validation must be one of {VALIDATION_MODES}, got {validation}"
+            )
+        if validation == "sampled" and not 0 < sample_rate <= 1:
+            raise ValueError("Validation sample rate must be between 0 and 1")
+        self.parsed_schema = parse_schema(schema)
+        self.mode = mode
+        self.validation = validation
+        self.sample_interval = round(1 / sample_rate) if validation == "sampled" else 1
+        self.encoded = 0
+        self.buffer = io.BytesIO()
+        self.sync = os.urandom(SYNC_SIZE)
+        self.header = b""
+        if mode == "container":
+            self.header = self._container_header(schema)
+
+    def _container_header(self, schema):
+        header = io.BytesIO()
+        fastavro.schemaless_writer(
+            header,
+            _PARSED_HEADER_SCHEMA,
+            {
+                "magic": MAGIC,
+                "meta": {
+                    "avro.schema": json.dumps(schema).encode(),
+                    "avro.codec": b"null",
+                },
+                "sync": self.sync,
+            },
+        )
+        return header.getvalue()
+
+    def _strict(self):
+        if self.validation == "off":
+            return False
+        strict = self.encoded % self.sample_interval == 0
+        self.encoded += 1
+        return strict
+
+    def encode(self, message):
+        """Encode a message.
+
+        Returns
+        -------
+        bytes
+            Container or schemaless record, depending on the mode.
+        """
+        buffer = self.buffer
+        buffer.seek(0)
+        buffer.truncate()
+        fastavro.schemaless_writer(
+            buffer, self.parsed_schema, message, strict=self._strict()
+        )
+        if self.mode == "compact":
+            return buffer.getvalue()
+        with buffer.getbuffer() as record:
+            # a block with one record: count, size in bytes, record and sync marker
+            return b"".join(
+                (self.header, b"\x02", encode_long(len(record)), record, self.sync)
+            )
+
+    def encode_batch(self, messages):
+        """Encode a batch of messages.
+
+        Parameters
+        ----------
+        messages: list
+            Records matching the schema.
+
+        Returns
+        -------
+        list
+            Encoded value of each message, in the same order.
+        """
+        return [self.encode(message) for message in messages]
@@ -23,7 +23,12 @@ class CSVProducer(GenericProducer):
 
         Doesn't add the header
         """
-        serialized_message = json_normalize(message)
-        serialized_message.to_csv(
+        self.produce_batch([message])
+
+    def produce_batch(self, messages, **kwargs):
+        """Append a batch of messages to the CSV File with a single write."""
+        serialized_messages = json_normalize(messages)
+        serialized_messages.to_csv(
             self.config["FILE_PATH"], mode="a+", index=False, header=False
         )
+        return len(messages)
@@ -30,3 +30,88 @@ class GenericProducer(ABC):
             Message to be sended.
         """
         pass
+
+    def produce_batch(self, messages, **kwargs):
+        """Send every message of a batch.
+
+        Calls :py:meth:`produce` for each message, producers override it to send a batch
+        with less work per message.
+
+        Parameters
+        ----------
+        messages : list
+            Dict-like messages to be sent.
+
+        Returns
+        -------
+        int
+            Number of messages sent.
+        """
+        for message in messages:
+            self.produce(message, **kwargs)
+        return len(messages)
+
+    @property
+    def transactional(self) -> bool:
+        """Whether the producer commits the consumed offsets in its own transactions."""
+        return False
+
+    def end_batch(self):
+        """Mark the end of the messages produced for a consumed batch.
+
+        Returns
+        -------
+        int | None
+            Identifier of the batch, used with :py:meth:`is_delivered`.
+        """
+        return None
+
+    def is_delivered(self, batch) -> bool:
+        """Check if every message of the batch and the previous ones was delivered.
+
+        Producers that write synchronously are always delivered.
+
+        Parameters
+        ----------
+        batch: int | None
+            Batch returned by :py:meth:`end_batch`.
+        """
+        return True
+
+    def wait_delivered(self, batch, timeout) -> bool:
+        """Wait up to `timeout` seconds for the batch and the previous ones to be delivered.
+
+        Parameters
+        ----------
+        batch: int | None
+            Batch returned by :py:meth:`end_batch`.
+        timeout: float
+            Maximum seconds to wait.
+
+        Returns
+        -------
+        bool
+            Whether every message of the batch was delivered.
+        """
+        return self.is_delivered(batch)
+
+    def get_metrics(self) -> dict:
+        """Metrics of the producer reported with the step metrics."""
+        return {}
+
+    @property
+    def queue_length(self) -> int:
+        """Number of produced messages waiting to be delivered."""
+        return 0
+
+    def poll(self, timeout=0):
+        """Serve delivery callbacks of produced messages for up to `timeout` seconds.
+
+        Producers that write synchronously have nothing to serve.
+
+        Parameters
+        ----------
+        timeout: float
+            Maximum seconds to wait for delivery events.
+        """
+        pass
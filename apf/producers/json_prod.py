@@ -29,20 +29,25 @@ class JSONProducer(GenericProducer):
 
     def produce(self, message=None, **kwargs):
         """Produce Message to a JSON File."""
+        self.produce_batch([message])
+
+    def produce_batch(self, messages, **kwargs):
+        """Add a batch of messages to the buffer, writing a file each time it fills."""
         if "FILE_PATH" in self.config and self.config["FILE_PATH"]:
-            serialized_message = read_json(
-                json.dumps([message]), orient="records", typ="frame"
-            )
-            self.buffer = concat([self.buffer, serialized_message])
-            output_file = (
-                pathlib.Path(self.config["FILE_PATH"])
-                / f"producer_output{self.file_counter}.json"
+            serialized_messages = read_json(
+                json.dumps(messages), orient="records", typ="frame"
             )
-            if len(self.buffer) == self.buffer_size:
+            self.buffer = concat([self.buffer, serialized_messages])
+            while len(self.buffer) >= self.buffer_size:
+                output_file = (
+                    pathlib.Path(self.config["FILE_PATH"])
+                    / f"producer_output{self.file_counter}.json"
+                )
                 self.logger.info(f"Buffer: {self.buffer}")
-                self.buffer.to_json(
+                self.buffer[: self.buffer_size].to_json(
                     output_file,
                     orient="records",
                 )
                 self.file_counter += 1
-                self.buffer = []
+                self.buffer = self.buffer[self.buffer_size :]
+        return len(messages)
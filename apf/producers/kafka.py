@@ -1,8 +1,15 @@
+from apf.core.schema_registry import load_registry, pack_header
+from apf.metrics.prometheus.kafka_stats import enable_statistics
+from apf.producers.avro_encoder import AvroBatchEncoder
 from apf.producers.generic import GenericProducer
-from confluent_kafka import Producer
-import fastavro
-import io
+from confluent_kafka import KafkaException, Producer
+import functools
 import importlib
+import threading
+import time
+
+# seconds of each poll while waiting for deliveries
+POLL_INTERVAL = 0.1
 
 
 class KafkaProducer(GenericProducer):
@@ -93,14 +100,111 @@ class KafkaProducer(GenericProducer):
                     ]
                 }
             }
+
+    EXACTLY_ONCE: bool
+        Produce each step batch inside a Kafka transaction (disabled by default). The offsets of
+        the consumed batch are added to the same transaction, replacing the consumer commit, so
+        a batch output and its consumed offsets are committed atomically. Requires a
+        *transactional.id* in *PARAMS*, unique for each step replica. Downstream consumers
+        should set *isolation.level* to *read_committed* to skip aborted outputs.
+
+        If a transaction fails it is aborted and the error is raised, the step will consume
+        again from the last committed offsets when restarted.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            PRODUCER_CONFIG = { ...
+                "PARAMS": {
+                    "bootstrap.servers": "kafka1:9092",
+                    "transactional.id": "my_step-0",
+                },
+                "EXACTLY_ONCE": True,
+                "TRANSACTION_TIMEOUT": 30,
+            }
+
+    ENCODING: str
+        Either `"container"` (default) to write each message as an Avro object container
+        readable by :class:`apf.consumers.KafkaConsumer`, or `"compact"` to write only the
+        schemaless record, readable by :class:`apf.consumers.KafkaSchemalessConsumer`. The
+        container header is encoded once and reused for every message, see
+        :class:`apf.producers.avro_encoder.AvroBatchEncoder`.
+
+    VALIDATION: str
+        Check that messages match `SCHEMA` without missing or extra fields, either
+        `"always"`, `"sampled"` for one of every ``1 / VALIDATION_SAMPLE_RATE`` messages
+        (default rate 0.01) or `"off"`. Defaults to `"off"` for :class:`KafkaProducer` and
+        `"always"` for the schemaless and registry producers.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            PRODUCER_CONFIG = { ...
+                "ENCODING": "container",
+                "VALIDATION": "sampled",
+                "VALIDATION_SAMPLE_RATE": 0.001,
+            }
+
+    QUEUE_FULL_TIMEOUT: float
+        Seconds to wait for room in the local producer queue when it is full (default 30).
+        Delivery callbacks are served with short polls while waiting, so the step is only
+        blocked until enough messages are delivered instead of until the whole queue is
+        flushed. An exception is raised if the queue is still full after the timeout.
+
+        Delivered, failed and in flight messages are counted, see :py:meth:`get_metrics`.
+
+    STATISTICS: dict
+        Export the librdkafka statistics of the producer as Prometheus metrics every
+        *INTERVAL* seconds (default 15), see
+        :class:`apf.metrics.prometheus.kafka_stats.KafkaStatsBridge`. Queue depths, broker
+        round trip times and batch sizes help tuning *linger.ms* and *batch.size*.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            PRODUCER_CONFIG = { ...
+                "STATISTICS": {"INTERVAL": 10},
+            }
     """
 
+    default_encoding = "container"
+    default_validation = "off"
+
     def __init__(self, config):
         super().__init__(config=config)
+        enable_statistics(self.config, "producer")
         self.producer = Producer(self.config["PARAMS"])
-        self.schema = self.config["SCHEMA"]
-
-        self.schema = fastavro.parse_schema(self.schema)
+        self.encoder = AvroBatchEncoder(
+            self.config["SCHEMA"],
+            mode=self.config.get("ENCODING", self.default_encoding),
+            validation=self.config.get("VALIDATION", self.default_validation),
+            sample_rate=float(self.config.get("VALIDATION_SAMPLE_RATE", 0.01)),
+        )
+        self.schema = self.encoder.parsed_schema
+
+        self.batch = 0
+        # delivery callbacks may be served by another thread, e.g. a consumer prefetcher
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.failed_batches = set()
+        self.delivered = 0
+        self.failed = 0
+        self.queue_full_timeout = float(self.config.get("QUEUE_FULL_TIMEOUT", 30))
+        self._delivery_callback = functools.partial(self._on_delivery, self.batch)
+
+        self.exactly_once = bool(self.config.get("EXACTLY_ONCE", False))
+        self.transaction_timeout = float(self.config.get("TRANSACTION_TIMEOUT", 30))
+        self.in_transaction = False
+        if self.exactly_once:
+            if "transactional.id" not in self.config["PARAMS"]:
+                raise Exception("EXACTLY_ONCE requires a transactional.id in PARAMS")
+            self.producer.init_transactions(self.transaction_timeout)
 
         self.dynamic_topic = False
         if self.config.get("TOPIC"):
@@ -120,13 +224,164 @@ class KafkaProducer(GenericProducer):
                 **self.config["TOPIC_STRATEGY"]["PARAMS"]
             )
             self.topic = self.topic_strategy.get_topics()
+            self.topic_version = self.topic_strategy.version
             self.logger.info(f'Using {self.config["TOPIC_STRATEGY"]}')
             self.logger.info(f"Producing to {self.topic}")
 
     def _serialize_message(self, message):
-        out = io.BytesIO()
-        fastavro.writer(out, self.schema, [message])
-        return out.getvalue()
+        return self.encoder.encode(message)
+
+    def _release(self, batch):
+        self.pending[batch] -= 1
+        if self.pending[batch] == 0:
+            del self.pending[batch]
+
+    def _on_delivery(self, batch, err, msg, callback=None):
+        with self.lock:
+            self._release(batch)
+            if err is not None:
+                self.failed_batches.add(batch)
+                self.failed += 1
+            else:
+                self.delivered += 1
+        if err is not None:
+            self.logger.error(f"Failed to deliver message: {err}")
+        if callback is not None:
+            callback(err, msg)
+
+    def end_batch(self):
+        batch = self.batch
+        self.batch += 1
+        self._delivery_callback = functools.partial(self._on_delivery, self.batch)
+        return batch
+
+    def is_delivered(self, batch):
+        """Check if every message of the batch and the previous ones was delivered.
+
+        Raises an exception if any of them failed, so their offsets are never committed.
+        """
+        self.producer.poll(0)
+        with self.lock:
+            if any(failed <= batch for failed in self.failed_batches):
+                raise Exception(
+                    f"Messages produced up to batch {batch} were not delivered"
+                )
+            return all(pending > batch for pending in self.pending)
+
+    def wait_delivered(self, batch, timeout):
+        """Serve delivery callbacks until the batch is delivered or the timeout expires.
+
+        Returns
+        -------
+        bool
+            Whether every message of the batch and the previous ones was delivered.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.is_delivered(batch):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.producer.poll(min(POLL_INTERVAL, remaining))
+        return True
+
+    @property
+    def in_flight(self):
+        """Number of produced messages waiting for their delivery report."""
+        with self.lock:
+            return sum(self.pending.values())
+
+    def get_metrics(self):
+        """Delivery counters of the producer.
+
+        Returns
+        -------
+        dict
+            Messages waiting for their delivery report and total messages delivered and
+            failed.
+        """
+        with self.lock:
+            return {
+                "messages_in_flight": self.in_flight,
+                "messages_delivered": self.delivered,
+                "messages_failed": self.failed,
+            }
+
+    @property
+    def transactional(self):
+        return self.exactly_once
+
+    @property
+    def queue_length(self):
+        return len(self.producer)
+
+    def poll(self, timeout=0):
+        self.producer.poll(timeout)
+
+    def begin_transaction(self):
+        if self.exactly_once and not self.in_transaction:
+            self.producer.begin_transaction()
+            self.in_transaction = True
+
+    def commit_transaction(self, offsets, group_metadata):
+        """Commit the current transaction together with the consumed offsets.
+
+        Parameters
+        ----------
+        offsets: list
+            :class:`confluent_kafka.TopicPartition` list with the next offsets to consume.
+        group_metadata: :class:`confluent_kafka.ConsumerGroupMetadata`
+            Metadata of the consumer that read the batch.
+        """
+        self.begin_transaction()
+        try:
+            if offsets:
+                self.producer.send_offsets_to_transaction(
+                    offsets, group_metadata, self.transaction_timeout
+                )
+            self.producer.commit_transaction(self.transaction_timeout)
+        except KafkaException as e:
+            self.logger.error(f"Error committing transaction: {e}")
+            self.abort_transaction()
+            raise e
+        self.in_transaction = False
+
+    def abort_transaction(self):
+        if self.in_transaction:
+            self.producer.abort_transaction(self.transaction_timeout)
+            self.in_transaction = False
+
+    def _produce(self, topic, message, key, **kwargs):
+        self.begin_transaction()
+        callback = self._delivery_callback
+        user_callback = kwargs.pop("on_delivery", kwargs.pop("callback", None))
+        if user_callback is not None:
+            callback = functools.partial(callback, callback=user_callback)
+        batch = self.batch
+        # counted before producing, its delivery report may be served right away
+        with self.lock:
+            self.pending[batch] = self.pending.get(batch, 0) + 1
+        try:
+            self.producer.produce(
+                topic, value=message, key=key, on_delivery=callback, **kwargs
+            )
+        except Exception:
+            with self.lock:
+                self._release(batch)
+            raise
+
+    def _produce_when_queued(self, topic, message, key, **kwargs):
+        """Produce a message, waiting for room in the queue if it is full."""
+        deadline = time.monotonic() + self.queue_full_timeout
+        while True:
+            try:
+                self._produce(topic, message, key, **kwargs)
+                return
+            except BufferError as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise e
+                self.logger.debug(f"Producer queue full, polling deliveries: {e}")
+                self.producer.poll(min(POLL_INTERVAL, remaining))
 
     def produce(self, message=None, **kwargs):
         """Produce Message to a topic.
@@ -149,25 +404,110 @@ class KafkaProducer(GenericProducer):
         if message:
             key = message[self.key_field] if self.key_field else None
         message = self._serialize_message(message)
-        if self.dynamic_topic:
+        for topic in self._current_topics():
+            self._produce_when_queued(topic, message, key, **kwargs)
+            self.producer.poll(0)
+
+    def produce_batch(self, messages, **kwargs):
+        """Produce a batch of messages to the topics.
+
+        Topics are resolved once for the whole batch, keys are extracted and messages
+        serialized before producing, and delivery callbacks are served once at the end.
+
+        Parameters
+        ----------
+        messages: list
+            Values of the messages, matching the schema defined in the config["SCHEMA"].
+
+        **kwargs: dict
+            Passed to the produce method of the producer for every message.
+
+        Returns
+        -------
+        int
+            Number of messages produced to each topic.
+        """
+        if self.key_field:
+            keys = [
+                message[self.key_field] if message else None for message in messages
+            ]
+        else:
+            keys = [None] * len(messages)
+        values = self._serialize_batch(messages)
+        for topic in self._current_topics():
+            for value, key in zip(values, keys):
+                self._produce_when_queued(topic, value, key, **kwargs)
+        self.producer.poll(0)
+        return len(messages)
+
+    def _serialize_batch(self, messages):
+        return [self._serialize_message(message) for message in messages]
+
+    def _current_topics(self):
+        if self.dynamic_topic and self.topic_strategy.has_changed(self.topic_version):
             self.topic = self.topic_strategy.get_topics()
-        for topic in self.topic:
-            try:
-                self.producer.produce(topic, value=message, key=key, **kwargs)
-                self.producer.poll(0)
-            except BufferError as e:
-                self.logger.info(f"Error producing message: {e}")
-                self.logger.info("Calling poll to empty queue and producing again")
-                self.producer.flush()
-                self.producer.produce(topic, value=message, key=key, **kwargs)
+            self.topic_version = self.topic_strategy.version
+        return self.topic
 
     def __del__(self):
+        if not hasattr(self, "producer"):
+            # the config was rejected before the producer was created
+            return
+        if getattr(self, "in_transaction", False):
+            self.logger.info("Aborting unfinished transaction")
+            self.abort_transaction()
         self.logger.info("Waiting to produce last messages")
         self.producer.flush()
 
 
 class KafkaSchemalessProducer(KafkaProducer):
+    default_encoding = "compact"
+    default_validation = "always"
+
+
+class KafkaRegistryProducer(KafkaProducer):
+    """Kafka producer of messages in the schema registry wire format.
+
+    The output schema is registered once when the producer is created and each message is
+    written as a zero magic byte and the 4 bytes big-endian schema id followed by the
+    schemaless Avro record, instead of a full Avro container with the schema in its header.
+
+    Parameters
+    ----------
+    SCHEMA_REGISTRY: dict
+        Registry client, with the *CLASS* path of a
+        :class:`apf.core.schema_registry.GenericSchemaRegistry` and its *PARAMS*.
+    SUBJECT: str
+        Subject used to register `SCHEMA`, by default the full name of the schema.
+
+        **Example:**
+
+        .. code-block:: python
+
+            #settings.py
+            PRODUCER_CONFIG = { ...
+                "CLASS": "apf.producers.KafkaRegistryProducer",
+                "SCHEMA_REGISTRY": {
+                    "CLASS": "apf.core.schema_registry.ConfluentSchemaRegistry",
+                    "PARAMS": {"url": "http://schema-registry:8081"},
+                },
+                "SUBJECT": "alerce.output",
+            }
+    """
+
+    default_encoding = "compact"
+    default_validation = "always"
+
+    def __init__(self, config):
+        if not config.get("SCHEMA_REGISTRY"):
+            raise Exception("No SCHEMA_REGISTRY provided")
+        if config.get("ENCODING", "compact") != "compact":
+            raise ValueError("KafkaRegistryProducer only supports compact ENCODING")
+        super().__init__(config)
+        self.registry = load_registry(self.config["SCHEMA_REGISTRY"])
+        subject = self.config.get("SUBJECT", self.schema["name"])
+        self.schema_id = self.registry.register(subject, self.config["SCHEMA"])
+        self.header = pack_header(self.schema_id)
+
     def _serialize_message(self, message):
-        out = io.BytesIO()
-        fastavro.schemaless_writer(out, self.schema, message, strict=True)
-        return out.getvalue()
+        return self.header + self.encoder.encode(message)
@@ -25,6 +25,7 @@ setup(
     package_data={"": ["*.txt", "Dockerfile"]},
     include_package_data=True,
     install_requires=required_packages,
+    extras_require={"arrow": ["pyarrow>=8.0.0"]},
     build_requires=required_packages,
     project_urls={
         "Github": "https://github.com/alercebroker/APF",
@@ -1,6 +1,8 @@
-from apf.core.management import new_step
+from apf.core.management import new_step, run
+import logging
 import os
 import shutil
+import tempfile
 import unittest
 from click.testing import CliRunner
 
@@ -21,3 +23,51 @@ class CLITest(unittest.TestCase):
         self.assertTrue(os.path.exists(output_path))
 
         shutil.rmtree(output_path)
+
+
+STEP_MODULE = """
+from apf.core.step import GenericStep
+import os
+
+
+class FileStep(GenericStep):
+    def execute(self, messages):
+        with open(self.config["OUTPUT"], "a") as f:
+            f.write(f"{os.getpid()}\\n")
+        return {}
+
+    def _write_success(self):
+        pass
+"""
+
+SETTINGS = """
+STEP_CONFIG = {
+    "CONSUMER_CONFIG": {"CLASS": "apf.core.step.DefaultConsumer"},
+    "OUTPUT": %r,
+}
+"""
+
+
+class CLIRunTest(unittest.TestCase):
+    def setUp(self):
+        logger = logging.getLogger("alerce")
+        self.addCleanup(setattr, logger, "handlers", list(logger.handlers))
+        self.addCleanup(logger.setLevel, logger.level)
+
+    def test_run_workers(self):
+        with tempfile.TemporaryDirectory() as path:
+            output = os.path.join(path, "executions")
+            with open(os.path.join(path, "cli_run_step.py"), "w") as f:
+                f.write(STEP_MODULE)
+            settings_path = os.path.join(path, "settings.py")
+            with open(settings_path, "w") as f:
+                f.write(SETTINGS % output)
+
+            runner = CliRunner()
+            result = runner.invoke(
+                run,
+                ["cli_run_step.FileStep", "--settings", settings_path, "--workers", "2"],
+            )
+            self.assertEqual(result.exit_code, 0, result.output)
+            with open(output) as f:
+                self.assertEqual(len(set(f.read().split())), 2)
@@ -0,0 +1,41 @@
+from apf.consumers.arrow import (
+    check_batch_format,
+    is_record_batch,
+    numeric_columns,
+    to_record_batch,
+)
+import numpy as np
+import pytest
+import unittest
+
+pyarrow = pytest.importorskip("pyarrow")
+
+
+class ArrowBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            {"oid": "a", "candid": 1, "mag": 18.5, "fid": None},
+            {"oid": "b", "candid": 2, "mag": 19.0, "fid": 1},
+        ]
+
+    def test_check_batch_format(self):
+        check_batch_format("dict")
+        check_batch_format("arrow")
+        with self.assertRaises(ValueError):
+            check_batch_format("pandas")
+
+    def test_to_record_batch(self):
+        batch = to_record_batch(self.records)
+        self.assertTrue(is_record_batch(batch))
+        self.assertFalse(is_record_batch(self.records))
+        self.assertEqual(batch.num_rows, 2)
+        self.assertEqual(batch.column("oid").to_pylist(), ["a", "b"])
+
+    def test_numeric_columns_are_views(self):
+        batch = to_record_batch(self.records)
+        columns = numeric_columns(batch)
+        self.assertEqual(set(columns), {"candid", "mag"})
+        np.testing.assert_array_equal(columns["mag"], [18.5, 19.0])
+        buffer = batch.column("mag").buffers()[1]
+        self.assertEqual(columns["mag"].ctypes.data, buffer.address)
+        self.assertIsInstance(batch.column("oid"), pyarrow.StringArray)
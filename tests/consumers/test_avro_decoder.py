@@ -0,0 +1,128 @@
+from apf.consumers.avro_decoder import AvroContainerDecoder
+from concurrent.futures import ThreadPoolExecutor
+from .message_mock import MessageMock
+import unittest
+import fastavro
+import io
+import pickle
+
+SCHEMA = {
+    "namespace": "test.avro",
+    "type": "record",
+    "name": "test",
+    "fields": [
+        {"name": "key", "type": "string"},
+        {"name": "int", "type": "int"},
+    ],
+}
+
+
+def container(records, codec="null", schema=SCHEMA):
+    out = io.BytesIO()
+    fastavro.writer(out, fastavro.parse_schema(schema), records, codec=codec)
+    return out.getvalue()
+
+
+class AvroContainerDecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.decoder = AvroContainerDecoder()
+
+    def test_decode_matches_fastavro_reader(self):
+        payload = MessageMock().value()
+        expected = next(iter(fastavro.reader(io.BytesIO(payload))))
+        self.assertEqual(self.decoder.decode(payload), expected)
+
+    def test_schema_is_parsed_once(self):
+        payloads = [container([{"key": str(i), "int": i}]) for i in range(5)]
+        for i, payload in enumerate(payloads):
+            self.assertEqual(self.decoder.decode(payload), {"key": str(i), "int": i})
+        self.assertEqual(self.decoder.stats["schema_cache_misses"], 1)
+        self.assertEqual(self.decoder.stats["schema_cache_hits"], 4)
+        self.assertEqual(len(self.decoder.headers), 1)
+
+    def test_iter_records_multiple_records(self):
+        records = [{"key": str(i), "int": i} for i in range(10)]
+        for codec in ["null", "deflate"]:
+            decoded = list(self.decoder.iter_records(container(records, codec=codec)))
+            self.assertEqual(decoded, records)
+
+    def test_cache_size(self):
+        decoder = AvroContainerDecoder(cache_size=1)
+        other_schema = dict(SCHEMA, name="other")
+        decoder.decode(container([{"key": "a", "int": 1}]))
+        decoder.decode(container([{"key": "a", "int": 1}], schema=other_schema))
+        decoder.decode(container([{"key": "a", "int": 1}]))
+        self.assertEqual(decoder.stats["schema_cache_misses"], 3)
+        self.assertEqual(len(decoder.headers), 1)
+
+    def test_shared_by_threads(self):
+        decoder = AvroContainerDecoder(cache_size=2)
+        schemas = [dict(SCHEMA, name=f"test{i}") for i in range(4)]
+        payloads = [
+            container([{"key": str(i), "int": i}], schema=schemas[i % 4])
+            for i in range(400)
+        ]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            decoded = list(executor.map(decoder.decode, payloads))
+        self.assertEqual(decoded, [{"key": str(i), "int": i} for i in range(400)])
+        stats = decoder.stats
+        self.assertEqual(stats["schema_cache_hits"] + stats["schema_cache_misses"], 400)
+        self.assertLessEqual(len(decoder.headers), 2)
+
+    def test_pickle(self):
+        self.decoder.decode(container([{"key": "a", "int": 1}]))
+        decoder = pickle.loads(pickle.dumps(self.decoder))
+        self.assertIsNot(decoder.lock, self.decoder.lock)
+        payload = container([{"key": "b", "int": 2}])
+        self.assertEqual(decoder.decode(payload), {"key": "b", "int": 2})
+        self.assertEqual(decoder.stats["schema_cache_hits"], 1)
+
+    def test_empty_container(self):
+        self.assertIsNone(self.decoder.decode(container([])))
+
+    def test_not_a_container(self):
+        with self.assertRaises(ValueError):
+            self.decoder.decode(b"not avro")
+
+
+class AvroProjectionTest(unittest.TestCase):
+    def setUp(self):
+        self.payload = MessageMock().value()
+        self.full = next(iter(fastavro.reader(io.BytesIO(self.payload))))
+
+    def test_fields(self):
+        decoder = AvroContainerDecoder(fields=["objectId", "candid"])
+        decoded = decoder.decode(self.payload)
+        self.assertEqual(
+            decoded, {"objectId": self.full["objectId"], "candid": self.full["candid"]}
+        )
+
+    def test_nested_fields(self):
+        decoder = AvroContainerDecoder(fields=["objectId", "candidate.ra"])
+        decoded = decoder.decode(self.payload)
+        self.assertEqual(decoded["candidate"], {"ra": self.full["candidate"]["ra"]})
+
+    def test_reader_schema(self):
+        reader_schema = {
+            "namespace": "test.avro",
+            "type": "record",
+            "name": "test",
+            "fields": [{"name": "int", "type": "int"}],
+        }
+        decoder = AvroContainerDecoder(reader_schema=reader_schema)
+        records = [{"key": str(i), "int": i} for i in range(3)]
+        for codec in ["null", "deflate"]:
+            decoded = list(decoder.iter_records(container(records, codec=codec)))
+            self.assertEqual(decoded, [{"int": i} for i in range(3)])
+
+    def test_missing_field(self):
+        decoder = AvroContainerDecoder(fields=["objectId", "magnitude"])
+        with self.assertRaises(ValueError):
+            decoder.decode(self.payload)
+
+    def test_projection_stats(self):
+        decoder = AvroContainerDecoder(fields=["objectId"])
+        decoder.decode(self.payload)
+        self.assertGreater(decoder.stats["projection_bytes_skipped"], 0)
+        self.assertIn("projection_time_saved", decoder.stats)
+        self.assertNotIn("projection_bytes_skipped", AvroContainerDecoder().stats)
@@ -1,8 +1,11 @@
 from .test_core import GenericConsumerTest
-from apf.consumers import AVROFileConsumer
+from apf.consumers import AVROFileConsumer, AVROInfiniteConsumer
+from apf.consumers.arrow import pyarrow
 import unittest
 
+import fastavro
 import os
+import tempfile
 
 FILE_PATH = os.path.dirname(os.path.abspath(__file__))
 EXAMPLES_PATH = os.path.abspath(os.path.join(FILE_PATH, "../examples"))
@@ -27,3 +30,84 @@ class AVROFileConsumerTest(GenericConsumerTest, unittest.TestCase):
             total += len(msgs)
         assert total == 6
         assert loops == 2
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_consume_arrow(self):
+        params = dict(self.params, BATCH_FORMAT="arrow")
+        params["consume.messages"] = 5
+        self.component = AVROFileConsumer(params)
+        batches = list(self.component.consume())
+        assert [batch.num_rows for batch in batches] == [5, 1]
+        assert "objectId" in batches[0].schema.names
+
+
+class AVROFileConsumerStreamingTest(unittest.TestCase):
+    schema = {
+        "type": "record",
+        "name": "test",
+        "fields": [{"name": "id", "type": "int"}],
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        ids = iter(range(10))
+        for name, count in (("a", 4), ("b", 0), ("c", 3), ("d", 3)):
+            with open(os.path.join(self.directory.name, f"{name}.avro"), "wb") as f:
+                fastavro.writer(
+                    f, self.schema, [{"id": next(ids)} for _ in range(count)]
+                )
+        open(os.path.join(self.directory.name, "empty.avro"), "wb").close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def consume(self, **config):
+        params = {"DIRECTORY_PATH": self.directory.name, "STREAMING": True}
+        params.update(config)
+        return list(AVROFileConsumer(params).consume())
+
+    def test_batches_span_files(self):
+        batches = self.consume(NUM_MESSAGES=3)
+        assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+        assert [msg["id"] for batch in batches for msg in batch] == list(range(10))
+
+    def test_single_messages(self):
+        msgs = self.consume()
+        assert [msg["id"] for msg in msgs] == list(range(10))
+
+    def test_read_ahead(self):
+        batches = self.consume(NUM_MESSAGES=4, READ_AHEAD=2)
+        assert [msg["id"] for batch in batches for msg in batch] == list(range(10))
+
+    def test_stop_early_with_read_ahead(self):
+        consumer = AVROFileConsumer(
+            {
+                "DIRECTORY_PATH": self.directory.name,
+                "STREAMING": True,
+                "READ_AHEAD": 3,
+            }
+        )
+        messages = consumer.consume()
+        assert next(messages)["id"] == 0
+        messages.close()
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+        batches = self.consume(NUM_MESSAGES=6, BATCH_FORMAT="arrow")
+        assert [batch.num_rows for batch in batches] == [6, 4]
+
+    def test_shards(self):
+        ids = []
+        for index in range(2):
+            batches = self.consume(NUM_MESSAGES=10, SHARD_INDEX=index, SHARD_COUNT=2)
+            ids.extend(msg["id"] for batch in batches for msg in batch)
+        assert sorted(ids) == list(range(10))
+
+
+class AVROInfiniteConsumerTest(unittest.TestCase):
+    def test_loops_over_every_file(self):
+        params = {"DIRECTORY_PATH": os.path.join(EXAMPLES_PATH, "avro_test")}
+        messages = AVROInfiniteConsumer(params).consume()
+        ids = [next(messages)["candid"] for _ in range(12)]
+        assert len(set(ids)) == 6
+        assert ids[:6] == ids[6:]
@@ -0,0 +1,123 @@
+from apf.consumers.backfill import BackfillRange, to_millis, worker_shard
+from confluent_kafka import TopicPartition
+from unittest import mock
+import datetime
+import os
+import unittest
+
+
+class MessageMock:
+    def __init__(self, partition, offset):
+        self._partition = partition
+        self._offset = offset
+
+    def topic(self):
+        return "alerts"
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+
+def metadata_consumer(partitions=4):
+    consumer = mock.MagicMock()
+    consumer.list_topics().topics = {
+        "alerts": mock.MagicMock(partitions={p: None for p in range(partitions)})
+    }
+    consumer.get_watermark_offsets.return_value = (5, 100)
+    return consumer
+
+
+class BackfillRangeTest(unittest.TestCase):
+    def test_to_millis(self):
+        self.assertEqual(to_millis(1000), 1000)
+        self.assertEqual(to_millis("1970-01-01T00:00:01"), 1000)
+        self.assertEqual(to_millis("1970-01-01T00:00:01Z"), 1000)
+        self.assertEqual(
+            to_millis(datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)), 0
+        )
+
+    def test_worker_shard(self):
+        with mock.patch.dict(
+            os.environ, {"APF_WORKER_INDEX": "2", "APF_WORKER_COUNT": "3"}
+        ):
+            self.assertEqual(worker_shard(), (2, 3))
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertEqual(worker_shard(), (0, 1))
+
+    def test_resolve_watermarks(self):
+        backfill = BackfillRange.resolve(
+            metadata_consumer(), ["alerts"], worker_index=1, worker_count=2
+        )
+        self.assertEqual(backfill.start, {("alerts", 1): 5, ("alerts", 3): 5})
+        self.assertEqual(backfill.end, {("alerts", 1): 100, ("alerts", 3): 100})
+        self.assertEqual(backfill.total, 190)
+
+    def test_resolve_timestamps(self):
+        consumer = metadata_consumer(partitions=2)
+
+        def offsets_for_times(partitions, timeout):
+            if partitions[0].offset == 1000:
+                return [
+                    TopicPartition("alerts", 0, 10),
+                    TopicPartition("alerts", 1, 20),
+                ]
+            return [TopicPartition("alerts", 0, 50), TopicPartition("alerts", 1, -1)]
+
+        consumer.offsets_for_times.side_effect = offsets_for_times
+        backfill = BackfillRange.resolve(consumer, ["alerts"], start=1000, end=2000)
+        self.assertEqual(backfill.start, {("alerts", 0): 10, ("alerts", 1): 20})
+        self.assertEqual(backfill.end, {("alerts", 0): 50, ("alerts", 1): 100})
+
+    def test_resolve_resumes_committed_offsets(self):
+        consumer = metadata_consumer(partitions=3)
+        consumer.committed.return_value = [
+            TopicPartition("alerts", 0, 40),
+            TopicPartition("alerts", 1, 100),
+            TopicPartition("alerts", 2, -1001),
+        ]
+        backfill = BackfillRange.resolve(consumer, ["alerts"])
+        self.assertEqual(
+            backfill.position,
+            {("alerts", 0): 40, ("alerts", 1): 100, ("alerts", 2): 5},
+        )
+        self.assertEqual(backfill.finished, {("alerts", 1)})
+        self.assertEqual(
+            [(tp.partition, tp.offset) for tp in backfill.pending_partitions()],
+            [(0, 40), (2, 5)],
+        )
+        metrics = backfill.metrics()
+        self.assertEqual(metrics["backfill_remaining"], 60 + 95)
+        self.assertIsNone(metrics["backfill_eta"])
+
+    def test_bad_worker_index(self):
+        with self.assertRaises(ValueError):
+            BackfillRange.resolve(
+                metadata_consumer(), ["alerts"], worker_index=2, worker_count=2
+            )
+
+    def test_progress(self):
+        backfill = BackfillRange(
+            {("alerts", 0): 0, ("alerts", 1): 5}, {("alerts", 0): 4, ("alerts", 1): 5}
+        )
+        self.assertEqual(backfill.finished, {("alerts", 1)})
+        self.assertIsNone(backfill.metrics()["backfill_eta"])
+        self.assertTrue(backfill.accept(MessageMock(0, 1)))
+        self.assertEqual(backfill.metrics()["backfill_remaining"], 2)
+        self.assertEqual(backfill.metrics()["backfill_progress"], 0.5)
+        self.assertIsNotNone(backfill.metrics()["backfill_eta"])
+        self.assertFalse(backfill.accept(MessageMock(0, 4)))
+        self.assertFalse(backfill.done)
+        self.assertTrue(backfill.accept(MessageMock(0, 3)))
+        self.assertTrue(backfill.done)
+        self.assertEqual(backfill.pending_partitions(), [])
+
+    def test_advance_past_markers(self):
+        backfill = BackfillRange({("alerts", 0): 0}, {("alerts", 0): 10})
+        backfill.advance([TopicPartition("alerts", 0, -1001)])
+        self.assertFalse(backfill.done)
+        backfill.advance([TopicPartition("alerts", 0, 11)])
+        self.assertTrue(backfill.done)
+        self.assertEqual(backfill.metrics()["backfill_remaining"], 0)
@@ -0,0 +1,39 @@
+from apf.consumers.batch_size import AdaptiveBatchSize
+import unittest
+
+
+class AdaptiveBatchSizeTest(unittest.TestCase):
+    def setUp(self):
+        self.controller = AdaptiveBatchSize(
+            min_messages=10, max_messages=1000, target_latency=1.0
+        )
+
+    def test_bad_bounds(self):
+        with self.assertRaises(ValueError):
+            AdaptiveBatchSize(min_messages=0, max_messages=10, target_latency=1)
+        with self.assertRaises(ValueError):
+            AdaptiveBatchSize(min_messages=20, max_messages=10, target_latency=1)
+        with self.assertRaises(ValueError):
+            AdaptiveBatchSize(min_messages=1, max_messages=10, target_latency=0)
+
+    def test_grows_gradually_toward_target(self):
+        sizes = []
+        for _ in range(10):
+            size = self.controller.size
+            sizes.append(self.controller.update(size, size * 0.004))
+        self.assertEqual(sizes[:4], [20, 40, 80, 160])
+        self.assertEqual(sizes[-1], 250)
+
+    def test_shrinks_when_latency_is_exceeded(self):
+        controller = AdaptiveBatchSize(10, 1000, 1.0, initial=500)
+        self.assertEqual(controller.update(500, 5.0), 100)
+
+    def test_shrinks_when_stream_is_quiet(self):
+        controller = AdaptiveBatchSize(10, 1000, 1.0, initial=500)
+        self.assertEqual(controller.update(42, 0.01), 42)
+        self.assertEqual(controller.update(3, 0.01), 10)
+
+    def test_bounds(self):
+        self.controller.size = 1000
+        self.assertEqual(self.controller.update(1000, 0.0), 1000)
+        self.assertEqual(self.controller.update(1000, 1000.0), 10)
@@ -0,0 +1,67 @@
+from apf.consumers.commit_manager import CommitManager
+from confluent_kafka import TopicPartition
+from unittest import mock
+import unittest
+
+
+class FakeProducer:
+    def __init__(self):
+        self.delivered = set()
+
+    def is_delivered(self, batch):
+        return all(b in self.delivered for b in range(batch + 1))
+
+    def wait_delivered(self, batch, timeout):
+        return self.is_delivered(batch)
+
+
+class CommitManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.consumer = mock.MagicMock()
+        self.consumer.assignment.return_value = [
+            TopicPartition("topic", 0),
+            TopicPartition("topic", 1),
+        ]
+        self.producer = FakeProducer()
+
+    def committed(self):
+        offsets = self.consumer.commit.call_args[1]["offsets"]
+        return sorted((tp.partition, tp.offset) for tp in offsets)
+
+    def test_commits_only_delivered_batches(self):
+        manager = CommitManager(self.consumer, interval=0, max_batches=1)
+        manager.add({("topic", 0): 10}, self.producer, 0)
+        self.consumer.commit.assert_not_called()
+        manager.add({("topic", 0): 20, ("topic", 1): 5}, self.producer, 1)
+        self.producer.delivered.add(1)
+        manager.maybe_commit()
+        self.consumer.commit.assert_not_called()
+        self.producer.delivered.add(0)
+        manager.maybe_commit()
+        self.assertEqual(self.committed(), [(0, 20), (1, 5)])
+        self.assertTrue(self.consumer.commit.call_args[1]["asynchronous"])
+
+    def test_batches_commits_by_count(self):
+        manager = CommitManager(self.consumer, interval=3600, max_batches=2)
+        self.producer.delivered.update({0, 1})
+        manager.add({("topic", 0): 10}, self.producer, 0)
+        self.consumer.commit.assert_not_called()
+        manager.add({("topic", 0): 20}, self.producer, 1)
+        self.assertEqual(self.committed(), [(0, 20)])
+
+    def test_flush_commits_synchronously(self):
+        manager = CommitManager(self.consumer, interval=3600, max_batches=100)
+        self.producer.delivered.add(0)
+        manager.add({("topic", 0): 10}, self.producer, 0)
+        manager.flush(timeout=0)
+        self.assertEqual(self.committed(), [(0, 10)])
+        self.assertFalse(self.consumer.commit.call_args[1]["asynchronous"])
+
+    def test_flush_on_revoke_drops_undelivered(self):
+        manager = CommitManager(self.consumer, interval=3600, max_batches=100)
+        manager.add({("topic", 0): 10, ("topic", 1): 3}, self.producer, 0)
+        manager.flush(timeout=0, partitions={("topic", 0)})
+        self.consumer.commit.assert_not_called()
+        self.producer.delivered.add(0)
+        manager.flush(timeout=0)
+        self.assertEqual(self.committed(), [(1, 3)])
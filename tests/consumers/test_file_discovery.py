@@ -0,0 +1,97 @@
+from apf.consumers.backfill import WORKER_COUNT_ENV, WORKER_INDEX_ENV
+from apf.consumers.file_discovery import discover_files, scan_files
+from unittest import mock
+
+import os
+import pytest
+
+
+@pytest.fixture
+def archive(tmp_path):
+    for day in ("2023/01/02", "2023/01/01", "2022/12/31"):
+        directory = tmp_path / day
+        directory.mkdir(parents=True)
+        for name in ("b.avro", "a.avro", "notes.txt"):
+            (directory / name).write_bytes(b"")
+    (tmp_path / "top.avro").write_bytes(b"")
+    return tmp_path
+
+
+def relative(paths, root):
+    return [os.path.relpath(path, root) for path in paths]
+
+
+def test_scan_top_level(archive):
+    assert relative(scan_files(archive), archive) == ["top.avro"]
+
+
+def test_scan_nested_in_order(archive):
+    assert relative(scan_files(archive, recursive=True), archive) == [
+        "2022/12/31/a.avro",
+        "2022/12/31/b.avro",
+        "2023/01/01/a.avro",
+        "2023/01/01/b.avro",
+        "2023/01/02/a.avro",
+        "2023/01/02/b.avro",
+        "top.avro",
+    ]
+
+
+def test_scan_streams_flat_directories(tmp_path):
+    for i in range(100):
+        (tmp_path / f"{i}.avro").write_bytes(b"")
+    scandir = os.scandir
+    read = []
+
+    class Listing:
+        def __init__(self, path):
+            self.listing = scandir(path)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self.listing.close()
+
+        def __iter__(self):
+            for entry in self.listing:
+                read.append(entry.name)
+                yield entry
+
+    with mock.patch("os.scandir", Listing):
+        files = scan_files(tmp_path, ordered=False)
+        first = next(files)
+        assert read == [os.path.basename(first)]
+        assert len(list(files)) == 99
+
+
+def test_scan_unordered_finds_every_file(archive):
+    assert sorted(scan_files(archive, recursive=True, ordered=False)) == list(
+        scan_files(archive, recursive=True)
+    )
+
+
+def test_shards_split_the_archive(archive):
+    config = {"DIRECTORY_PATH": str(archive), "RECURSIVE": True, "SHARD_COUNT": 3}
+    shards = [
+        list(discover_files(dict(config, SHARD_INDEX=index))) for index in range(3)
+    ]
+    files = sorted(path for shard in shards for path in shard)
+    assert files == sorted(scan_files(archive, recursive=True))
+    assert len(files) == len(set(files))
+    assert shards[0] == list(discover_files(dict(config, SHARD_INDEX=0)))
+
+
+def test_shard_from_supervisor_worker(archive):
+    config = {"DIRECTORY_PATH": str(archive), "RECURSIVE": True}
+    environ = {WORKER_INDEX_ENV: "1", WORKER_COUNT_ENV: "2"}
+    with mock.patch.dict(os.environ, environ):
+        files = list(discover_files(config))
+    assert files == list(discover_files(dict(config, SHARD_INDEX=1, SHARD_COUNT=2)))
+
+
+def test_invalid_shard(archive):
+    with pytest.raises(ValueError):
+        discover_files(
+            {"DIRECTORY_PATH": str(archive), "SHARD_INDEX": 2, "SHARD_COUNT": 2}
+        )
@@ -0,0 +1,228 @@
+from apf.consumers import AVROWatchConsumer
+from apf.consumers.file_discovery import scan_files
+from apf.consumers.file_watch import FileCheckpoint, InotifyWatcher, PollingWatcher
+
+import fastavro
+import io
+import os
+import pytest
+import time
+
+SCHEMA = {
+    "type": "record",
+    "name": "test",
+    "fields": [{"name": "id", "type": "int"}],
+}
+
+
+def write_avro(path, ids):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        fastavro.writer(f, SCHEMA, [{"id": i} for i in ids])
+
+
+def test_checkpoint_watermark_waits_for_pending():
+    checkpoint = FileCheckpoint()
+    for name in "abc":
+        checkpoint.add((name,))
+    checkpoint.complete([("b",)])
+    assert checkpoint.watermark is None
+    assert checkpoint.covers(("b",)) and not checkpoint.covers(("a",))
+    checkpoint.complete([("a",)])
+    assert checkpoint.watermark == ("b",)
+    assert checkpoint.completed == set()
+    assert ("c",) in checkpoint.pending and not checkpoint.covers(("c",))
+
+
+def test_checkpoint_persisted(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = FileCheckpoint(path)
+    for key in (("2023", "a"), ("2023", "b"), ("2023", "c")):
+        checkpoint.add(key)
+    checkpoint.complete([("2023", "a"), ("2023", "c")])
+    checkpoint.save()
+    loaded = FileCheckpoint(path)
+    assert loaded.watermark == ("2023", "a")
+    assert loaded.completed == {("2023", "c")}
+    assert not loaded.covers(("2023", "b"))
+
+
+def test_scan_after_skips_old_directories(tmp_path):
+    for day in ("01", "02", "03"):
+        for name in ("a.avro", "b.avro"):
+            write_avro(str(tmp_path / day / name), [])
+    files = scan_files(tmp_path, recursive=True, after=("02", "a.avro"))
+    assert [os.path.relpath(path, tmp_path) for path in files] == [
+        "02/b.avro",
+        "03/a.avro",
+        "03/b.avro",
+    ]
+
+
+def test_polling_waits_for_stable_size(tmp_path):
+    path = str(tmp_path / "a.avro")
+    write_avro(path, [1])
+    watcher = PollingWatcher(lambda: scan_files(tmp_path), interval=0)
+    assert watcher.wait() == []
+    assert watcher.wait() == [path]
+    with open(path, "ab") as f:
+        f.write(b"more")
+    assert watcher.wait() == []
+
+
+@pytest.mark.skipif(not hasattr(os, "uname"), reason="inotify needs Linux")
+def test_inotify_finds_written_files(tmp_path):
+    write_avro(str(tmp_path / "old" / "a.avro"), [1])
+    try:
+        watcher = InotifyWatcher(
+            str(tmp_path), lambda: scan_files(tmp_path, recursive=True), True, 0
+        )
+    except OSError:
+        pytest.skip("inotify is not available")
+    try:
+        assert watcher.wait(0) == [str(tmp_path / "old" / "a.avro")]
+        write_avro(str(tmp_path / "old" / "b.avro"), [2])
+        assert watcher.wait(1) == [str(tmp_path / "old" / "b.avro")]
+        write_avro(str(tmp_path / "new" / "c.avro"), [3])
+        found = []
+        for _ in range(3):
+            found.extend(watcher.wait(0.1))
+        assert str(tmp_path / "new" / "c.avro") in found
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize("watcher", ["polling", "auto"])
+def test_consumer_resumes_from_checkpoint(tmp_path, watcher):
+    directory = tmp_path / "incoming"
+    write_avro(str(directory / "1.avro"), [1, 2])
+    write_avro(str(directory / "2.avro"), [3])
+    config = {
+        "DIRECTORY_PATH": str(directory),
+        "CHECKPOINT_PATH": str(tmp_path / "checkpoint.json"),
+        "NUM_MESSAGES": 2,
+        "WATCHER": watcher,
+        "POLL_INTERVAL": 0.01,
+    }
+    consumer = AVROWatchConsumer(config)
+    messages = consumer.consume()
+    assert [msg["id"] for msg in next(messages)] == [1, 2]
+    consumer.commit()
+    messages.close()
+
+    consumer = AVROWatchConsumer(config)
+    messages = consumer.consume()
+    assert [msg["id"] for msg in next(messages)] == [3]
+    consumer.commit()
+    write_avro(str(directory / "3.avro"), [4])
+    assert [msg["id"] for msg in next(messages)] == [4]
+    messages.close()
+
+    checkpoint = FileCheckpoint(config["CHECKPOINT_PATH"])
+    assert checkpoint.watermark == ("2.avro",)
+
+
+def test_invalid_watcher(tmp_path):
+    with pytest.raises(ValueError):
+        AVROWatchConsumer({"DIRECTORY_PATH": str(tmp_path), "WATCHER": "kqueue"})
+
+
+def test_commit_completes_files_without_records(tmp_path):
+    write_avro(str(tmp_path / "1.avro"), [])
+    write_avro(str(tmp_path / "2.avro"), [1])
+    consumer = AVROWatchConsumer(
+        {"DIRECTORY_PATH": str(tmp_path), "WATCHER": "polling", "POLL_INTERVAL": 0}
+    )
+    messages = consumer.consume()
+    assert next(messages)["id"] == 1
+    consumer.commit()
+    messages.close()
+    assert consumer.checkpoint.watermark == ("2.avro",)
+    assert os.path.exists(tmp_path / ".apf-checkpoint-0-of-1.json")
+
+
+def inotify_watcher(directory, settle):
+    try:
+        return InotifyWatcher(
+            str(directory), lambda: scan_files(directory), settle=settle
+        )
+    except OSError:
+        pytest.skip("inotify is not available")
+
+
+def test_inotify_waits_for_scanned_files_being_written(tmp_path):
+    path = str(tmp_path / "a.avro")
+    content = io.BytesIO()
+    fastavro.writer(content, SCHEMA, [{"id": i} for i in range(6)])
+    content = content.getvalue()
+    writer = open(path, "wb")
+    writer.write(content[: len(content) // 2])
+    writer.flush()
+    watcher = inotify_watcher(tmp_path, settle=5)
+    try:
+        assert watcher.wait(0) == []
+        writer.write(content[len(content) // 2 :])
+        writer.close()
+        assert watcher.wait(1) == [path]
+        assert watcher.scanned == {}
+    finally:
+        watcher.close()
+
+
+def test_inotify_reads_scanned_files_once_settled(tmp_path):
+    path = str(tmp_path / "a.avro")
+    write_avro(path, [1])
+    watcher = inotify_watcher(tmp_path, settle=0.05)
+    try:
+        assert watcher.wait(0) == []
+        time.sleep(0.06)
+        assert watcher.wait(0) == [path]
+    finally:
+        watcher.close()
+
+
+class ListWatcher:
+    def __init__(self, *paths):
+        self.paths = list(paths)
+
+    def wait(self, timeout):
+        paths, self.paths = self.paths, []
+        return paths
+
+    def close(self):
+        pass
+
+
+def test_consumer_reads_repeated_paths_once(tmp_path):
+    path = str(tmp_path / "1.avro")
+    write_avro(path, [1, 2])
+    consumer = AVROWatchConsumer({"DIRECTORY_PATH": str(tmp_path), "NUM_MESSAGES": 5})
+    consumer._create_watcher = lambda: ListWatcher(path, path)
+    messages = consumer.consume()
+    assert [msg["id"] for msg in next(messages)] == [1, 2]
+    messages.close()
+
+
+def test_consumer_reads_late_files_with_warning(tmp_path, caplog):
+    checkpoint = FileCheckpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.add(("2.avro",))
+    checkpoint.complete([("2.avro",)])
+    checkpoint.save()
+    late = str(tmp_path / "1.avro")
+    write_avro(late, [1])
+    consumer = AVROWatchConsumer(
+        {
+            "DIRECTORY_PATH": str(tmp_path),
+            "CHECKPOINT_PATH": checkpoint.path,
+            "NUM_MESSAGES": 5,
+        }
+    )
+    consumer._create_watcher = lambda: ListWatcher(late)
+    messages = consumer.consume()
+    with caplog.at_level("WARNING"):
+        assert [msg["id"] for msg in next(messages)] == [1]
+    assert "arrived after the checkpoint" in caplog.text
+    consumer.commit()
+    messages.close()
+    assert consumer.checkpoint.watermark == ("2.avro",)
+    assert not consumer._is_new(late)
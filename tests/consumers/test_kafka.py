@@ -1,11 +1,40 @@
 from .test_core import GenericConsumerTest
-from apf.consumers.kafka import KafkaJsonConsumer, KafkaConsumer, KafkaSchemalessConsumer
+from apf.consumers.kafka import KafkaJsonConsumer, KafkaConsumer, KafkaRegistryConsumer, KafkaSchemalessConsumer
 import unittest
 from unittest import mock
-from confluent_kafka import KafkaException
+from confluent_kafka import KafkaException, TopicPartition
 from .message_mock import MessageMock, MessageJsonMock, SchemalessMessageMock, SchemalessBadMessageMock
+from apf.consumers.arrow import pyarrow
+from apf.core.schema_registry import FileSchemaRegistry, pack_header
 import datetime
+import fastavro
+import io
 import os
+import tempfile
+
+
+class IndexedJsonMock(MessageMock):
+    def __init__(self, index, error=False):
+        super().__init__(error)
+        self.index = index
+
+    def value(self):
+        return '{"index": %d}' % self.index
+
+
+class PartitionedJsonMock(IndexedJsonMock):
+    def __init__(self, index, partition=0, error=False):
+        super().__init__(index, error)
+        self._partition = partition
+
+    def topic(self):
+        return "apf_test"
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self.index
 
 
 def consume(num_messages=1):
@@ -77,6 +106,73 @@ class TestKafkaConsumer(GenericConsumerTest):
         mock_consumer().consume.side_effect = consume(num_messages=0)
         self.assertRaises(Exception, next, self.component.consume())
 
+    def test_decode_metrics(self, mock_consumer):
+        self.component = KafkaConsumer(self.params)
+        mock_consumer().consume.side_effect = consume(num_messages=3)
+        for _ in self.component.consume(num_messages=3):
+            break
+        metrics = self.component.get_metrics()
+        self.assertEqual(metrics["schema_cache_misses"], 1)
+        self.assertEqual(metrics["schema_cache_hits"], 2)
+        self.assertGreater(metrics["decode_time"], 0)
+
+    def test_fields_projection(self, mock_consumer):
+        self.component = KafkaConsumer({**self.params, "FIELDS": ["objectId", "candid"]})
+        mock_consumer().consume.side_effect = consume(num_messages=3)
+        for msg in self.component.consume(num_messages=3):
+            for message in msg:
+                self.assertEqual(set(message), {"objectId", "candid", "timestamp"})
+            break
+        self.assertGreater(self.component.get_metrics()["projection_bytes_skipped"], 0)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow_batch_format(self, mock_consumer):
+        self.component = KafkaConsumer(
+            {**self.params, "BATCH_FORMAT": "arrow", "FIELDS": ["objectId", "candid"]}
+        )
+        mock_consumer().consume.side_effect = consume(num_messages=3)
+        for batch in self.component.consume(num_messages=3):
+            self.assertEqual(batch.num_rows, 3)
+            self.assertEqual(batch.schema.names, ["objectId", "candid", "timestamp"])
+            break
+
+    def test_adaptive_batch(self, mock_consumer):
+        self.component = KafkaConsumer(
+            {
+                **self.params,
+                "ADAPTIVE_BATCH": {
+                    "MIN_MESSAGES": 2,
+                    "MAX_MESSAGES": 8,
+                    "TARGET_LATENCY": 1.0,
+                },
+            }
+        )
+        mock_consumer().consume.side_effect = lambda num_messages, timeout: [
+            MessageMock(False)
+        ] * num_messages
+        requested = []
+        for msgs in self.component.consume():
+            self.assertIsInstance(msgs, list)
+            requested.append(len(msgs))
+            self.component.report_execution_time(len(msgs), 0.01 * len(msgs))
+            if len(requested) == 4:
+                break
+        self.assertEqual(requested, [2, 4, 8, 8])
+        self.assertEqual(self.component.get_metrics()["batch_size"], 8)
+
+    def test_pause_resume(self, mock_consumer):
+        self.component = KafkaConsumer(self.params)
+        partitions = [TopicPartition("apf_test", 0), TopicPartition("apf_test", 1)]
+        mock_consumer().assignment.return_value = partitions
+        self.component.pause()
+        mock_consumer().pause.assert_called_once_with(partitions)
+        self.component.resume()
+        mock_consumer().resume.assert_called_once_with(partitions)
+
+    def test_bad_batch_format(self, mock_consumer):
+        with self.assertRaises(ValueError):
+            KafkaConsumer({**self.params, "BATCH_FORMAT": "pandas"})
+
     def test_commit_error(self, mock_consumer):
         self.component = KafkaConsumer(self.params)
         mock_consumer().commit.side_effect = KafkaException
@@ -147,6 +243,350 @@ class TestKafkaConsumerDynamicTopic(unittest.TestCase):
             break
         self.assertEqual(self.component.topics, [self.topic1, self.topic2])
 
+    def test_eager_resubscription(self, mock_consumer):
+        self.component = KafkaConsumer(self.params)
+        self.component._subscribe_to_new_topics()
+        mock_consumer().unsubscribe.assert_called()
+
+    def test_cooperative_resubscription(self, mock_consumer):
+        import copy
+
+        params = copy.deepcopy(self.params)
+        params["PARAMS"]["partition.assignment.strategy"] = "cooperative-sticky"
+        self.component = KafkaConsumer(params)
+        self.assertTrue(self.component.cooperative)
+        mock_consumer.reset_mock()
+        self.component._subscribe_to_new_topics()
+        mock_consumer().unsubscribe.assert_not_called()
+        mock_consumer().subscribe.assert_called_once()
+        self.assertEqual(
+            mock_consumer().subscribe.call_args[0][0], [self.topic1, self.topic2]
+        )
+
+    def test_rebalance_metrics(self, mock_consumer):
+        self.component = KafkaConsumer(self.params)
+        self.component._subscribe_to_new_topics()
+        self.component._on_assign(None, [TopicPartition(self.topic2, 0)])
+        metrics = self.component.get_metrics()
+        self.assertEqual(metrics["rebalances"], 1)
+        self.assertGreaterEqual(metrics["rebalance_time"], 0)
+        self.component._on_assign(None, [])
+        self.assertEqual(self.component.get_metrics()["rebalances"], 1)
+        self.component._on_revoke(None, [TopicPartition(self.topic1, 0)])
+        self.component._on_assign(None, [TopicPartition(self.topic1, 0)])
+        self.assertEqual(self.component.get_metrics()["rebalances"], 2)
+
+
+@mock.patch("apf.consumers.kafka.Consumer")
+class TestKafkaConsumerDeserializePool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.params = {
+            "TOPICS": ["apf_test"],
+            "PARAMS": {
+                "bootstrap.servers": "127.0.0.1:9092",
+                "group.id": "apf_test",
+            },
+            "NUM_MESSAGES": 20,
+            "DESERIALIZE_WORKERS": 2,
+        }
+
+    def test_keeps_batch_order(self, mock_consumer):
+        for pool_type in ["thread", "process"]:
+            batch = [IndexedJsonMock(i) for i in range(20)]
+            mock_consumer().consume.side_effect = [batch]
+            params = dict(self.params, DESERIALIZE_POOL=pool_type)
+            component = KafkaJsonConsumer(params)
+            msgs = next(component.consume())
+            self.assertEqual([msg["index"] for msg in msgs], list(range(20)))
+            self.assertTrue(all("timestamp" in msg for msg in msgs))
+            self.assertEqual(component.deserialize_pool.pool_type, pool_type)
+            component.deserialize_pool.shutdown()
+
+    def test_avro_process_pool(self, mock_consumer):
+        mock_consumer().consume.side_effect = [[MessageMock(False)] * 4]
+        component = KafkaConsumer(self.params)
+        msgs = next(component.consume())
+        self.assertEqual(len(msgs), 4)
+        self.assertEqual(msgs[0]["objectId"], msgs[3]["objectId"])
+        component.deserialize_pool.shutdown()
+
+    def test_partition_eof(self, mock_consumer):
+        batch = [IndexedJsonMock(0), IndexedJsonMock(1, error=True)]
+        mock_consumer().consume.side_effect = [batch]
+        component = KafkaJsonConsumer(self.params)
+        self.assertEqual(list(component.consume()), [])
+        self.assertIsNone(component.deserialize_pool)
+
+    def test_bad_pool_type(self, mock_consumer):
+        mock_consumer().consume.side_effect = [[IndexedJsonMock(0)] * 2]
+        component = KafkaJsonConsumer(dict(self.params, DESERIALIZE_POOL="gpu"))
+        with self.assertRaises(ValueError):
+            next(component.consume())
+
+
+@mock.patch("apf.consumers.kafka.Consumer")
+class TestKafkaConsumerPrefetch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.params = {
+            "TOPICS": ["apf_test"],
+            "PARAMS": {
+                "bootstrap.servers": "127.0.0.1:9092",
+                "group.id": "apf_test",
+            },
+            "NUM_MESSAGES": 2,
+            "PREFETCH_BATCHES": 2,
+        }
+
+    def batches(self):
+        return [
+            [PartitionedJsonMock(0), PartitionedJsonMock(0, partition=1)],
+            [PartitionedJsonMock(1), PartitionedJsonMock(2)],
+            [PartitionedJsonMock(3, error=True)],
+        ]
+
+    def test_prefetch_keeps_order(self, mock_consumer):
+        mock_consumer().consume.side_effect = self.batches()
+        component = KafkaJsonConsumer(self.params)
+        msgs = list(component.consume())
+        self.assertEqual([[m["index"] for m in batch] for batch in msgs], [[0, 0], [1, 2]])
+        self.assertIsNone(component.prefetcher)
+
+    def test_commits_finished_batch_offsets(self, mock_consumer):
+        mock_consumer().consume.side_effect = self.batches()
+        mock_consumer().assignment.return_value = [
+            TopicPartition("apf_test", 0),
+            TopicPartition("apf_test", 1),
+        ]
+        component = KafkaJsonConsumer(self.params)
+        consumed = component.consume()
+        next(consumed)
+        component.commit()
+        offsets = mock_consumer().commit.call_args[1]["offsets"]
+        self.assertEqual(
+            sorted((tp.partition, tp.offset) for tp in offsets), [(0, 1), (1, 1)]
+        )
+        next(consumed)
+        component.commit()
+        offsets = mock_consumer().commit.call_args[1]["offsets"]
+        self.assertEqual([(tp.partition, tp.offset) for tp in offsets], [(0, 3)])
+        consumed.close()
+
+    def test_commit_explicit_offsets(self, mock_consumer):
+        mock_consumer().consume.side_effect = self.batches()
+        mock_consumer().assignment.return_value = [TopicPartition("apf_test", 0)]
+        component = KafkaJsonConsumer(self.params)
+        consumed = component.consume()
+        next(consumed)
+        self.assertEqual(
+            component.consumed_offsets(),
+            [(("apf_test", 0), 0), (("apf_test", 1), 0)],
+        )
+        component.commit_offsets({("apf_test", 0): 1, ("apf_test", 1): 1})
+        offsets = mock_consumer().commit.call_args[1]["offsets"]
+        self.assertEqual([(tp.partition, tp.offset) for tp in offsets], [(0, 1)])
+        consumed.close()
+
+    def test_commit_skips_revoked_partitions(self, mock_consumer):
+        mock_consumer().consume.side_effect = self.batches()
+        mock_consumer().assignment.return_value = [TopicPartition("apf_test", 1)]
+        component = KafkaJsonConsumer(self.params)
+        consumed = component.consume()
+        next(consumed)
+        component.commit()
+        offsets = mock_consumer().commit.call_args[1]["offsets"]
+        self.assertEqual([(tp.partition, tp.offset) for tp in offsets], [(1, 1)])
+        consumed.close()
+
+    def test_revoke_discards_prefetched_messages(self, mock_consumer):
+        from apf.consumers.prefetch import BatchPrefetcher
+
+        prefetcher = BatchPrefetcher(iter([]), 2)
+        batch = [PartitionedJsonMock(0), PartitionedJsonMock(0, partition=1)]
+        prefetcher.queue.put((batch, [{"index": 0}, {"index": 1}], {}))
+        component = KafkaJsonConsumer(self.params)
+        component.prefetcher = prefetcher
+        component._on_revoke(None, [TopicPartition("apf_test", 0)])
+        messages, deserialized, _ = prefetcher.queue.get_nowait()
+        self.assertEqual([m.partition() for m in messages], [1])
+        self.assertEqual(deserialized, [{"index": 1}])
+        component.prefetcher = None
+
+    def test_prefetch_error(self, mock_consumer):
+        mock_consumer().consume.side_effect = KafkaException
+        component = KafkaJsonConsumer(self.params)
+        with self.assertRaises(KafkaException):
+            next(component.consume())
+
+
+@mock.patch("apf.consumers.kafka.Consumer")
+class TestKafkaConsumerPartitionMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.params = {
+            "TOPICS": ["apf_test"],
+            "PARAMS": {
+                "bootstrap.servers": "127.0.0.1:9092",
+                "group.id": "apf_test",
+            },
+            "NUM_MESSAGES": 2,
+            "PARTITION_METRICS": {"INTERVAL": 0},
+        }
+
+    def test_partition_metrics(self, mock_consumer):
+        mock_consumer().consume.side_effect = [
+            [PartitionedJsonMock(0), PartitionedJsonMock(0, partition=1)],
+            [PartitionedJsonMock(1), PartitionedJsonMock(10)],
+        ]
+        mock_consumer().assignment.return_value = [
+            TopicPartition("apf_test", 0),
+            TopicPartition("apf_test", 1),
+        ]
+        mock_consumer().get_watermark_offsets.return_value = (0, 20)
+        component = KafkaJsonConsumer(self.params)
+        consumed = component.consume()
+        next(consumed)
+        next(consumed)
+        partitions = component.get_metrics()["partitions"]
+        consumed.close()
+        mock_consumer().get_watermark_offsets.assert_called_with(
+            mock.ANY, cached=True
+        )
+        by_partition = {p["partition"]: p for p in partitions}
+        self.assertEqual(by_partition[0]["lag"], 9)
+        self.assertEqual(by_partition[1]["lag"], 19)
+        self.assertEqual(by_partition[0]["message_sizes"], [12, 12, 13])
+        self.assertGreater(by_partition[0]["messages_per_second"], 0)
+        self.assertGreater(by_partition[1]["bytes_per_second"], 0)
+
+    def test_refresh_interval(self, mock_consumer):
+        self.params["PARTITION_METRICS"]["INTERVAL"] = 60
+        component = KafkaJsonConsumer(self.params)
+        self.assertNotIn("partitions", component.get_metrics())
+
+
+@mock.patch("apf.consumers.kafka.Consumer")
+class TestKafkaConsumerBackfill(unittest.TestCase):
+    def setUp(self) -> None:
+        self.params = {
+            "TOPICS": ["apf_test"],
+            "PARAMS": {
+                "bootstrap.servers": "127.0.0.1:9092",
+                "group.id": "apf_test",
+            },
+            "NUM_MESSAGES": 2,
+            "BACKFILL": {"WORKER_INDEX": 0, "WORKER_COUNT": 1},
+        }
+
+    def setup_consumer(self, mock_consumer):
+        consumer = mock_consumer()
+        consumer.list_topics().topics = {
+            "apf_test": mock.MagicMock(partitions={0: None, 1: None})
+        }
+        consumer.get_watermark_offsets.return_value = (0, 2)
+        consumer.position.side_effect = lambda partitions: partitions
+        consumer.assignment.return_value = [
+            TopicPartition("apf_test", 0),
+            TopicPartition("apf_test", 1),
+        ]
+        return consumer
+
+    def test_stops_at_end_offsets(self, mock_consumer):
+        consumer = self.setup_consumer(mock_consumer)
+        consumer.consume.side_effect = [
+            [PartitionedJsonMock(0), PartitionedJsonMock(0, error=True)],
+            [PartitionedJsonMock(1), PartitionedJsonMock(2)],
+            [PartitionedJsonMock(0, partition=1), PartitionedJsonMock(1, partition=1)],
+        ]
+        component = KafkaJsonConsumer(self.params)
+        consumer.assign.assert_called_once()
+        consumer.subscribe.assert_not_called()
+        batches = []
+        for batch in component.consume():
+            batches.append([m["index"] for m in batch])
+            component.commit()
+        self.assertEqual(batches, [[0], [1], [0, 1]])
+        self.assertEqual(consumer.consume.call_count, 3)
+        consumer.pause.assert_called()
+        offsets = consumer.commit.call_args[1]["offsets"]
+        self.assertEqual([(tp.partition, tp.offset) for tp in offsets], [(1, 2)])
+        metrics = component.get_metrics()
+        self.assertEqual(metrics["backfill_remaining"], 0)
+        self.assertEqual(metrics["backfill_progress"], 1.0)
+
+    def test_requires_topics(self, mock_consumer):
+        self.setup_consumer(mock_consumer)
+        del self.params["TOPICS"]
+        with self.assertRaises(Exception):
+            KafkaJsonConsumer(self.params)
+
+
+@mock.patch("apf.consumers.kafka.Consumer")
+class TestKafkaConsumerCommitManager(unittest.TestCase):
+    def setUp(self) -> None:
+        self.params = {
+            "TOPICS": ["apf_test"],
+            "PARAMS": {
+                "bootstrap.servers": "127.0.0.1:9092",
+                "group.id": "apf_test",
+            },
+            "NUM_MESSAGES": 2,
+            "COMMIT_MANAGER": {"INTERVAL": 0},
+        }
+
+    def test_commit_delivered(self, mock_consumer):
+        mock_consumer().consume.side_effect = [
+            [PartitionedJsonMock(4), PartitionedJsonMock(7)]
+        ]
+        mock_consumer().assignment.return_value = [TopicPartition("apf_test", 0)]
+        component = KafkaJsonConsumer(self.params)
+        self.assertTrue(component.delivery_aware_commit)
+        producer = mock.MagicMock()
+        producer.transactional = False
+        producer.end_batch.return_value = 0
+        producer.is_delivered.return_value = True
+        next(component.consume())
+        component.commit_delivered(producer)
+        offsets = mock_consumer().commit.call_args[1]["offsets"]
+        self.assertEqual([(tp.partition, tp.offset) for tp in offsets], [(0, 8)])
+
+    def test_commit_delivered_while_idle(self, mock_consumer):
+        mock_consumer().consume.side_effect = [
+            [PartitionedJsonMock(4), PartitionedJsonMock(7)],
+            [],
+            [MessageMock(True)],
+        ]
+        mock_consumer().assignment.return_value = [TopicPartition("apf_test", 0)]
+        component = KafkaJsonConsumer(self.params)
+        producer = mock.MagicMock()
+        producer.transactional = False
+        producer.end_batch.return_value = 0
+        producer.is_delivered.return_value = False
+        messages = component.consume()
+        next(messages)
+        component.commit_delivered(producer)
+        mock_consumer().commit.assert_not_called()
+        producer.is_delivered.return_value = True
+        self.assertEqual(list(messages), [])
+        offsets = mock_consumer().commit.call_args[1]["offsets"]
+        self.assertEqual([(tp.partition, tp.offset) for tp in offsets], [(0, 8)])
+
+    def test_keep_alive_rewinds_unpaused_partitions(self, mock_consumer):
+        mock_consumer().poll.return_value = PartitionedJsonMock(9, partition=1)
+        mock_consumer().assignment.return_value = [TopicPartition("apf_test", 1)]
+        component = KafkaJsonConsumer(self.params)
+        component.keep_alive()
+        tp = mock_consumer().seek.call_args[0][0]
+        self.assertEqual((tp.partition, tp.offset), (1, 9))
+        mock_consumer().pause.assert_called_once_with([TopicPartition("apf_test", 1)])
+
+    def test_revoke_flushes_commits(self, mock_consumer):
+        component = KafkaJsonConsumer(self.params)
+        component.commit_manager = mock.MagicMock()
+        component._on_revoke(None, [TopicPartition("apf_test", 0)])
+        component.commit_manager.flush.assert_called_once_with(
+            10.0, partitions={("apf_test", 0)}
+        )
+        component.commit_manager = None
+
 
 class TestKafkaJsonConsumer(unittest.TestCase):
     component = KafkaJsonConsumer
@@ -225,3 +665,82 @@ class TestKafkaSchemalessConsumer(unittest.TestCase):
 
         with self.assertRaises(Exception):
             consumer._deserialize_message(schemaless_avro)
+
+
+class WireMessageMock(MessageMock):
+    def __init__(self, payload):
+        super().__init__(False)
+        self.payload = payload
+
+    def value(self):
+        return self.payload
+
+
+@mock.patch("apf.consumers.kafka.Consumer")
+class TestKafkaRegistryConsumer(unittest.TestCase):
+    SCHEMA = {
+        "namespace": "test.avro",
+        "type": "record",
+        "name": "test",
+        "fields": [
+            {"name": "key", "type": "string"},
+            {"name": "int", "type": "int"},
+        ],
+    }
+
+    def setUp(self) -> None:
+        self.registry_path = tempfile.mkdtemp()
+        self.params = {
+            "TOPICS": ["apf_test"],
+            "PARAMS": {
+                "bootstrap.servers": "127.0.0.1:9092",
+                "group.id": "apf_test",
+            },
+            "SCHEMA_REGISTRY": {
+                "CLASS": "apf.core.schema_registry.FileSchemaRegistry",
+                "PARAMS": {"path": self.registry_path},
+            },
+        }
+
+    def wire_message(self, schema, record):
+        registry = FileSchemaRegistry(self.registry_path)
+        out = io.BytesIO()
+        out.write(pack_header(registry.register("test", schema)))
+        fastavro.schemaless_writer(out, fastavro.parse_schema(schema), record)
+        return WireMessageMock(out.getvalue())
+
+    def test_no_registry(self, _):
+        self.params.pop("SCHEMA_REGISTRY")
+        with self.assertRaises(Exception):
+            KafkaRegistryConsumer(self.params)
+
+    def test_deserialize(self, mock_consumer):
+        messages = [self.wire_message(self.SCHEMA, {"key": "a", "int": i}) for i in range(3)]
+        mock_consumer().consume.side_effect = [messages, [MessageMock(True)]]
+        component = KafkaRegistryConsumer(self.params)
+        for batch in component.consume(num_messages=3):
+            self.assertEqual([m["int"] for m in batch], [0, 1, 2])
+            break
+        metrics = component.get_metrics()
+        self.assertEqual(metrics["schema_cache_misses"], 1)
+        self.assertEqual(metrics["schema_cache_hits"], 2)
+
+    def test_schema_lru(self, _):
+        other_schema = dict(self.SCHEMA, name="other")
+        first = self.wire_message(self.SCHEMA, {"key": "a", "int": 1})
+        second = self.wire_message(other_schema, {"key": "b", "int": 2})
+        component = KafkaRegistryConsumer({**self.params, "SCHEMA_CACHE_SIZE": 1})
+        for message in [first, second, first]:
+            component._deserialize_message(message)
+        self.assertEqual(component.decoder.stats["schema_cache_misses"], 3)
+        self.assertEqual(len(component.decoder.headers), 1)
+
+    def test_fields(self, _):
+        component = KafkaRegistryConsumer({**self.params, "FIELDS": ["int"]})
+        message = self.wire_message(self.SCHEMA, {"key": "a", "int": 1})
+        self.assertEqual(component._deserialize_message(message), {"int": 1})
+
+    def test_bad_message(self, _):
+        component = KafkaRegistryConsumer(self.params)
+        with self.assertRaises(ValueError):
+            component._deserialize_message(MessageMock(False))
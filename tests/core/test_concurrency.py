@@ -0,0 +1,61 @@
+from apf.core.concurrency import KeyAffineExecutor, OffsetTracker
+import pytest
+import threading
+
+
+def test_only_contiguous_offsets_are_committable():
+    tracker = OffsetTracker()
+    tracker.add([(("a", 0), 0), (("a", 0), 1), (("a", 1), 5), (("a", 0), 2)])
+    tracker.complete([(("a", 0), 1), (("a", 1), 5)])
+    assert tracker.committable() == {("a", 1): 6}
+    tracker.complete([(("a", 0), 2)])
+    assert tracker.committable() == {}
+    assert len(tracker) == 3
+    tracker.complete([(("a", 0), 0)])
+    assert tracker.committable() == {("a", 0): 3}
+    assert len(tracker) == 0
+
+
+def test_same_key_same_worker():
+    executor = KeyAffineExecutor(4, "oid")
+    messages = [{"oid": f"ZTF{i % 10}"} for i in range(100)]
+    groups = executor.split(messages)
+    for positions in groups.values():
+        assert positions == sorted(positions)
+    for i, message in enumerate(messages):
+        assert i in groups[executor.worker_for(message)]
+        assert executor.worker_for(message) == executor.worker_for(dict(message))
+    executor.shutdown()
+
+
+def test_workers_run_in_parallel():
+    executor = KeyAffineExecutor(2, "oid")
+    barrier = threading.Barrier(2, timeout=5)
+    futures = [executor.submit(i, barrier.wait) for i in range(2)]
+    for future in futures:
+        future.result()
+    executor.shutdown()
+
+
+def test_needs_workers():
+    with pytest.raises(ValueError):
+        KeyAffineExecutor(0, "oid")
+
+
+def test_shutdown_without_wait_cancels_queued_tasks():
+    executor = KeyAffineExecutor(1, "oid")
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    running = executor.submit(0, block)
+    queued = executor.submit(0, lambda: None)
+    started.wait(5)
+    executor.shutdown(wait=False)
+    release.set()
+    assert queued.cancelled()
+    running.result()
+    assert not executor.futures
@@ -0,0 +1,82 @@
+from apf.core.dedup import BloomDeduplicator, GenericDeduplicator, LRUDeduplicator
+import json
+import pickle
+import pytest
+
+
+def test_lru_deduplicator():
+    dedup = LRUDeduplicator(capacity=2)
+    assert not dedup.contains(1)
+    dedup.add([1, 2])
+    assert dedup.contains(1)
+    dedup.add([3])
+    assert not dedup.contains(2)
+    assert dedup.contains(1)
+    assert dedup.contains(3)
+
+
+def test_lru_deduplicator_persistence(tmp_path):
+    path = str(tmp_path / "dedup.state")
+    dedup = LRUDeduplicator(capacity=10, path=path)
+    dedup.add([1, 2])
+    dedup.save()
+    dedup = LRUDeduplicator(capacity=10, path=path)
+    assert dedup.contains(1)
+    assert dedup.contains(2)
+    assert not dedup.contains(3)
+
+
+def test_bloom_deduplicator():
+    dedup = BloomDeduplicator(capacity=1000, error_rate=0.01)
+    dedup.add(range(1000))
+    assert all(dedup.contains(key) for key in range(1000))
+    false_positives = sum(dedup.contains(key) for key in range(1000, 11000))
+    assert false_positives < 300
+
+
+def test_bloom_deduplicator_rotation(mocker):
+    now = mocker.patch("apf.core.dedup.time.time", return_value=0)
+    dedup = BloomDeduplicator(capacity=100, window=10)
+    dedup.add([1])
+    now.return_value = 15
+    assert dedup.contains(1)
+    now.return_value = 25
+    assert not dedup.contains(1)
+
+
+def test_bloom_deduplicator_persistence(tmp_path):
+    path = str(tmp_path / "dedup.state")
+    dedup = BloomDeduplicator(capacity=100, path=path)
+    dedup.add(["a"])
+    dedup.save()
+    assert BloomDeduplicator(capacity=100, path=path).contains("a")
+    assert not BloomDeduplicator(capacity=1000, path=path).contains("a")
+
+
+def test_bloom_deduplicator_bad_error_rate():
+    with pytest.raises(ValueError):
+        BloomDeduplicator(error_rate=1.5)
+
+
+def test_deduplicator_state_is_plain_data(tmp_path):
+    path = tmp_path / "dedup.state"
+    dedup = LRUDeduplicator(capacity=10, path=str(path))
+    dedup.add([1, "b"])
+    dedup.save()
+    assert json.loads(path.read_text()) == [1, "b"]
+
+
+def test_deduplicator_ignores_invalid_state(tmp_path):
+    path = tmp_path / "dedup.state"
+    path.write_bytes(pickle.dumps({"keys": [1]}))
+    assert not LRUDeduplicator(capacity=10, path=str(path)).contains(1)
+    assert not BloomDeduplicator(capacity=10, path=str(path)).contains(1)
+
+
+def test_incomplete_deduplicator():
+    class IncompleteDeduplicator(GenericDeduplicator):
+        def contains(self, key):
+            return False
+
+    with pytest.raises(TypeError):
+        IncompleteDeduplicator()
@@ -0,0 +1,71 @@
+from apf.core.schema_cache import SchemaCache, fingerprint, step_schemas
+import json
+import pytest
+
+SCHEMA = {
+    "type": "record",
+    "name": "alert",
+    "fields": [{"name": "candid", "type": "long"}],
+}
+
+
+@pytest.fixture
+def cache():
+    return SchemaCache()
+
+
+def test_fingerprint_ignores_key_order():
+    reordered = {"fields": SCHEMA["fields"], "name": "alert", "type": "record"}
+    assert fingerprint(reordered) == fingerprint(SCHEMA)
+    with_default = {
+        **SCHEMA,
+        "fields": [{"name": "candid", "type": "long", "default": 0}],
+    }
+    assert fingerprint(with_default) != fingerprint(SCHEMA)
+
+
+def test_parse_schema_once(cache):
+    parsed = cache.parse_schema(SCHEMA)
+    assert cache.parse_schema(json.loads(json.dumps(SCHEMA))) is parsed
+    assert cache.parse_schema(parsed) is parsed
+    assert cache.stats == {
+        "schema_lookups_hits": 1,
+        "schema_lookups_misses": 1,
+        "schemas_cached": 1,
+    }
+
+
+def test_max_size():
+    cache = SchemaCache(max_size=2)
+    schemas = [dict(SCHEMA, name=f"alert{i}") for i in range(3)]
+    first = cache.parse_schema(schemas[0])
+    cache.parse_schema(schemas[1])
+    cache.parse_schema(schemas[0])
+    cache.parse_schema(schemas[2])
+    assert cache.stats["schemas_cached"] == 2
+    assert cache.parse_schema(schemas[0]) is first
+    cache.parse_schema(schemas[1])
+    assert cache.stats["schema_lookups_misses"] == 4
+
+
+def test_load_schema(cache, tmp_path):
+    path = tmp_path / "alert.avsc"
+    path.write_text(json.dumps(SCHEMA))
+    parsed = cache.load_schema(str(path))
+    assert parsed["name"] == "alert"
+    assert cache.load_schema(str(path)) is parsed
+    assert cache.stats["schema_lookups_hits"] == 1
+
+
+def test_warm_up(cache, tmp_path):
+    path = tmp_path / "alert.avsc"
+    path.write_text(json.dumps(SCHEMA))
+    config = {
+        "PRODUCER_CONFIG": {"SCHEMA": SCHEMA},
+        "CONSUMER_CONFIG": {"SCHEMA_PATH": str(path)},
+    }
+    assert cache.warm_up(step_schemas(config)) == 2
+    cache.parse_schema(SCHEMA)
+    cache.load_schema(str(path))
+    assert cache.stats["schema_lookups_hits"] == 2
+    assert cache.stats["schemas_cached"] == 2
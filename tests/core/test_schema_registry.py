@@ -0,0 +1,93 @@
+from apf.core.schema_registry import (
+    ConfluentSchemaRegistry,
+    FileSchemaRegistry,
+    GenericSchemaRegistry,
+    MemorySchemaRegistry,
+    load_registry,
+    pack_header,
+    unpack_header,
+)
+from unittest import mock
+import io
+import json
+import pytest
+
+SCHEMA = {
+    "namespace": "test.avro",
+    "type": "record",
+    "name": "test",
+    "fields": [{"name": "key", "type": "string"}],
+}
+OTHER_SCHEMA = dict(SCHEMA, name="other")
+
+
+def test_wire_header():
+    header = pack_header(258)
+    assert header == b"\x00\x00\x00\x01\x02"
+    assert unpack_header(header + b"payload") == 258
+
+
+def test_wire_header_bad_payload():
+    with pytest.raises(ValueError):
+        unpack_header(b"Obj\x01")
+    with pytest.raises(ValueError):
+        unpack_header(b"\x00\x00")
+
+
+def test_memory_registry():
+    registry = MemorySchemaRegistry()
+    schema_id = registry.register("test", SCHEMA)
+    assert registry.register("other-subject", dict(SCHEMA)) == schema_id
+    assert registry.register("test", OTHER_SCHEMA) != schema_id
+    assert registry.get_schema(schema_id) == SCHEMA
+    with pytest.raises(KeyError):
+        registry.get_schema(100)
+
+
+def test_file_registry(tmp_path):
+    registry = FileSchemaRegistry(str(tmp_path / "schemas"))
+    schema_id = registry.register("test", SCHEMA)
+    other_id = registry.register("test", OTHER_SCHEMA)
+    reopened = FileSchemaRegistry(str(tmp_path / "schemas"))
+    assert reopened.register("test", SCHEMA) == schema_id
+    assert reopened.get_schema(other_id) == OTHER_SCHEMA
+    with pytest.raises(KeyError):
+        reopened.get_schema(100)
+
+
+def test_confluent_registry():
+    responses = [
+        io.BytesIO(json.dumps({"id": 7}).encode()),
+        io.BytesIO(json.dumps({"schema": json.dumps(SCHEMA)}).encode()),
+    ]
+    registry = ConfluentSchemaRegistry("http://registry:8081/", basic_auth="user:pw")
+    with mock.patch(
+        "apf.core.schema_registry.urllib.request.urlopen", side_effect=responses
+    ) as urlopen:
+        assert registry.register("test-value", SCHEMA) == 7
+        assert registry.get_schema(7) == SCHEMA
+    register_request = urlopen.call_args_list[0][0][0]
+    assert register_request.full_url == "http://registry:8081/subjects/test-value/versions"
+    assert json.loads(register_request.data) == {"schema": json.dumps(SCHEMA)}
+    assert register_request.get_header("Authorization") == "Basic dXNlcjpwdw=="
+    get_request = urlopen.call_args_list[1][0][0]
+    assert get_request.full_url == "http://registry:8081/schemas/ids/7"
+
+
+def test_load_registry():
+    registry = load_registry(
+        {
+            "CLASS": "apf.core.schema_registry.MemorySchemaRegistry",
+            "PARAMS": {"schemas": {"1": SCHEMA}},
+        }
+    )
+    assert registry.get_schema(1) == SCHEMA
+
+
+def test_incomplete_registry():
+    class IncompleteRegistry(GenericSchemaRegistry):
+        def get_schema(self, schema_id):
+            return {}
+
+    with pytest.raises(TypeError):
+        IncompleteRegistry()
@@ -1,10 +1,12 @@
 from datetime import datetime, timezone
+from apf.consumers import GenericConsumer
 from apf.core.step import (
     DefaultMetricsProducer,
     GenericStep,
     GenericProducer,
 )
 import pytest
+import time
 
 
 class MockStep(GenericStep):
@@ -69,6 +71,27 @@ def test_get_batch_extra_metrics(basic_config):
     del _step
 
 
+def test_get_record_batch_extra_metrics(basic_config):
+    pyarrow = pytest.importorskip("pyarrow")
+    basic_config["METRICS_CONFIG"]["EXTRA_METRICS"] = [
+        "oid",
+        "ra",
+        {"key": "candid", "alias": "str_candid", "format": lambda x: str(x)},
+    ]
+    message = pyarrow.RecordBatch.from_pylist(
+        [{"oid": "TEST", "candid": 1}, {"oid": "TEST2", "candid": 2}]
+    )
+    _step = MockStep(config=basic_config)
+    extra_metrics = _step.get_extra_metrics(message)
+    assert extra_metrics == {
+        "oid": ["TEST", "TEST2"],
+        "ra": [None, None],
+        "str_candid": ["1", "2"],
+        "n_messages": 2,
+    }
+    del _step
+
+
 def test_get_value(basic_config):
     basic_config["METRICS_CONFIG"] = {
         "CLASS": "apf.core.step.DefaultMetricsProducer",
@@ -167,3 +190,234 @@ def test_start_with_execute_returning_iterable(basic_config, mocker):
     step = StepWithIterableExecute(config=basic_config)
     step.start()
     write_mock.assert_called()
+
+
+def test_produce_uses_produce_batch(step, mocker):
+    produce_batch = mocker.patch.object(step.producer, "produce_batch")
+    produce = mocker.patch.object(step.producer, "produce")
+    observe = mocker.patch.object(step.prometheus_metrics.produce_time, "observe")
+    step.produce([{"candid": 1}, {"candid": 2}])
+    produce_batch.assert_called_once_with([{"candid": 1}, {"candid": 2}])
+    produce.assert_not_called()
+    observe.assert_called_once()
+
+
+def test_delivery_aware_commit(step, mocker):
+    mocker.patch.object(
+        type(step.consumer),
+        "delivery_aware_commit",
+        new_callable=mocker.PropertyMock,
+        return_value=True,
+    )
+    commit = mocker.patch.object(step.consumer, "commit")
+    commit_delivered = mocker.patch.object(step.consumer, "commit_delivered")
+    step.start()
+    commit.assert_not_called()
+    commit_delivered.assert_called_once_with(step.producer)
+
+
+def test_post_execute_reports_execution_time(step, mocker):
+    report = mocker.patch.object(step.consumer, "report_execution_time")
+    mocker.patch.object(step.consumer, "get_metrics", return_value={"batch_size": 20})
+    step.message = [{"candid": 1}, {"candid": 2}]
+    step.metrics["timestamp_received"] = datetime.now(timezone.utc)
+    step._post_execute({})
+    report.assert_called_once_with(2, step.metrics["execution_time"])
+    step.prometheus_metrics.batch_size.set.assert_called_with(20)
+    assert step.metrics["batch_size"] == 20
+
+
+def test_partition_metrics(step, mocker):
+    partitions = [
+        {
+            "topic": "topic",
+            "partition": 0,
+            "lag": 5,
+            "messages_per_second": 2.0,
+            "bytes_per_second": 20.0,
+            "message_sizes": [10, 10],
+        }
+    ]
+    mocker.patch.object(
+        step.consumer, "get_metrics", return_value={"partitions": partitions}
+    )
+    step.message = [{"candid": 1}, {"candid": 2}]
+    step.metrics["timestamp_received"] = datetime.now(timezone.utc)
+    step._post_execute({})
+    prometheus = step.prometheus_metrics
+    prometheus.partition_lag.labels.assert_called_with("topic", "0")
+    prometheus.partition_lag.labels().set.assert_called_with(5)
+    assert prometheus.message_size.labels().observe.call_count == 2
+    assert "message_sizes" not in step.metrics["partitions"][0]
+    assert step.metrics["partitions"][0]["lag"] == 5
+
+
+def test_backpressure(basic_config, mocker):
+    basic_config["BACKPRESSURE"] = {"HIGH_WATERMARK": 10, "LOW_WATERMARK": 2}
+    mocker.patch.object(MockStep, "_write_success")
+    step = MockStep(config=basic_config)
+    queue = iter([12, 12, 8, 5, 2])
+    queue_length = mocker.PropertyMock(side_effect=lambda: next(queue))
+    mocker.patch.object(type(step.producer), "queue_length", queue_length)
+    poll = mocker.patch.object(step.producer, "poll")
+    pause = mocker.patch.object(step.consumer, "pause")
+    resume = mocker.patch.object(step.consumer, "resume")
+    keep_alive = mocker.patch.object(step.consumer, "keep_alive")
+    step.start()
+    pause.assert_called_once()
+    resume.assert_called_once()
+    assert poll.call_count == 2
+    assert keep_alive.call_count == 2
+
+
+def test_backpressure_timeout(basic_config, mocker):
+    basic_config["BACKPRESSURE"] = {"HIGH_WATERMARK": 10, "TIMEOUT": 0}
+    mocker.patch.object(MockStep, "_write_success")
+    step = MockStep(config=basic_config)
+    mocker.patch.object(
+        type(step.producer), "queue_length", mocker.PropertyMock(return_value=12)
+    )
+    poll = mocker.patch.object(step.producer, "poll")
+    resume = mocker.patch.object(step.consumer, "resume")
+    step.start()
+    poll.assert_not_called()
+    resume.assert_called_once()
+
+
+def test_backpressure_below_high_watermark(basic_config, mocker):
+    basic_config["BACKPRESSURE"] = {"HIGH_WATERMARK": 10}
+    mocker.patch.object(MockStep, "_write_success")
+    step = MockStep(config=basic_config)
+    assert step.low_watermark == 5
+    mocker.patch.object(
+        type(step.producer), "queue_length", mocker.PropertyMock(return_value=9)
+    )
+    pause = mocker.patch.object(step.consumer, "pause")
+    step.start()
+    pause.assert_not_called()
+
+
+def test_backpressure_bad_watermarks(basic_config):
+    basic_config["BACKPRESSURE"] = {"HIGH_WATERMARK": 10, "LOW_WATERMARK": 20}
+    with pytest.raises(ValueError):
+        MockStep(config=basic_config)
+
+
+class OffsetConsumer(GenericConsumer):
+    """Consumes 3 batches of 4 messages from one partition with 3 objects."""
+
+    def consume(self):
+        self.committed = []
+        for batch in range(3):
+            offsets = range(batch * 4, batch * 4 + 4)
+            self.offsets = [(("topic", 0), offset) for offset in offsets]
+            yield [{"oid": f"OID{offset % 3}", "offset": offset} for offset in offsets]
+
+    def consumed_offsets(self):
+        return self.offsets
+
+    def commit_offsets(self, offsets):
+        self.committed.append(offsets[("topic", 0)])
+
+
+class SlowFirstObjectStep(GenericStep):
+    def execute(self, messages):
+        if messages[0]["oid"] == "OID0":
+            time.sleep(0.02)
+        return messages
+
+    def produce(self, result):
+        self.produced.extend(result)
+
+
+def test_concurrent_execution(basic_config, mocker):
+    mocker.patch.object(SlowFirstObjectStep, "_write_success")
+    basic_config["CONSUMER_CONFIG"].pop("CLASS")
+    basic_config["CONCURRENCY"] = {"WORKERS": 3, "KEY_FIELD": "oid"}
+    step = SlowFirstObjectStep(consumer=OffsetConsumer, config=basic_config)
+    step.produced = []
+    step.start()
+    offsets = [message["offset"] for message in step.produced]
+    assert sorted(offsets) == list(range(12))
+    for oid in ["OID0", "OID1", "OID2"]:
+        oid_offsets = [m["offset"] for m in step.produced if m["oid"] == oid]
+        assert oid_offsets == sorted(oid_offsets)
+    committed = step.consumer.committed
+    assert committed == sorted(committed)
+    assert committed[-1] == 12
+
+
+def test_concurrent_execution_needs_key(basic_config, mocker):
+    mocker.patch.object(MockStep, "_write_success")
+    basic_config["CONSUMER_CONFIG"].pop("CLASS")
+    basic_config["CONCURRENCY"] = {"WORKERS": 2}
+    step = MockStep(consumer=OffsetConsumer, config=basic_config)
+    with pytest.raises(ValueError):
+        step.start()
+
+
+class BatchConsumer(GenericConsumer):
+    """Consumes 3 batches of 4 messages without offsets."""
+
+    def consume(self):
+        self.commits = 0
+        for batch in range(3):
+            yield [{"oid": f"OID{i % 3}", "offset": batch * 4 + i} for i in range(4)]
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_concurrent_execution_without_offsets(basic_config, mocker):
+    mocker.patch.object(SlowFirstObjectStep, "_write_success")
+    basic_config["CONSUMER_CONFIG"].pop("CLASS")
+    basic_config["CONCURRENCY"] = {"WORKERS": 3, "KEY_FIELD": "oid"}
+    step = SlowFirstObjectStep(consumer=BatchConsumer, config=basic_config)
+    step.produced = []
+    commit_offsets = mocker.patch.object(step.consumer, "commit_offsets")
+    step.start()
+    assert len(step.produced) == 12
+    commit_offsets.assert_not_called()
+    assert step.consumer.commits >= 1
+
+
+def test_concurrent_execution_rejects_arrow(basic_config):
+    basic_config["CONSUMER_CONFIG"]["BATCH_FORMAT"] = "arrow"
+    basic_config["CONCURRENCY"] = {"WORKERS": 2, "KEY_FIELD": "oid"}
+    with pytest.raises(ValueError, match="arrow"):
+        MockStep(config=basic_config)
+
+
+class DuplicatedConsumer(GenericConsumer):
+    """Consumes a batch, the same batch replayed and a batch with one new candid."""
+
+    def consume(self):
+        yield [{"candid": 1}, {"candid": 2}, {"candid": 2}]
+        yield [{"candid": 1}, {"candid": 2}]
+        yield [{"candid": 2}, {"candid": 3}]
+
+
+class RecordingStep(GenericStep):
+    def execute(self, messages):
+        self.executed.append([message["candid"] for message in messages])
+        return messages
+
+
+def test_deduplication(basic_config, mocker):
+    mocker.patch.object(RecordingStep, "_write_success")
+    basic_config["CONSUMER_CONFIG"].pop("CLASS")
+    basic_config["DEDUPLICATION"] = {"BACKEND": "lru", "CAPACITY": 10}
+    step = RecordingStep(consumer=DuplicatedConsumer, config=basic_config)
+    step.executed = []
+    commit = mocker.patch.object(step.consumer, "commit")
+    step.start()
+    assert step.executed == [[1, 2], [3]]
+    assert commit.call_count == 3
+    assert step.metrics["suppressed_messages"] == 3
+    assert step.prometheus_metrics.suppressed_messages.inc.call_count == 3
+
+
+def test_deduplication_bad_backend(basic_config):
+    basic_config["DEDUPLICATION"] = {"BACKEND": "other"}
+    with pytest.raises(ValueError):
+        MockStep(config=basic_config)
@@ -0,0 +1,233 @@
+from apf.core.step import GenericStep
+from confluent_kafka import KafkaException, TopicPartition
+import fastavro
+import io
+import json
+import pytest
+
+
+class Broker:
+    """In-memory stand-in of a Kafka broker with transactions."""
+
+    def __init__(self):
+        self.topics = {}
+        self.committed = {}
+
+    def append(self, topic, value):
+        self.topics.setdefault(topic, []).append(value)
+
+
+class FakeError:
+    def name(self):
+        return "_PARTITION_EOF"
+
+
+class FakeMessage:
+    def __init__(self, topic, offset, value=None, eof=False):
+        self._topic = topic
+        self._offset = offset
+        self._value = value
+        self.eof = eof
+
+    def error(self):
+        return FakeError() if self.eof else None
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def timestamp(self):
+        return (1, 0)
+
+
+class FakeConsumer:
+    def __init__(self, broker, config):
+        self.broker = broker
+        self.group = config["group.id"]
+        self.topics = []
+        self.commits = 0
+
+    def subscribe(self, topics, **kwargs):
+        self.topics = topics
+        self.position = self.broker.committed.get((self.group, topics[0], 0), 0)
+
+    def consume(self, num_messages=1, timeout=1):
+        topic = self.topics[0]
+        records = self.broker.topics.get(topic, [])[self.position :]
+        if not records:
+            return [FakeMessage(topic, self.position, eof=True)]
+        records = records[:num_messages]
+        messages = [
+            FakeMessage(topic, self.position + i, value)
+            for i, value in enumerate(records)
+        ]
+        self.position += len(messages)
+        return messages
+
+    def assignment(self):
+        return [TopicPartition(self.topics[0], 0)]
+
+    def consumer_group_metadata(self):
+        return self.group
+
+    def commit(self, *args, **kwargs):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+class FakeProducer:
+    def __init__(self, broker, config):
+        self.broker = broker
+        self.transaction = None
+        self.initialized = False
+
+    def init_transactions(self, timeout):
+        self.initialized = True
+
+    def begin_transaction(self):
+        assert self.initialized and self.transaction is None
+        self.transaction = {"messages": [], "offsets": []}
+
+    def produce(self, topic, value=None, key=None, on_delivery=None, **kwargs):
+        assert self.transaction is not None, "produce outside a transaction"
+        self.transaction["messages"].append((topic, value, on_delivery))
+
+    def poll(self, timeout=0):
+        return 0
+
+    def flush(self, timeout=None):
+        return 0
+
+    def send_offsets_to_transaction(self, offsets, group_metadata, timeout):
+        self.transaction["offsets"] = [(group_metadata, tp) for tp in offsets]
+
+    def commit_transaction(self, timeout):
+        for topic, value, on_delivery in self.transaction["messages"]:
+            self.broker.append(topic, value)
+            on_delivery(None, None)
+        for group, tp in self.transaction["offsets"]:
+            self.broker.committed[(group, tp.topic, tp.partition)] = tp.offset
+        self.transaction = None
+
+    def abort_transaction(self, timeout):
+        for _, _, on_delivery in self.transaction["messages"]:
+            on_delivery("aborted", None)
+        self.transaction = None
+
+
+SCHEMA = {
+    "type": "record",
+    "name": "output",
+    "fields": [{"name": "value", "type": "int"}],
+}
+
+
+class DoubleStep(GenericStep):
+    def execute(self, messages):
+        return [{"value": message["value"] * 2} for message in messages]
+
+
+@pytest.fixture
+def broker(mocker):
+    broker = Broker()
+    mocker.patch(
+        "apf.consumers.kafka.Consumer",
+        side_effect=lambda config: FakeConsumer(broker, config),
+    )
+    mocker.patch(
+        "apf.producers.kafka.Producer",
+        side_effect=lambda config: FakeProducer(broker, config),
+    )
+    for value in range(5):
+        broker.append("input", json.dumps({"value": value}))
+    return broker
+
+
+@pytest.fixture
+def config():
+    return {
+        "CONSUMER_CONFIG": {
+            "CLASS": "apf.consumers.KafkaJsonConsumer",
+            "TOPICS": ["input"],
+            "PARAMS": {"bootstrap.servers": "broker", "group.id": "step"},
+            "NUM_MESSAGES": 2,
+        },
+        "PRODUCER_CONFIG": {
+            "CLASS": "apf.producers.KafkaProducer",
+            "TOPIC": "output",
+            "SCHEMA": SCHEMA,
+            "PARAMS": {"bootstrap.servers": "broker", "transactional.id": "step-0"},
+            "EXACTLY_ONCE": True,
+        },
+    }
+
+
+def read_output(broker):
+    return [
+        next(iter(fastavro.reader(io.BytesIO(value))))["value"]
+        for value in broker.topics.get("output", [])
+    ]
+
+
+def test_requires_transactional_id(broker, config, mocker):
+    mocker.patch.object(DoubleStep, "_write_success")
+    config["PRODUCER_CONFIG"]["PARAMS"].pop("transactional.id")
+    with pytest.raises(Exception):
+        DoubleStep(config=config)
+
+
+def test_offsets_are_committed_in_transaction(broker, config, mocker):
+    mocker.patch.object(DoubleStep, "_write_success")
+    step = DoubleStep(config=config)
+    step.start()
+    assert read_output(broker) == [0, 2, 4, 6, 8]
+    assert broker.committed[("step", "input", 0)] == 5
+    assert step.consumer.consumer.commits == 0
+
+
+def test_failed_batch_is_not_committed(broker, config, mocker):
+    mocker.patch.object(DoubleStep, "_write_success")
+    calls = {"n": 0}
+
+    def fail_second_batch(self, messages):
+        calls["n"] += 1
+        result = [{"value": message["value"] * 2} for message in messages]
+        if calls["n"] == 2:
+            result[-1] = {"value": "not an int"}
+        return result
+
+    mocker.patch.object(DoubleStep, "execute", fail_second_batch)
+    step = DoubleStep(config=config)
+    with pytest.raises(Exception):
+        step.start()
+    step.producer.abort_transaction()
+    assert read_output(broker) == [0, 2]
+    assert broker.committed[("step", "input", 0)] == 2
+
+    calls["n"] = 10
+    restarted = DoubleStep(config=config)
+    restarted.start()
+    assert read_output(broker) == [0, 2, 4, 6, 8]
+    assert broker.committed[("step", "input", 0)] == 5
+
+
+def test_transaction_error_aborts(broker, config, mocker):
+    mocker.patch.object(DoubleStep, "_write_success")
+    mocker.patch.object(
+        FakeProducer, "commit_transaction", side_effect=KafkaException("fenced")
+    )
+    step = DoubleStep(config=config)
+    with pytest.raises(KafkaException):
+        step.start()
+    assert not step.producer.in_transaction
+    assert "output" not in broker.topics
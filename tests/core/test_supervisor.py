@@ -0,0 +1,71 @@
+from apf.core.step import GenericStep
+from apf.core.supervisor import StepSupervisor
+import os
+import pytest
+
+
+class CountingStep(GenericStep):
+    """Writes a line for each execution and crashes while the file has fewer than 2 lines."""
+
+    def execute(self, messages):
+        path = self.config["OUTPUT"]
+        with open(path, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        with open(path) as f:
+            if len(f.readlines()) < self.config.get("CRASHES", 0) + 1:
+                raise RuntimeError("crash")
+        return {}
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {
+        "CONSUMER_CONFIG": {"CLASS": "apf.core.step.DefaultConsumer"},
+        "OUTPUT": str(tmp_path / "executions"),
+    }
+
+
+@pytest.fixture(autouse=True)
+def no_success_file(mocker):
+    mocker.patch.object(CountingStep, "_write_success")
+
+
+def executions(config):
+    with open(config["OUTPUT"]) as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def test_runs_every_worker(config):
+    supervisor = StepSupervisor(CountingStep, config, workers=3)
+    assert supervisor.run(poll_interval=0.05) == 0
+    pids = executions(config)
+    assert len(pids) == 3
+    assert len(set(pids)) == 3
+    assert os.getpid() not in pids
+
+
+def test_restarts_crashed_workers(config):
+    config["CRASHES"] = 2
+    supervisor = StepSupervisor(CountingStep, config, workers=1, restart_delay=0)
+    assert supervisor.run(poll_interval=0.05) == 2
+    assert len(executions(config)) == 3
+
+
+def test_needs_workers(config):
+    with pytest.raises(ValueError):
+        StepSupervisor(CountingStep, config, workers=0)
+
+
+class ShardStep(GenericStep):
+    def execute(self, messages):
+        with open(self.config["OUTPUT"], "a") as f:
+            f.write(f"{os.environ['APF_WORKER_INDEX']}/{os.environ['APF_WORKER_COUNT']}\n")
+        return {}
+
+
+def test_worker_shard_environment(config, mocker):
+    mocker.patch.object(ShardStep, "_write_success")
+    supervisor = StepSupervisor(ShardStep, config, workers=2)
+    supervisor.run(poll_interval=0.05)
+    with open(config["OUTPUT"]) as f:
+        assert sorted(f.read().split()) == ["0/2", "1/2"]
@@ -0,0 +1,87 @@
+from apf.core.topic_management import DailyTopicStrategy, GenericTopicStrategy
+import datetime
+import pytest
+
+
+class FrozenClock:
+    def __init__(self, now):
+        self.now = now
+
+    def utcnow(self):
+        return self.now
+
+    def time(self):
+        return self.now.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+@pytest.fixture
+def clock(mocker):
+    clock = FrozenClock(datetime.datetime(2023, 1, 10, 12, 0))
+    datetime_mock = mocker.patch("apf.core.topic_management.datetime")
+    datetime_mock.datetime.utcnow.side_effect = clock.utcnow
+    datetime_mock.datetime.combine = datetime.datetime.combine
+    datetime_mock.time = datetime.time
+    datetime_mock.timedelta = datetime.timedelta
+    datetime_mock.timezone = datetime.timezone
+    mocker.patch("apf.core.topic_management.time.time", side_effect=clock.time)
+    return clock
+
+
+def test_topics_before_change_hour(clock):
+    strategy = DailyTopicStrategy("topic_%s", "%Y%m%d", change_hour=22)
+    assert strategy.get_topics() == ("topic_20230110",)
+
+
+def test_topics_change_at_change_hour(clock):
+    strategy = DailyTopicStrategy("topic_%s", "%Y%m%d", change_hour=22)
+    version = strategy.version
+    clock.now = datetime.datetime(2023, 1, 10, 21, 59)
+    assert not strategy.has_changed(version)
+    clock.now = datetime.datetime(2023, 1, 10, 22, 0)
+    assert strategy.has_changed(version)
+    assert strategy.get_topics() == ("topic_20230110", "topic_20230111")
+    version = strategy.version
+    clock.now = datetime.datetime(2023, 1, 11, 3, 0)
+    assert not strategy.has_changed(version)
+
+
+def test_cached_topics_between_changes(clock):
+    strategy = DailyTopicStrategy("topic_%s", "%Y%m%d", change_hour=22)
+    assert strategy.get_topics() is strategy.get_topics()
+
+
+def test_retention_days(clock):
+    strategy = DailyTopicStrategy(
+        ["a_%s", "b_%s"], "%Y%m%d", change_hour=22, retention_days=2
+    )
+    clock.now = datetime.datetime(2023, 1, 15, 23, 0)
+    assert strategy.get_topics() == (
+        "a_20230115",
+        "b_20230115",
+        "a_20230116",
+        "b_20230116",
+    )
+
+
+def test_change_hour_out_of_day(clock):
+    strategy = DailyTopicStrategy("topic_%s", "%Y%m%d", change_hour=24)
+    clock.now = datetime.datetime(2023, 1, 10, 23, 59)
+    assert strategy.get_topics() == ("topic_20230110",)
+    clock.now = datetime.datetime(2023, 1, 11, 0, 0)
+    assert strategy.get_topics() == ("topic_20230110", "topic_20230111")
+
+
+def test_generic_has_changed():
+    class Strategy(GenericTopicStrategy):
+        topics = ["a"]
+
+        def get_topics(self):
+            return self.topics
+
+    strategy = Strategy()
+    assert strategy.get_topics() == ["a"]
+    version = strategy.version
+    assert version == 0
+    assert not strategy.has_changed(version)
+    strategy.topics = ["a", "b"]
+    assert strategy.has_changed(version)
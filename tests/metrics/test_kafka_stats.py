@@ -0,0 +1,95 @@
+import json
+import unittest
+from unittest import mock
+
+from prometheus_client import CollectorRegistry
+
+from apf.metrics.prometheus.kafka_stats import KafkaStatsBridge, enable_statistics
+
+STATS = {
+    "name": "rdkafka#producer-1",
+    "type": "producer",
+    "replyq": 3,
+    "msg_cnt": 120,
+    "msg_size": 48000,
+    "brokers": {
+        "kafka:9092/1": {
+            "outbuf_cnt": 2,
+            "waitresp_cnt": 1,
+            "rtt": {"cnt": 10, "avg": 2500, "p99": 9000},
+            "throttle": {"cnt": 0, "avg": 0, "max": 0},
+        }
+    },
+    "topics": {
+        "alerts": {
+            "batchsize": {"cnt": 4, "avg": 65536},
+            "partitions": {
+                "0": {"consumer_lag": -1, "fetchq_cnt": 0, "msgq_cnt": 7},
+                "-1": {"consumer_lag": -1, "fetchq_cnt": 0, "msgq_cnt": 0},
+            },
+        }
+    },
+}
+
+
+class KafkaStatsBridgeTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        self.bridge = KafkaStatsBridge(registry=self.registry)
+
+    def value(self, name, **labels):
+        return self.registry.get_sample_value(name, labels)
+
+    def test_update(self):
+        self.bridge.callback("producer")(json.dumps(STATS))
+        client = {"client": "rdkafka#producer-1", "role": "producer"}
+        broker = {**client, "broker": "kafka:9092/1"}
+        partition = {**client, "topic": "alerts", "partition": "0"}
+        self.assertEqual(self.value("kafka_client_queue_messages", **client), 120)
+        self.assertEqual(self.value("kafka_client_reply_queue", **client), 3)
+        self.assertEqual(
+            self.value("kafka_broker_rtt_seconds", **broker, stat="avg"), 0.0025
+        )
+        self.assertEqual(self.value("kafka_broker_outbuf_requests", **broker), 2)
+        self.assertIsNone(
+            self.value("kafka_broker_throttle_seconds", **broker, stat="avg")
+        )
+        self.assertEqual(
+            self.value("kafka_topic_batch_size_bytes_count", **client, topic="alerts"),
+            1,
+        )
+        self.assertEqual(
+            self.value("kafka_partition_message_queue_messages", **partition), 7
+        )
+        self.assertIsNone(self.value("kafka_partition_consumer_lag", **partition))
+        self.assertIsNone(
+            self.value(
+                "kafka_partition_message_queue_messages",
+                **{**partition, "partition": "-1"},
+            )
+        )
+
+    def test_invalid_stats(self):
+        self.bridge.update("consumer", "not json")
+        self.assertIsNone(
+            self.value(
+                "kafka_client_reply_queue", client="rdkafka#producer-1", role="consumer"
+            )
+        )
+
+
+class EnableStatisticsTest(unittest.TestCase):
+    def test_disabled(self):
+        config = {"PARAMS": {}}
+        enable_statistics(config, "consumer")
+        self.assertEqual(config["PARAMS"], {})
+
+    @mock.patch("apf.metrics.prometheus.kafka_stats.get_stats_bridge")
+    def test_enabled(self, get_stats_bridge):
+        config = {"PARAMS": {}, "STATISTICS": {"INTERVAL": 5}}
+        enable_statistics(config, "consumer")
+        self.assertEqual(config["PARAMS"]["statistics.interval.ms"], 5000)
+        get_stats_bridge().callback.assert_called_with("consumer")
+        self.assertEqual(
+            config["PARAMS"]["stats_cb"], get_stats_bridge().callback.return_value
+        )
@@ -0,0 +1,57 @@
+from apf.consumers.avro_decoder import AvroContainerDecoder, read_long
+from apf.producers.avro_encoder import AvroBatchEncoder, encode_long
+import fastavro
+import io
+import unittest
+
+SCHEMA = {
+    "type": "record",
+    "name": "alert",
+    "fields": [
+        {"name": "oid", "type": "string"},
+        {"name": "candid", "type": "long"},
+    ],
+}
+
+
+class AvroBatchEncoderTest(unittest.TestCase):
+    def test_encode_long(self):
+        for value in [0, 1, -1, 63, 64, -65, 2**40]:
+            encoded = encode_long(value)
+            self.assertEqual(read_long(encoded, 0), (value, len(encoded)))
+
+    def test_container_mode(self):
+        encoder = AvroBatchEncoder(SCHEMA)
+        messages = [{"oid": "a" * 300, "candid": 1}, {"oid": "b", "candid": 2}]
+        values = encoder.encode_batch(messages)
+        for value, message in zip(values, messages):
+            self.assertEqual(list(fastavro.reader(io.BytesIO(value))), [message])
+        decoder = AvroContainerDecoder()
+        self.assertEqual([decoder.decode(value) for value in values], messages)
+        self.assertEqual(decoder.stats["schema_cache_misses"], 1)
+
+    def test_compact_mode(self):
+        encoder = AvroBatchEncoder(SCHEMA, mode="compact")
+        value = encoder.encode({"oid": "a", "candid": 1})
+        record = fastavro.schemaless_reader(io.BytesIO(value), SCHEMA)
+        self.assertEqual(record, {"oid": "a", "candid": 1})
+
+    def test_validation(self):
+        extra = {"oid": "a", "candid": 1, "extra": 0}
+        with self.assertRaises(ValueError):
+            AvroBatchEncoder(SCHEMA, validation="always").encode(extra)
+        AvroBatchEncoder(SCHEMA, validation="off").encode(extra)
+        sampled = AvroBatchEncoder(SCHEMA, validation="sampled", sample_rate=0.5)
+        with self.assertRaises(ValueError):
+            sampled.encode_batch([extra, extra])
+        sampled = AvroBatchEncoder(SCHEMA, validation="sampled", sample_rate=0.5)
+        sampled.encode({"oid": "a", "candid": 1})
+        sampled.encode(extra)
+
+    def test_bad_options(self):
+        with self.assertRaises(ValueError):
+            AvroBatchEncoder(SCHEMA, mode="other")
+        with self.assertRaises(ValueError):
+            AvroBatchEncoder(SCHEMA, validation="other")
+        with self.assertRaises(ValueError):
+            AvroBatchEncoder(SCHEMA, validation="sampled", sample_rate=0)
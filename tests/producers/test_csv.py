@@ -16,6 +16,12 @@ class CSVProducerTest(GenericProducerTest):
     def test_produce(self):
         super().test_produce(self.component)
 
+    def test_produce_batch(self):
+        messages = [{"key": "a", "int": 1}, {"key": "b", "int": 2}]
+        self.assertEqual(self.component.produce_batch(messages), 2)
+        with open(self.file_path) as f:
+            self.assertEqual(f.read().split(), ["a,1", "b,2"])
+
     def tearDown(self):
         self.assertTrue(os.path.exists(self.file_path))
         os.remove(self.file_path)
@@ -1,5 +1,6 @@
 from .test_core import GenericProducerTest
 from apf.producers import JSONProducer
+import json
 import os
 import pathlib
 
@@ -17,5 +18,14 @@ class JSONProducerTest(GenericProducerTest):
         self.path = pathlib.Path(EXAMPLES_PATH) / "producer_output0.json"
         self.assertTrue(self.path.exists())
 
+    def test_produce_batch(self):
+        self.component.buffer_size = 2
+        messages = [{"key": "a", "int": 1}, {"key": "b", "int": 2}, {"key": "c"}]
+        self.assertEqual(self.component.produce_batch(messages), 3)
+        self.path = pathlib.Path(EXAMPLES_PATH) / "producer_output0.json"
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), messages[:2])
+        self.assertEqual(len(self.component.buffer), 1)
+
     def tearDown(self):
         os.remove(self.path)
@@ -1,7 +1,12 @@
 from .test_core import GenericProducerTest
-from apf.producers import KafkaProducer, KafkaSchemalessProducer
+from apf.producers import (
+    KafkaProducer,
+    KafkaRegistryProducer,
+    KafkaSchemalessProducer,
+)
 from unittest import mock
 import datetime
+import io
 
 import fastavro
 
@@ -43,6 +48,124 @@ class KafkaProducerTest(GenericProducerTest):
         super().test_produce(use=self.component)
         assert producer_mock().produce.call_args[1]["key"] == None
 
+    def test_delivery_tracking(self, producer_mock):
+        producer_mock.reset_mock()
+        self.component = KafkaProducer(self.params)
+        self.component.produce({"key": "a", "int": 1})
+        first = self.component.end_batch()
+        self.component.produce({"key": "b", "int": 2})
+        second = self.component.end_batch()
+        callbacks = [
+            call[1]["on_delivery"] for call in producer_mock().produce.call_args_list
+        ]
+        self.assertFalse(self.component.is_delivered(first))
+        callbacks[1](None, None)
+        self.assertFalse(self.component.is_delivered(second))
+        callbacks[0](None, None)
+        self.assertTrue(self.component.is_delivered(first))
+        self.assertTrue(self.component.is_delivered(second))
+
+    def test_failed_delivery(self, producer_mock):
+        producer_mock.reset_mock()
+        self.component = KafkaProducer(self.params)
+        user_callback = mock.MagicMock()
+        self.component.produce({"key": "a", "int": 1}, on_delivery=user_callback)
+        batch = self.component.end_batch()
+        producer_mock().produce.call_args[1]["on_delivery"]("error", None)
+        user_callback.assert_called_once_with("error", None)
+        with self.assertRaises(Exception):
+            self.component.is_delivered(batch)
+
+    def test_queue_full_waits_for_deliveries(self, producer_mock):
+        producer_mock.reset_mock()
+        self.component = KafkaProducer(self.params)
+        producer_mock().produce.side_effect = [BufferError("full"), None]
+        self.component.produce({"key": "test", "int": 1})
+        self.assertEqual(producer_mock().produce.call_count, 2)
+        producer_mock().flush.assert_not_called()
+        producer_mock().poll.assert_any_call(0.1)
+
+    def test_queue_full_timeout(self, producer_mock):
+        producer_mock.reset_mock()
+        self.params["QUEUE_FULL_TIMEOUT"] = 0.2
+        self.component = KafkaProducer(self.params)
+        producer_mock().produce.side_effect = BufferError("full")
+        with self.assertRaises(BufferError):
+            self.component.produce({"key": "test", "int": 1})
+        self.assertEqual(self.component.in_flight, 0)
+
+    def test_delivery_served_during_produce(self, producer_mock):
+        producer_mock.reset_mock()
+        self.component = KafkaProducer(self.params)
+
+        def deliver(*args, **kwargs):
+            kwargs["on_delivery"](None, mock.MagicMock())
+
+        producer_mock().produce.side_effect = deliver
+        self.component.produce({"key": "test", "int": 1})
+        batch = self.component.end_batch()
+        self.assertTrue(self.component.is_delivered(batch))
+        self.assertEqual(self.component.get_metrics()["messages_delivered"], 1)
+
+    def test_delivery_counters(self, producer_mock):
+        producer_mock.reset_mock()
+        self.component = KafkaProducer(self.params)
+        self.component.produce({"key": "test", "int": 1})
+        self.component.produce({"key": "test", "int": 2})
+        batch = self.component.end_batch()
+        self.assertEqual(self.component.get_metrics()["messages_in_flight"], 2)
+        self.assertFalse(self.component.wait_delivered(batch, 0.05))
+        callbacks = [c[1]["on_delivery"] for c in producer_mock().produce.call_args_list]
+        callbacks[0](None, mock.MagicMock())
+        callbacks[1]("error", mock.MagicMock())
+        self.assertEqual(
+            self.component.get_metrics(),
+            {"messages_in_flight": 0, "messages_delivered": 1, "messages_failed": 1},
+        )
+        with self.assertRaises(Exception):
+            self.component.wait_delivered(batch, 0.05)
+
+    def test_queue_length(self, producer_mock):
+        producer_mock.reset_mock()
+        self.component = KafkaProducer(self.params)
+        producer_mock().__len__.return_value = 7
+        self.assertEqual(self.component.queue_length, 7)
+        self.component.poll(0.5)
+        producer_mock().poll.assert_called_with(0.5)
+
+    def test_container_encoding(self, _):
+        self.component = KafkaProducer(self.params)
+        message = {"key": "test", "int": 1, "extra": True}
+        values = [self.component._serialize_message(message) for _ in range(2)]
+        self.assertEqual(values[0], values[1])
+        records = list(fastavro.reader(io.BytesIO(values[0])))
+        self.assertEqual(records, [{"key": "test", "int": 1}])
+
+    def test_compact_encoding(self, _):
+        self.params["ENCODING"] = "compact"
+        self.params["VALIDATION"] = "always"
+        self.component = KafkaProducer(self.params)
+        value = self.component._serialize_message({"key": "test", "int": 0})
+        self.assertEqual(value, b"\x08test\x00")
+        with self.assertRaises(ValueError):
+            self.component._serialize_message({"key": "test", "int": 0, "extra": 1})
+
+    def test_produce_batch(self, producer_mock):
+        producer_mock.reset_mock()
+        self.params["TOPIC"] = ["topic_a", "topic_b"]
+        self.component = KafkaProducer(self.params)
+        self.component.set_key_field("key")
+        messages = [{"key": "a", "int": 1}, {"key": "b", "int": 2}]
+        self.assertEqual(self.component.produce_batch(messages), 2)
+        calls = producer_mock().produce.call_args_list
+        self.assertEqual(
+            [(c[0][0], c[1]["key"]) for c in calls],
+            [("topic_a", "a"), ("topic_a", "b"), ("topic_b", "a"), ("topic_b", "b")],
+        )
+        producer_mock().poll.assert_called_once_with(0)
+        value = calls[1][1]["value"]
+        self.assertEqual(list(fastavro.reader(io.BytesIO(value))), [messages[1]])
+
     def test_topic_strategy(self, _):
         import copy
 
@@ -65,10 +188,12 @@ class KafkaProducerTest(GenericProducerTest):
         params.pop("TOPIC")
         self.component = KafkaProducer(params)
         topic_before = self.component.topic
-        self.assertEqual(len(topic_before), 2)
+        self.assertEqual(len(topic_before), 1)
         self.component.produce({"key": "value", "int": 1})
         self.assertEqual(len(self.component.topic), 1)
-        self.assertEqual(self.component.topic[0], topic_before[1])
+        self.assertEqual(self.component.topic, topic_before)
+        tomorrow = now + datetime.timedelta(days=1)
+        self.assertEqual(topic_before[0], "apf_test_" + tomorrow.strftime(date_format))
         params["TOPIC_STRATEGY"]["PARAMS"]["retention_days"] = 2
         self.component = KafkaProducer(params)
         topic_before = self.component.topic
@@ -115,3 +240,53 @@ class TestKafkaSchemalessProducer(GenericProducerTest):
         with self.assertRaises(Exception):
             message = {"key": "test", "int" : 'not an int'}
             producer._serialize_message(message)
+
+
+
+@mock.patch("apf.producers.kafka.Producer")
+class TestKafkaRegistryProducer(GenericProducerTest):
+    def setUp(self) -> None:
+        self.params = {
+            "PARAMS": {"bootstrap.servers": "kafka1:9092, kafka2:9092"},
+            "TOPIC": "test_topic",
+            "SCHEMA": {
+                "namespace": "test.avro",
+                "type": "record",
+                "name": "test",
+                "fields": [
+                    {"name": "key", "type": "string"},
+                    {"name": "int", "type": "int"},
+                ],
+            },
+            "SCHEMA_REGISTRY": {
+                "CLASS": "apf.core.schema_registry.MemorySchemaRegistry",
+                "PARAMS": {},
+            },
+        }
+
+    def test_no_registry(self, _):
+        self.params.pop("SCHEMA_REGISTRY")
+        with self.assertRaises(Exception):
+            KafkaRegistryProducer(self.params)
+
+    def test_registers_schema(self, _):
+        producer = KafkaRegistryProducer(self.params)
+        self.assertEqual(producer.registry.subjects, {"test.avro.test": [1]})
+        self.assertEqual(producer.registry.get_schema(1), self.params["SCHEMA"])
+        self.params["SUBJECT"] = "test_topic-value"
+        producer = KafkaRegistryProducer(self.params)
+        self.assertIn("test_topic-value", producer.registry.subjects)
+
+    def test_serialize_message(self, _):
+        producer = KafkaRegistryProducer(self.params)
+        out = producer._serialize_message({"key": "test", "int": 0})
+        self.assertEqual(out, b"\x00\x00\x00\x00\x01\x08test\x00")
+        container = KafkaProducer(self.params)._serialize_message(
+            {"key": "test", "int": 0}
+        )
+        self.assertLess(len(out), len(container))
+
+    def test_produce(self, producer_mock):
+        self.component = KafkaRegistryProducer(self.params)
+        super().test_produce(use=self.component)
+        producer_mock().produce.assert_called()